@@ -0,0 +1,151 @@
+"""
+Compare sequential and parallel command construction
+
+Builds a synthetic run folder with a sample sheet and empty fastq files in a
+temporary directory and times dry run construction with different worker
+counts. Filesystem latency of a network share can be simulated with --latency.
+
+    python benchmarks/construct_bench.py --samples 200 --latency 0.002
+"""
+import argparse
+import contextlib
+import gzip
+import io
+import os
+from pathlib import Path
+import shutil
+import sys
+import tempfile
+import time
+from typing import Iterator, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from main import HandleFlow  # noqa: E402
+
+RUN_NAME = "210317_A00464_0300_BHW7FTDMXX"
+COLUMNS = [
+    "Lane",
+    "Sample_Project",
+    "Sample_ID",
+    "Sample_Name",
+    "Index",
+    "RefGenome",
+    "TargetRegions",
+    "AdapterTrim",
+    "pipeline",
+    "pipeline_parameters",
+    "override",
+    "Is_this_tumor",
+    "matching_normal_sample",
+]
+
+
+def sheet_rows(samples: int) -> List[List[str]]:
+    # every third sample is a tumor paired with the previous normal
+    rows = []
+    for i in range(samples):
+        if i % 3 == 2:
+            tumor, normal = "1", f"S{i - 1}"
+        else:
+            tumor, normal = "0", ""
+        rows.append(
+            ["1", "bench", f"S{i}", f"S{i}", "A", "GRCh38", "", "truseq"]
+            + ["dragen", "genome", "", tumor, normal]
+        )
+    return rows
+
+
+def make_run(root: Path, samples: int) -> Path:
+    # without RunInfo.xml flow cell comes from the run folder name, keep it
+    run_dir = root / "runs" / RUN_NAME
+    (run_dir / "bench").mkdir(parents=True)
+    rows = sheet_rows(samples)
+    sheet = run_dir / "sheet.csv"
+    with open(sheet, "w") as fs:
+        fs.write("[Header],\nDate,1.1.2021\n[Data],\n")
+        fs.write(",".join(COLUMNS) + "\n")
+        for row in rows:
+            fs.write(",".join(row) + "\n")
+    data = gzip.compress(b"@r\nACGT\n+\nFFFF\n", mtime=0)
+    for index, row in enumerate(rows, 1):
+        for read_n in (1, 2):
+            name = f"{row[3]}_S{index}_L00{row[0]}_R{read_n}_001.fastq.gz"
+            (run_dir / "bench" / name).write_bytes(data)
+    return sheet
+
+
+@contextlib.contextmanager
+def slow_fs(latency: float) -> Iterator[None]:
+    # add latency to metadata calls and moves as seen on a network share
+    patched = [
+        (os.path, "exists"),
+        (os.path, "isfile"),
+        (os.path, "isdir"),
+        (os, "makedirs"),
+        (os, "mkdir"),
+        (os, "scandir"),
+        (shutil, "move"),
+        (Path, "exists"),
+    ]
+    originals = [(owner, name, getattr(owner, name)) for owner, name in patched]
+
+    def delayed(func):
+        def wrapper(*args, **kwargs):
+            time.sleep(latency)
+            return func(*args, **kwargs)
+
+        return wrapper
+
+    if latency > 0:
+        for owner, name, func in originals:
+            setattr(owner, name, delayed(func))
+    try:
+        yield
+    finally:
+        for owner, name, func in originals:
+            setattr(owner, name, func)
+
+
+def construct(
+    samples: int, workers: int, latency: float
+) -> Tuple[float, List[str]]:
+    with tempfile.TemporaryDirectory() as tmp:
+        sheet = make_run(Path(tmp), samples)
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            out = io.StringIO()
+            with slow_fs(latency), contextlib.redirect_stdout(out):
+                start = time.perf_counter()
+                HandleFlow().execute_bash(
+                    str(sheet.relative_to(tmp)), dry_run=True, workers=workers
+                )
+                elapsed = time.perf_counter() - start
+        finally:
+            os.chdir(cwd)
+    # temporary dir differs per run
+    return elapsed, out.getvalue().replace(tmp, "<tmp>").splitlines()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--samples", type=int, default=120)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8, 16])
+    args = parser.parse_args()
+    base_time, base_out = None, None
+    print(f"samples={args.samples} latency={args.latency}s")
+    for workers in args.workers:
+        elapsed, out = construct(args.samples, workers, args.latency)
+        if base_time is None:
+            base_time, base_out = elapsed, out
+        same = "same" if out == base_out else "DIFFERENT"
+        print(
+            f"workers={workers:3d} {elapsed:8.3f}s "
+            f"speedup={base_time / elapsed:5.2f}x output={same}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Time planning and submission of full sheets against a mock srun.py
+
+A stand-in srun.py is put first on PATH. It sleeps for the simulated
+submission latency, fails with a temporary error code at the given rate and
+otherwise prints a job id like sbatch does. Each mode runs a fresh synthetic
+run folder through HandleFlow.iter_bash and reports commands per second,
+submission latency percentiles, peak python memory and job ids found.
+
+    python benchmarks/submit_bench.py --samples 200 --latency 0.05
+    python benchmarks/submit_bench.py --fail-rate 0.1 --retries 3 --workers 1 8
+"""
+import argparse
+import contextlib
+import io
+import os
+from pathlib import Path
+import stat
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, Iterator, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from construct_bench import make_run  # noqa: E402
+from main import HandleFlow  # noqa: E402
+from src.utility.executors import SrunExecutor  # noqa: E402
+from src.utility.flow import JobResult  # noqa: E402
+from src.utility.job_monitor import parse_job_id  # noqa: E402
+
+MOCK_SRUN = """#!{python}
+import fcntl, os, random, sys, time
+
+time.sleep(float(os.environ.get("MOCK_SRUN_LATENCY", "0")))
+if random.random() < float(os.environ.get("MOCK_SRUN_FAIL_RATE", "0")):
+    print("srun: error: slurm temporarily unavailable", file=sys.stderr)
+    sys.exit(int(os.environ.get("MOCK_SRUN_FAIL_CODE", "75")))
+with open(os.environ["MOCK_SRUN_COUNTER"], "a+") as cf:
+    fcntl.flock(cf, fcntl.LOCK_EX)
+    cf.seek(0)
+    job_id = int(cf.read() or 1000) + 1
+    cf.seek(0)
+    cf.truncate()
+    cf.write(str(job_id))
+print(f"Submitted batch job {{job_id}}")
+"""
+
+
+@contextlib.contextmanager
+def mock_srun(
+    tmp: Path, latency: float, fail_rate: float, fail_code: int
+) -> Iterator[None]:
+    # srun.py first on PATH, settings passed to it through the environment
+    bin_dir = tmp / "bin"
+    bin_dir.mkdir()
+    srun = bin_dir / "srun.py"
+    srun.write_text(MOCK_SRUN.format(python=sys.executable))
+    srun.chmod(srun.stat().st_mode | stat.S_IXUSR)
+    settings = {
+        "PATH": f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}",
+        "MOCK_SRUN_LATENCY": str(latency),
+        "MOCK_SRUN_FAIL_RATE": str(fail_rate),
+        "MOCK_SRUN_FAIL_CODE": str(fail_code),
+        "MOCK_SRUN_COUNTER": str(tmp / "job_counter"),
+    }
+    saved = {i: os.environ.get(i) for i in settings}
+    os.environ.update(settings)
+    try:
+        yield
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+class TimedExecutor(SrunExecutor):
+    """SrunExecutor recording wall time of every submitter call"""
+
+    def __init__(self, bash_cmd: str) -> None:
+        super().__init__(bash_cmd)
+        self.latencies: List[float] = []
+
+    def execute_one(self, *args, **kwargs) -> JobResult:
+        start = time.perf_counter()
+        try:
+            return super().execute_one(*args, **kwargs)
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def job_id_of(result: JobResult) -> Optional[str]:
+    with open(result.stdout_log) as out:
+        return parse_job_id(out.read())
+
+
+def run_mode(args: argparse.Namespace, workers: int) -> Dict[str, float]:
+    with tempfile.TemporaryDirectory() as tmp:
+        sheet = make_run(Path(tmp), args.samples)
+        executor = TimedExecutor("srun.py")
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        tracemalloc.start()
+        try:
+            with mock_srun(
+                Path(tmp), args.latency, args.fail_rate, args.fail_code
+            ), contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                first = None
+                results = []
+                for result in HandleFlow().iter_bash(
+                    str(sheet.relative_to(tmp)),
+                    workers=workers,
+                    submit_rate=args.submit_rate,
+                    retries=args.retries,
+                    batch_size=args.batch_size,
+                    executor=executor,
+                ):
+                    if first is None:
+                        first = time.perf_counter() - start
+                    results.append(result)
+                elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+            os.chdir(cwd)
+        submitted = [i for i in results if i.returncode == 0]
+        job_ids = sum(1 for i in submitted if job_id_of(i))
+    return {
+        "commands": len(results),
+        "failed": len(results) - len(submitted),
+        "job_ids": job_ids,
+        "elapsed": elapsed,
+        "first": first or 0.0,
+        "rate": len(results) / elapsed if elapsed else 0.0,
+        "p50": percentile(executor.latencies, 50),
+        "p95": percentile(executor.latencies, 95),
+        "p99": percentile(executor.latencies, 99),
+        "calls": len(executor.latencies),
+        "peak_mb": peak / 2 ** 20,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--samples", type=int, default=60)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--fail-code", type=int, default=75)
+    parser.add_argument("--retries", type=int, default=0)
+    parser.add_argument("--submit-rate", type=float, default=0)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--batch-size", type=int, default=0)
+    args = parser.parse_args()
+    print(
+        f"samples={args.samples} latency={args.latency}s "
+        f"fail_rate={args.fail_rate} retries={args.retries} "
+        f"submit_rate={args.submit_rate or 'unlimited'} "
+        f"batch_size={args.batch_size}"
+    )
+    for workers in args.workers:
+        res = run_mode(args, workers)
+        print(
+            f"workers={workers:3d} {res['elapsed']:7.2f}s "
+            f"{res['rate']:7.1f} cmd/s first={res['first']:.2f}s "
+            f"submit p50={res['p50'] * 1000:.0f}ms p95={res['p95'] * 1000:.0f}ms "
+            f"p99={res['p99'] * 1000:.0f}ms calls={res['calls']} "
+            f"failed={res['failed']}/{res['commands']} job_ids={res['job_ids']} "
+            f"peak={res['peak_mb']:.1f}MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,72 @@
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
 import logging
-from typing import List
+import os
+import sys
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 
-from src.utility.flow import FlowConstructor
+from src.utility.flow import FlowConstructor, JobResult
 from src.dragen_pipeline import ConstructDragenPipeline
 from src.dragen_met_pipeline import ConstructMetPipeline
 from src.dragen_rna_pipeline import ConstructRnaPipeline
+from src.utility.capacity import CAPACITY_MODES, CapacityPlanner, pipeline_kind
+from src.utility.duplicates import drop_copies, drop_same_outputs
+from src.utility.executors import EXECUTORS, Executor, make_executor, SrunExecutor
+from src.utility.fastq_check import preflight_fastq
+from src.utility.fs_meta import configure as configure_fs, DEFAULT_TTL, fs
+from src.utility.job_monitor import (
+    command_handler,
+    COMPLETED,
+    FAILED,
+    JobEvent,
+    JobMonitor,
+    parse_job_id,
+)
+from src.utility.locks import queued_jobs, run_dir, run_lock, SampleLocks
+from src.utility.metrics import Metrics, moved_bytes
+from src.utility.normal_registry import normal_record, NormalRegistry
+from src.utility.profile_cache import compile_profiles
+from src.utility.plan import apply_actions, APPLY_WORKERS, Plan, without_rows
+from src.utility.profiling import PhaseProfiler
+from src.utility.ref_batch import (
+    plan_jobs,
+    Row,
+    sample_name,
+    status_path,
+    SubmitJob,
+)
+from src.utility.ref_paths import check_references
+from src.utility.qc_metrics import aggregate_metrics, find_metrics
+from src.utility.sample import profile_columns, to_samples
+from src.utility.shard import parse_shard, shard_rows
+from src.utility.submit_control import DEFAULT_RETRY_CODES, SubmitController
+from src.utility.fingerprint import (
+    load_fingerprint,
+    lost_rows,
+    row_fingerprint,
+    save_fingerprint,
+    stale_outputs,
+)
 from src.utility.dragen_utility import (
     basic_reader,
     check_has_run,
     create_fastq_dir,
     file_parse,
+    flow_name,
+    has_outputs,
+    merge_lanes,
+    render_groups,
     run_type,
     sort_list,
-    SH_PARAM,
+    SH_NORMAL,
+    SH_SAMPLE,
+    SH_SM_PROJ,
+    SHA_FPRINT,
+    SHA_FPSTATE,
+    SHA_NPATH,
+    SHA_QUEUED,
+    SHA_RTYPE,
 )
 
 # register flows/pipeline
@@ -37,84 +90,557 @@ class HandleFlow(object):
 
         if flow/pipeline is is dragen sort based on col tumor/normal
         else just read the csv file. Mehtod returns list of dictionary
-        with column name as key and value as row.
+        with column name as key and value as row, for dragen compact
+        Sample mappings holding only the columns pipelines use.
         """
         if flow == "dragen":
-            data_file = file_parse(path)
+            data_file = to_samples(file_parse(path), profile_columns())
             return data_file
         else:
             data_file = basic_reader(path)
             return data_file
 
-    def execute_bash(
+    def check_fastqs(self, data_file: List[dict]) -> None:
+        """Validate fastq files of all samples before anything is submitted"""
+        logging.info("fastq preflight check")
+        problems = preflight_fastq(data_file)
+        if not problems:
+            return
+        for sample, errors in problems.items():
+            for err in errors:
+                logging.error(f"{sample}: {err}")
+                print(f"{sample}: {err}")
+        raise RuntimeError(f"Fastq preflight failed for {len(problems)} sample(s)")
+
+    def check_reference_paths(self, submissions: List[Row]) -> None:
+        """Validate reference, target and PoN paths of all samples at once"""
+        logging.info("reference path check")
+        sources = available_pipeline["dragen_dna"].pon_sources
+        problems = check_references(submissions, sources)
+        if not problems:
+            return
+        for sample, errors in problems.items():
+            for err in errors:
+                logging.error(f"{sample}: {err}")
+                print(f"{sample}: {err}")
+        raise RuntimeError(f"Reference check failed for {len(problems)} sample(s)")
+
+    def mark_queued(self, path: str, data_file: List[dict], scheduler) -> None:
+        """Rows of samples whose job of an earlier run is still queued or running"""
+        queued = queued_jobs(path, {sample_name(i) for i in data_file}, scheduler)
+        for key, job_id in sorted(queued.items()):
+            logging.info(f"Skipping {key}, job {job_id} not finished")
+            print(f"Skipping {key}, job {job_id} not finished")
+        for data in data_file:
+            if sample_name(data) in queued:
+                data[SHA_QUEUED] = queued[sample_name(data)]
+
+    def fingerprint_rows(self, data_file: List[dict], scheduler=None) -> Set[str]:
+        """
+        Compare row fingerprints against the ones stored with last submission
+
+        Marks each row new, changed or unchanged and reports outputs made
+        stale by a change. Returns normals that changed paired rows need.
+        With a scheduler an unchanged row without outputs is new again once
+        the scheduler reports its job finished, else it stays unchanged.
+        """
+        normal_fps: Dict[str, str] = {}
+        needed_normals = set()
+        pending = []
+        for data in data_file:
+            key = f"{data[SH_SM_PROJ]}/{data[SH_SAMPLE]}"
+            normal_fp = ""
+            if data[SHA_RTYPE] == "somatic_paired":
+                normal_key = f"{data[SH_SM_PROJ]}/{data[SH_NORMAL]}"
+                normal_fp = normal_fps.get(normal_key, data[SHA_NPATH])
+            data[SHA_FPRINT] = row_fingerprint(data, normal_fp)
+            if data[SHA_RTYPE] == "germline":
+                normal_fps[key] = data[SHA_FPRINT]
+            stored = load_fingerprint(data)
+            if stored is None:
+                data[SHA_FPSTATE] = "new"
+            elif stored["fingerprint"] == data[SHA_FPRINT]:
+                data[SHA_FPSTATE] = "unchanged"
+                if scheduler is not None and not check_has_run(data):
+                    pending.append((data, stored.get("job_id", "")))
+                continue
+            else:
+                data[SHA_FPSTATE] = "changed"
+                for stale in stale_outputs(data, stored):
+                    logging.info(f"Out of date: {stale}")
+                    print(f"Out of date: {stale}")
+            if data[SHA_RTYPE] == "somatic_paired":
+                needed_normals.add(f"{data[SH_SM_PROJ]}/{data[SH_NORMAL]}")
+        for data in lost_rows(pending, scheduler):
+            logging.info(f"Resubmitting {data['fastq_dir']}, job ended without outputs")
+            data[SHA_FPSTATE] = "new"
+            if data[SHA_RTYPE] == "somatic_paired":
+                needed_normals.add(f"{data[SH_SM_PROJ]}/{data[SH_NORMAL]}")
+        return needed_normals
+
+    def render_row(
+        self,
+        data: dict,
+        needed_normals: Set[str],
+        incremental: bool,
+        locks: Optional[SampleLocks] = None,
+        metrics: Optional[Metrics] = None,
+    ) -> Optional[List[str]]:
+        """
+        Construct commands of one row, None if the row is skipped
+
+        With locks the sample is locked for this process, a sample locked by
+        another instance is skipped. Skipped rows are counted in metrics.
+        """
+        if data["pipeline"].lower() != "dragen":
+            # skip if pipeline is not dragen
+            return self.skipped(metrics, "not_dragen")
+        pipeline = flow_name(data)
+        logging.info(f"Preparing {pipeline} pipeline")
+        chosen_pipeline = available_pipeline[pipeline]
+        flow_context = FlowConstructor(chosen_pipeline)
+        sample_key = f"{data[SH_SM_PROJ]}/{data[SH_SAMPLE]}"
+        unchanged = incremental and data[SHA_FPSTATE] == "unchanged"
+        if unchanged and sample_key not in needed_normals:
+            logging.info(f"Skipping {data['fastq_dir']} as unchanged.")
+            return self.skipped(metrics, "unchanged")
+        logging.info("Creating dragen commands")
+        constructed_str = flow_context.construct_flow(data=data)
+        if unchanged:
+            # rendered only to provide normal parameters for tumor
+            return self.skipped(metrics, "unchanged")
+        # contruct the commands first before checking as in case of paired sample
+        # this would allow normal sample to have done previously and still be used
+        changed = incremental and data[SHA_FPSTATE] == "changed"
+        if not changed and check_has_run(data):
+            logging.info(f"Skipping {data['fastq_dir']} as already executed.")
+            return self.skipped(metrics, "has_run")
+        holder = locks.acquire(sample_key) if locks is not None else ""
+        if holder:
+            logging.info(f"Skipping {sample_key} as locked by {holder}")
+            print(f"Skipping {sample_key}, locked by {holder}")
+            return self.skipped(metrics, "locked")
+        if metrics is not None:
+            metrics.inc("samples", state="planned")
+        return constructed_str
+
+    def skipped(self, metrics: Optional[Metrics], reason: str) -> None:
+        # row renders no commands, counted by reason
+        if metrics is not None:
+            metrics.inc("samples", state=f"skipped_{reason}")
+
+    def render(
+        self,
+        data_file: List[dict],
+        needed_normals: Set[str],
+        incremental: bool = False,
+        workers: int = 1,
+        locks: Optional[SampleLocks] = None,
+        metrics: Optional[Metrics] = None,
+    ) -> List[Tuple[dict, Optional[List[str]]]]:
+        """
+        Construct commands of all rows, in sheet order
+
+        With several workers germline rows are constructed first so pairing
+        state (normals and their commands) is complete before tumors read it.
+        Rows sharing a sample directory or a normal are constructed in order
+        by one worker, so the result is the same as sequential construction.
+        """
+
+        def render_one(data: dict) -> Optional[List[str]]:
+            # changes recorded meanwhile are made for this row
+            with fs.owner(id(data)):
+                return self.render_row(
+                    data, needed_normals, incremental, locks, metrics
+                )
+
+        if workers <= 1:
+            return [(data, render_one(data)) for data in data_file]
+        results: Dict[int, Optional[List[str]]] = {}
+
+        def render_group(group: List[int]) -> None:
+            for i in group:
+                results[i] = render_one(data_file[i])
+
+        germline = [i for i, d in enumerate(data_file) if d[SHA_RTYPE] == "germline"]
+        others = [i for i, d in enumerate(data_file) if d[SHA_RTYPE] != "germline"]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for phase in [germline, others]:
+                groups = render_groups(data_file, phase)
+                # list() re-raises first error of the phase
+                list(pool.map(render_group, groups))
+        return [(data, results[i]) for i, data in enumerate(data_file)]
+
+    def register_normal(self, registry: NormalRegistry, data: dict) -> None:
+        # germline rows become normals that later runs can pair with
+        if data[SHA_RTYPE] != "germline":
+            return
+        key = f"{data[SH_SM_PROJ]}/{data[SH_SAMPLE]}"
+        cmd = available_pipeline["dragen_dna"].commands.get(key)
+        if cmd is None:
+            return
+        registry.register(normal_record(data, cmd))
+        logging.info(f"Registered normal {key}")
+
+    def finished_normal(self, data: dict) -> bool:
+        # normals that ran in earlier runs, known finished by their replay
+        if data["pipeline"].lower() != "dragen" or data[SHA_RTYPE] != "germline":
+            return False
+        return has_outputs(data)
+
+    def register_on_completion(
+        self, monitor: JobMonitor, registry: NormalRegistry, jobs: List[SubmitJob]
+    ) -> None:
+        # a submitted normal might still fail, register once its job completed
+        normals = {
+            sample_name(data): data
+            for job in jobs
+            for data, _ in job.members
+            if data[SHA_RTYPE] == "germline"
+        }
+
+        def register(event: JobEvent) -> None:
+            if event.sample in normals:
+                self.register_normal(registry, normals[event.sample])
+
+        monitor.on(COMPLETED, register)
+
+    def job_id(self, result: JobResult) -> Optional[str]:
+        # given by the executor, else printed by the submitter
+        if result.job_id:
+            return result.job_id
+        try:
+            with open(result.stdout_log) as out:
+                return parse_job_id(out.read())
+        except OSError:
+            return None
+
+    def track_job(
+        self, monitor: JobMonitor, job: SubmitJob, result: JobResult
+    ) -> None:
+        job_id = self.job_id(result)
+        if job_id is None:
+            logging.warning(f"No job id in {result.stdout_log}")
+            return
+        info = {"wd_path": result.wd_path, "command": result.command}
+        if job.batched:
+            # completion of each row is read from its status file
+            info["members"] = [
+                {
+                    "sample": sample_name(data),
+                    "wd_path": str(data["fastq_dir"]),
+                    "status_file": status_path(data),
+                }
+                for data, _ in job.members
+            ]
+        monitor.track(job_id, job.sample, **info)
+
+    def summarize_qc(
+        self, path: str, out_dir: str, workers: Optional[int] = None
+    ) -> Dict[str, int]:
+        """Collect metrics csv files of sheet samples into a table per type"""
+        configure_fs()
+        data_file = self.parse_file(path, "dragen")
+        # only locate sample dirs, nothing is created
+        data_file = create_fastq_dir(data_file, dry_run=True)
+        found = find_metrics(data_file)
+        logging.info(f"qc metrics: {len(found)} files found")
+        return aggregate_metrics(found, out_dir, workers)
+
+    def plan(
         self,
         path: str,
         pipeline: str = "dragen",
-        bash_cmd: str = "echo",
         dry_run: bool = False,
         disable_scripts: bool = False,
-    ) -> list:
+        preflight: bool = False,
+        lane_merge: bool = False,
+        incremental: bool = False,
+        workers: int = 1,
+        normal_registry: Optional[NormalRegistry] = None,
+        batch_size: int = 0,
+        shard: Optional[Tuple[int, int]] = None,
+        locks: Optional[SampleLocks] = None,
+        executor: Optional[Executor] = None,
+        capacity: Optional[CapacityPlanner] = None,
+        metrics: Optional[Metrics] = None,
+        check_refs: bool = False,
+    ) -> Plan:
         """
-        Construct bash command as string and execute if dry_run is False
+        Resolve the sheet into jobs and filesystem changes, changing nothing
 
-        This creates appropriate flow object from argument supplied from cli
-        & invoke construct_flow method of flow object
+        Sample dirs, fastq moves and files written while constructing are
+        recorded instead of made, so an invalid row stops the run before
+        anything is done. Dry run plans no job preparation. A shard (i, N)
+        plans only the rows of shard i, locks are taken of planned samples.
+        The executor prepares the jobs, by default as srun.py needs them.
+        With capacity jobs not fitting on their volume are left out, with the
+        changes recorded only for their rows. Rows planned and skipped are
+        counted in metrics. A copy of an earlier row is left out before
+        anything is recorded for it, a row writing the outputs of an earlier
+        one with the same commands after rendering, the changes recorded only
+        for it are not made. Rows writing the same outputs with other options
+        are reported.
+        With check_refs reference, target and PoN paths of the commands are
+        checked before any job is planned. With a normal registry normals
+        that ran in earlier runs are in the plan, registered when it is
+        applied.
         """
-        logging.info(f"dry run mode: {dry_run}")
-        outputs = []
-        command_list = []
-        data_file = self.parse_file(path, pipeline)
-        logging.info("creating fastq directory")
-        data_file = create_fastq_dir(data_file, dry_run=dry_run)
-        logging.info("assigning runtype")
-        data_file1 = run_type(data_file)
-        data_file = sort_list(data_file1)
-        # chosen_pipeline = available_pipeline[pipeline]
-        # flow_context = FlowConstructor(chosen_pipeline)
-        for data in data_file:
-            if data["pipeline"].lower() == "dragen":
-                if data[SH_PARAM].startswith("rna"):
-                    pipeline = "dragen_rna"
-                    logging.info("Preparing dragen rna pipeline")
-                elif data[SH_PARAM].startswith("methylation"):
-                    pipeline = "dragen_met"
-                    logging.info("Preparing dragen methylation pipeline")
-                else:
-                    pipeline = "dragen_dna"
-                    logging.info("Preparing dragen dna pipeline")
-                chosen_pipeline = available_pipeline[pipeline]
-                flow_context = FlowConstructor(chosen_pipeline)
-                # skip if pipeline is not dragen
-                # attach script to data
+        submissions = []
+        normals = []
+        with fs.recording() as actions:
+            data_file, copies = drop_copies(self.parse_file(path, pipeline))
+            for line in copies:
+                logging.warning(line)
+                print(line)
+            if metrics is not None:
+                metrics.inc("samples", len(copies), state="duplicate")
+            logging.info("creating fastq directory")
+            data_file = create_fastq_dir(data_file, dry_run=dry_run)
+            if lane_merge:
+                logging.info("merging multi-lane samples")
+                data_file = merge_lanes(data_file)
+            logging.info("assigning runtype")
+            data_file1 = run_type(data_file, normal_registry)
+            data_file = sort_list(data_file1)
+            if shard is not None:
+                data_file = shard_rows(data_file, *shard)
+                logging.info(f"shard {shard[0]}/{shard[1]}: {len(data_file)} rows")
+            if preflight:
+                self.check_fastqs(data_file)
+            for data in data_file:
                 data["disable_scripts"] = disable_scripts
-                logging.info("Creating dragen commands")
-                constructed_str = flow_context.construct_flow(data=data)
-                # contruct the commands first before checking as in case of paired sample
-                # this would allow normal sample to have done previously and still be used
-                if check_has_run(data):
-                    logging.info(f"Skipping {data['fastq_dir']} as already executed.")
+            scheduler = (executor or SrunExecutor()).scheduler
+            self.mark_queued(path, data_file, scheduler)
+            needed_normals = self.fingerprint_rows(
+                data_file, scheduler if incremental else None
+            )
+            rendered = self.render(
+                data_file, needed_normals, incremental, workers, locks, metrics
+            )
+            for data, constructed_str in rendered:
+                if constructed_str is None:
+                    if normal_registry is not None and self.finished_normal(data):
+                        normals.append(data)
                     continue
                 # collect all executable command in a list
                 logging.info(f"Input dict:{data}")
                 for c in constructed_str:
                     logging.info(f"command:{c}")
-                    command_list.append([str(data["fastq_dir"]), c])
-        if dry_run:
-            for path, str_command in command_list:
-                print("chdir " + path)
-                outputs.append(str_command)
-                print(str_command)
-                print("===========")
-        else:
-            logging.info("Executing commands:")
-            for path, str_command in command_list:
-                output, arglist = FlowConstructor.execute_flow(
-                    command=str_command, base_cmd=bash_cmd, wd_path=path
+                submissions.append((data, constructed_str))
+            submissions, same, lines = drop_same_outputs(submissions)
+            for line in lines:
+                if line.startswith("Conflict"):
+                    logging.error(line)
+                else:
+                    logging.warning(line)
+                print(line)
+            if metrics is not None:
+                metrics.inc("samples", len(same), state="duplicate")
+            left_out = [data for data, _ in same]
+            if check_refs:
+                self.check_reference_paths(submissions)
+            jobs = plan_jobs(submissions, batch_size)
+            if capacity is not None:
+                fitting = capacity.fit(jobs, data_file, actions)
+                fitted = {id(i) for i in fitting}
+                deferred = [
+                    data
+                    for job in jobs
+                    if id(job) not in fitted
+                    for data, _ in job.members
+                ]
+                if metrics is not None:
+                    metrics.inc("samples", len(deferred), state="deferred")
+                # no fastqs moved or dirs made for jobs of a later run
+                left_out.extend(deferred)
+                jobs = fitting
+            if not dry_run:
+                (executor or SrunExecutor()).prepare(jobs)
+        planned = without_rows(actions, fs.owners, left_out, data_file)
+        logging.info(f"planned {len(jobs)} jobs, {len(planned)} filesystem changes")
+        return Plan(tuple(planned), tuple(jobs), tuple(normals))
+
+    def iter_bash(
+        self,
+        path: str,
+        pipeline: str = "dragen",
+        bash_cmd: str = "echo",
+        dry_run: bool = False,
+        disable_scripts: bool = False,
+        preflight: bool = False,
+        lane_merge: bool = False,
+        incremental: bool = False,
+        workers: int = 1,
+        registry: Optional[str] = None,
+        fs_ttl: float = DEFAULT_TTL,
+        timeout: Optional[float] = None,
+        submit_rate: float = 0,
+        retries: int = 3,
+        retry_codes: Iterable[int] = DEFAULT_RETRY_CODES,
+        monitor: Optional[JobMonitor] = None,
+        profiler: Optional[PhaseProfiler] = None,
+        batch_size: int = 0,
+        shard: Optional[Tuple[int, int]] = None,
+        executor: Optional[Executor] = None,
+        capacity: Optional[CapacityPlanner] = None,
+        metrics: Optional[Metrics] = None,
+        check_refs: bool = False,
+    ) -> Iterator[Union[str, JobResult]]:
+        """
+        Construct bash commands and execute them if dry_run is False
+
+        The whole sheet is planned first, then filesystem changes are applied
+        and jobs submitted. Yields each command in dry run, else a JobResult
+        as each submission finishes, stdout and stderr of it are in the logs
+        dir of the sample.
+        Submissions are limited to submit_rate per second, return codes in
+        retry_codes are retried with backoff. With a monitor, job ids printed
+        by the submitter are followed until the jobs finish. A profiler gets
+        the planning and submission phases. With batch_size above 1 rows
+        sharing a reference dir are run back to back in one job. A shard
+        (i, N) submits only rows of shard i, so N instances can split a sheet.
+        Jobs are run by the executor, by default submit commands are run with
+        bash_cmd. Jobs the executor runs itself are fingerprinted once they
+        finished successfully. With capacity output size of jobs is forecast
+        against free space of their volumes, jobs that don't fit are deferred
+        or rejected.
+        Metrics of each stage are written as it ends, and while submitting.
+        With check_refs a missing reference, target or PoN path fails the
+        plan.
+
+        Outside dry run the run folder is locked while it is planned and the
+        plan applied, and samples stay locked until they are submitted, so
+        instances running on the same run folder don't submit twice.
+        """
+        profiler = profiler or PhaseProfiler()
+        profiler.start("planning")
+        metrics = metrics or Metrics()
+        metrics.stage("planning")
+        metrics.set("run_success", 0)
+        logging.info(f"dry run mode: {dry_run}")
+        normal_registry = NormalRegistry(registry) if registry else None
+        executor = executor or SrunExecutor(bash_cmd, timeout)
+        locks = None if dry_run else SampleLocks(path)
+        try:
+            lock = run_lock(path) if locks is not None else contextlib.ExitStack()
+            with lock:
+                # other instances see our changes when they get to plan
+                configure_fs(fs_ttl)
+                plan = self.plan(
+                    path,
+                    pipeline,
+                    dry_run,
+                    disable_scripts,
+                    preflight,
+                    lane_merge,
+                    incremental,
+                    workers,
+                    normal_registry,
+                    batch_size,
+                    shard,
+                    locks,
+                    executor,
+                    capacity,
+                    metrics,
+                    check_refs,
                 )
-                logging.info(f"Executed command: {arglist}")
-                logging.info(f"Return code: {output.returncode}")
-                outputs.append([(output.returncode, output.stdout)])
-        return outputs
+                if not dry_run:
+                    profiler.start("submission")
+                    metrics.stage("apply")
+                    metrics.set("fastq_moved_bytes", moved_bytes(plan.actions))
+                    logging.info(f"applying {len(plan.actions)} filesystem changes")
+                    done = apply_actions(plan.actions, max(APPLY_WORKERS, workers))
+                    for kind, count in done.items():
+                        metrics.set("fs_operations", count, kind=kind)
+                    if normal_registry is not None:
+                        for data in plan.normals:
+                            self.register_normal(normal_registry, data)
+            if dry_run:
+                for job in plan.jobs:
+                    for str_command in job.commands:
+                        print("chdir " + job.wd_path)
+                        print(str_command)
+                        print("===========")
+                        yield str_command
+                metrics.set("run_success", 1)
+                return
+            metrics.stage("submission")
+            for job in plan.jobs:
+                metrics.inc("queue_depth", pipeline=pipeline_kind(job.members[0][0]))
+            if normal_registry is not None and monitor is not None:
+                self.register_on_completion(monitor, normal_registry, plan.jobs)
+            logging.info("Executing commands:")
+            controller = SubmitController(
+                rate=submit_rate, retries=retries, retry_codes=retry_codes
+            )
+            started: List[Tuple[SubmitJob, str]] = []
+            for job in plan.jobs:
+                submitted = True
+                job_id = ""
+                kind = pipeline_kind(job.members[0][0])
+                for result in executor.submit(job, controller):
+                    submitted = submitted and result.returncode == 0
+                    if result.returncode == 0:
+                        job_id = self.job_id(result) or job_id
+                    state = "submitted" if result.returncode == 0 else "failed"
+                    metrics.inc("commands", state=state, pipeline=kind)
+                    if monitor is not None and result.returncode == 0:
+                        self.track_job(monitor, job, result)
+                    yield result
+                metrics.inc("queue_depth", -1, pipeline=kind)
+                metrics.write(force=False)
+                if not submitted:
+                    continue
+                if executor.runs_jobs:
+                    # saved once the job ran successfully
+                    started.append((job, job_id))
+                    continue
+                for data, commands in job.members:
+                    save_fingerprint(data, data[SHA_FPRINT], commands, job_id)
+                    if locks is not None:
+                        # later runs skip it while the job is queued or running
+                        locks.mark_submitted(sample_name(data), job_id)
+            for line in controller.report():
+                logging.error(line)
+                print(line)
+            metrics.stage("wait")
+            if monitor is not None:
+                logging.info(f"waiting for {len(monitor.outstanding)} jobs")
+                monitor.wait()
+            for line in executor.finish():
+                logging.error(line)
+                print(line)
+            states = executor.scheduler.status([i for _, i in started])
+            for job, job_id in started:
+                if states.get(job_id) != COMPLETED:
+                    continue
+                for data, commands in job.members:
+                    save_fingerprint(data, data[SHA_FPRINT], commands, job_id)
+                    if normal_registry is not None and monitor is None:
+                        self.register_normal(normal_registry, data)
+            metrics.set("run_success", 1)
+        finally:
+            profiler.stop()
+            if locks is not None:
+                locks.release_all()
+            if normal_registry is not None:
+                normal_registry.close()
+            cache = fs.stats()
+            logging.info(f"filesystem metadata: {cache}")
+            for lookup in ["hits", "misses"]:
+                metrics.set("fs_cache", cache[lookup], result=lookup)
+            metrics.stop()
+
+    def execute_bash(self, *args, **kwargs) -> list:
+        """
+        Construct bash command as string and execute if dry_run is False
+
+        This creates appropriate flow object from argument supplied from cli
+        & invoke construct_flow method of flow object. Takes the arguments of
+        iter_bash and returns all of its results at once.
+        """
+        return list(self.iter_bash(*args, **kwargs))
 
 
 if __name__ == "__main__":
@@ -128,7 +654,7 @@ if __name__ == "__main__":
         "--path",
         type=str,
         action="store",
-        required=True,
+        required="--compile-profiles" not in sys.argv,
         nargs=1,
         help="Required: path to the samplesheet file",
     )
@@ -152,11 +678,204 @@ if __name__ == "__main__":
         default=None,
         help="Optional: if need to run arbitrary bash command, default None",
     )
+    parser.add_argument(
+        "--preflight",
+        default=False,
+        action="store_true",
+        help="Optional: validate fastq files before submitting, defaults to False",
+    )
+    parser.add_argument(
+        "--merge-lanes",
+        default=False,
+        action="store_true",
+        help="Optional: run multi-lane samples as one job with a fastq list",
+    )
+    parser.add_argument(
+        "--incremental",
+        default=False,
+        action="store_true",
+        help="Optional: only submit samples changed since last submission",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=1,
+        help="Optional: number of samples constructed in parallel, defaults to 1",
+    )
+    parser.add_argument(
+        "--registry",
+        default=None,
+        help="Optional: sqlite file of finished normals shared between runs",
+    )
+    parser.add_argument(
+        "--fs-ttl",
+        type=float,
+        default=DEFAULT_TTL,
+        help="Optional: seconds directory listings are cached, defaults to 30",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=None,
+        help="Optional: seconds a submit command may run before it is killed",
+    )
+    parser.add_argument(
+        "--submit-rate",
+        type=float,
+        default=0,
+        help="Optional: max submissions per second, defaults to no limit",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=3,
+        help="Optional: times a temporary submit failure is retried, defaults to 3",
+    )
+    parser.add_argument(
+        "--retry-codes",
+        default=",".join(str(i) for i in DEFAULT_RETRY_CODES),
+        help="Optional: comma separated submit return codes worth retrying",
+    )
+    parser.add_argument(
+        "--monitor",
+        default=False,
+        action="store_true",
+        help="Optional: follow submitted jobs with sacct until they finish",
+    )
+    parser.add_argument(
+        "--on-event",
+        default=None,
+        help="Optional: shell command run in sample dir when a monitored job "
+        "finishes, DRAGENFLOW_STATE tells if completed or failed",
+    )
+    parser.add_argument(
+        "--qc-summary",
+        default=None,
+        help="Optional: instead of submitting, collect metrics of finished "
+        "samples into one table per metric type in given dir",
+    )
+    parser.add_argument(
+        "--compile-profiles",
+        default=False,
+        action="store_true",
+        help="Optional: validate profile json files and write their binary cache",
+    )
+    parser.add_argument(
+        "--profile",
+        default=None,
+        help="Optional: write cProfile stats and flamegraph stacks of planning "
+        "and submission to given dir",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=0,
+        help="Optional: run up to this many samples sharing a reference dir "
+        "back to back in one job, defaults to one job per sample",
+    )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        default=None,
+        help="Optional: i/N, submit only shard i of N of the sheet so N "
+        "instances can split it, tumors stay with their normal",
+    )
+    parser.add_argument(
+        "--executor",
+        choices=EXECUTORS,
+        default="srun",
+        help="Optional: srun runs submit commands with --cmd, sbatch-array "
+        "submits job arrays, local runs jobs on this host, defaults to srun",
+    )
+    parser.add_argument(
+        "--max-running",
+        type=int,
+        default=0,
+        help="Optional: jobs run at once by local or sbatch-array executor, "
+        "defaults to 1 for local and no limit for sbatch-array",
+    )
+    parser.add_argument(
+        "--disk-check",
+        choices=CAPACITY_MODES,
+        default=None,
+        help="Optional: forecast output size against free space of project "
+        "volumes, defer jobs that don't fit to a later run or reject the run",
+    )
+    parser.add_argument(
+        "--capacity-history",
+        default=None,
+        help="Optional: json file of measured output sizes shared between "
+        "runs, defaults to one next to the sheet",
+    )
+    parser.add_argument(
+        "--metrics",
+        default=None,
+        help="Optional: node exporter textfile collector dir to write "
+        "prometheus metrics of the run to",
+    )
+    parser.add_argument(
+        "--check-refs",
+        default=False,
+        action="store_true",
+        help="Optional: check reference, target and PoN paths of all samples "
+        "exist before anything is submitted",
+    )
     args = parser.parse_args()
+    if args.compile_profiles:
+        for cache_f in compile_profiles():
+            print(f"wrote {os.path.normpath(cache_f)}")
+        raise SystemExit(0)
+    if args.qc_summary:
+        added = HandleFlow().summarize_qc(args.path[0], args.qc_summary)
+        for mtype, count in sorted(added.items()):
+            print(f"{mtype}: {count} new rows")
+        raise SystemExit(0)
+    executor = make_executor(
+        args.executor, args.cmd, args.timeout, args.max_running
+    )
+    monitor = None
+    if args.monitor and not args.dryrun:
+        monitor = JobMonitor(executor.scheduler)
+
+        def report(event: JobEvent) -> None:
+            print(f"{event.sample}: job {event.job_id} {event.state}")
+
+        for state in [COMPLETED, FAILED]:
+            monitor.on(state, report)
+            if args.on_event:
+                monitor.on(state, command_handler(args.on_event))
+    capacity = None
+    if args.disk_check:
+        capacity = CapacityPlanner(args.disk_check, args.capacity_history)
+    profiler = PhaseProfiler(args.profile)
+    metrics = Metrics(
+        args.metrics, os.path.basename(run_dir(args.path[0])), args.shard
+    )
     handle = HandleFlow()
     handle.execute_bash(
         path=args.path[0],
         bash_cmd=args.cmd,
         dry_run=args.dryrun,
         disable_scripts=args.disable_script,
+        preflight=args.preflight,
+        lane_merge=args.merge_lanes,
+        incremental=args.incremental,
+        workers=args.workers,
+        registry=args.registry,
+        fs_ttl=args.fs_ttl,
+        timeout=args.timeout,
+        submit_rate=args.submit_rate,
+        retries=args.retries,
+        retry_codes=[int(i) for i in args.retry_codes.split(",") if i],
+        monitor=monitor,
+        profiler=profiler,
+        batch_size=args.batch_size,
+        shard=args.shard,
+        executor=executor,
+        capacity=capacity,
+        metrics=metrics,
+        check_refs=args.check_refs,
     )
+    for line in profiler.write():
+        print(line, file=sys.stderr)
@@ -1,15 +1,18 @@
-import copy
-
-from .utility.commands import Commands
+from .utility.commands import Commands, OptionLayers
 from .utility.dragen_utility import (
     fastq_file,
+    fastq_list_options,
+    ora_options,
     set_fileprefix,
     set_rgid,
     set_rgism,
     get_ref_parameter,
     SH_PARAM,
     SH_TARGET,
+    SHA_SSFPATH,
+    template_params,
 )
+from .utility.run_context import run_context
 
 
 class BaseDragenCommand(Commands):
@@ -37,33 +40,39 @@ class BaseDragenCommand(Commands):
             "vc-snp-error-cal-bed": self.excel[SH_TARGET]
         }
 
-    def construct_commands(self) -> dict:
+    def construct_commands(self) -> OptionLayers:
         # select the parameter from config template
-        cmd_dict1 = self.template[self.seq_pipeline]
-        cmd_dict2 = copy.deepcopy(cmd_dict1)
+        template = self.template[self.seq_pipeline]
         # get the dict that needs to be filled in at runtime
-        param_list = [i for i in cmd_dict2 if str(cmd_dict2[i]).startswith("{")]
+        param_list = template_params(self.template, self.seq_pipeline)
         if len(param_list) == 0:
             raise RuntimeError("Something wrong with parsing template")
+        sample, reference = dict(), dict()
         for val in param_list:
             if val in self.arg_registry:
-                cmd_dict2[val] = self.arg_registry.get(val)
+                value = sample[val] = self.arg_registry.get(val)
             else:
-                tmp = cmd_dict2[val][1:-1]
-                cmd_dict2[val] = get_ref_parameter(self.excel,self.template,tmp)
-            if cmd_dict2[val] == "":
-                print(f"missing key '{val}' in registry or '{cmd_dict2[val]}' in ref_parameters")
+                tmp = template[val][1:-1]
+                value = reference[val] = get_ref_parameter(self.excel,self.template,tmp)
+            if value == "":
+                print(f"missing key '{val}' in registry or '{value}' in ref_parameters")
                 continue
-        return cmd_dict2
+        reference.update(ora_options(self.excel, self.template, sample))
+        cmd_dict = OptionLayers("template", template)
+        cmd_dict.push("sample", sample).push("reference", reference)
+        return fastq_list_options(self.excel, cmd_dict)
 
     def set_umi_fastq(self, excel: dict, is_tumor: bool = False) -> None:
         # if normal umis, need to swap fastqs around
         if excel[SH_PARAM] == "umi":
-            if is_tumor:
-                self.arg_registry["tumor-fastq2"] = fastq_file(self.excel, 3)
-            else:
-                self.arg_registry["fastq-file2"] = fastq_file(self.excel, 3)
-            self.arg_registry["umi-fastq"] = fastq_file(self.excel, 2, False)
+            # umi is the short read of the run, read 2 if the run is not known
+            umi_n = run_context(excel[SHA_SSFPATH]).umi_read or 2
+            mates = [i for i in [1, 2, 3] if i != umi_n]
+            role = "tumor-fastq" if is_tumor else "fastq-file"
+            self.arg_registry[f"{role}1"] = fastq_file(self.excel, mates[0])
+            self.arg_registry[f"{role}2"] = fastq_file(self.excel, mates[1])
+            # moved like the mates, the command names it in the sample dir
+            self.arg_registry["umi-fastq"] = fastq_file(self.excel, umi_n)
         self.arg_registry["umi-metrics-interval-file"] = excel[SH_TARGET]
         return
 
@@ -73,6 +82,8 @@ class PairedVariantCommands(Commands):
     PairedVariant specific dragen command
     """
 
+    layer = "pairing"
+
     def __init__(self, normal: str, tumor_align: dict, tumor_varc: dict) -> None:
         self.tumor_a = tumor_align
         self.tumor_vc = tumor_varc
@@ -1,13 +1,15 @@
-import copy
 from src.utility.dragen_utility import (
     fastq_file,
+    fastq_list_options,
+    ora_options,
     get_ref_parameter,
     set_fileprefix,
     set_rgid,
     set_rgism,
-    SH_TARGET
+    SH_TARGET,
+    template_params,
 )
-from .utility.commands import Commands
+from .utility.commands import Commands, OptionLayers
 
 
 class BaseDragenMetCommand(Commands):
@@ -29,23 +31,27 @@ class BaseDragenMetCommand(Commands):
             "qc-coverage-region-1": self.excel[SH_TARGET],
         }
 
-    def construct_commands(self) -> dict:
+    def construct_commands(self) -> OptionLayers:
         # get the arg from json config filie
-        cmd_dict = copy.deepcopy(self.template[self.seq_pipeline])
+        template = self.template[self.seq_pipeline]
         # get the dict that needs to be filled in at runtime
-        param_list = [i for i in cmd_dict if str(cmd_dict[i]).startswith("{")]
+        param_list = template_params(self.template, self.seq_pipeline)
         if len(param_list) == 0:
             raise RuntimeError("Someting went wrong with parsing template")
+        sample, reference = dict(), dict()
         for val in param_list:
             if val in self.arg_registry:
-                cmd_dict[val] = self.arg_registry.get(val)
+                value = sample[val] = self.arg_registry.get(val)
             else:
-                tmp = cmd_dict[val][1:-1]
-                cmd_dict[val] = get_ref_parameter(self.excel,self.template,tmp)
-            if cmd_dict[val] == "":
-                print(f"missing key '{val}' in registry or '{cmd_dict[val]}' in ref_parameters")
+                tmp = template[val][1:-1]
+                value = reference[val] = get_ref_parameter(self.excel,self.template,tmp)
+            if value == "":
+                print(f"missing key '{val}' in registry or '{value}' in ref_parameters")
                 continue
-        return cmd_dict
+        reference.update(ora_options(self.excel, self.template, sample))
+        cmd_dict = OptionLayers("template", template)
+        cmd_dict.push("sample", sample).push("reference", reference)
+        return fastq_list_options(self.excel, cmd_dict)
 
 
 #class ExtraMetCommands(Commands):
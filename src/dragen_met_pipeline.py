@@ -8,17 +8,16 @@ from .utility.dragen_utility import (
     add_samplesheet_cols,
     check_target,
     dragen_cli,
-    load_json,
-    script_path, 
     SH_OVERRIDE,
     SH_PARAM,
 )
 from .utility.flow import Flow
+from .utility.profile_cache import load_profile
 
 
 class ConstructMetPipeline(Flow):
     def constructor(self, excel: dict) -> Optional[List[str]]:
-        self.profile = load_json(script_path("dragen_met.json"))
+        self.profile = load_profile("dragen_met.json")
         logging.info("executing dragen methylation command")
         scripts = self.profile.get("scripts")
         if excel.get("disable_scripts"):
@@ -31,7 +30,8 @@ class ConstructMetPipeline(Flow):
         )
         cmd_base = BaseDragenMetCommand(excel, self.profile, excel[SH_PARAM])
         cmd = cmd_base.construct_commands()
-        cmd.update(adapter_trimming(self.profile, excel, cmd.get("read-trimmers")))
-        cmd.update(add_options(excel[SH_OVERRIDE]))
+        trim_cmd = adapter_trimming(self.profile, excel, cmd.get("read-trimmers"))
+        cmd.push("trimming", trim_cmd)
+        cmd.push("overrides", add_options(excel[SH_OVERRIDE]))
         final_str = dragen_cli(cmd=cmd, excel=excel, scripts=scripts)
         return [final_str]
@@ -1,22 +1,25 @@
 import logging
 import os
-from typing import List, Optional
+from typing import List, Mapping, Optional
 
 from .dragen_commands import (
     BaseDragenCommand,
     PairedVariantCommands,
 )
-from .utility.commands import CompositeCommands
+from .utility.commands import CompositeCommands, OptionLayers
 from .utility.dragen_utility import (
     adapter_trimming,
     add_options,
     add_samplesheet_cols,
     check_target,
     dragen_cli,
+    drop_fastq_keys,
+    ora_options,
     load_json,
-    script_path,
     trim_options,
     is_between_0_1,
+    FASTQ_KEYS,
+    FASTQ_LIST_KEYS,
     OPT_T_ANALYSIS,
     OPT_T_ALIGN,
     SH_NORMAL,
@@ -27,24 +30,30 @@ from .utility.dragen_utility import (
     SH_TARGET,
     SH_TUMOR,
     SHA_NPATH,
+    SHA_NREG,
     SHA_RTYPE,
     SHA_TRG_NAME,
 )
 from .utility.flow import Flow
+from .utility.fs_meta import fs
+from .utility.profile_cache import load_profile
 
 
 class ConstructDragenPipeline(Flow):
     def __init__(self):
         self.normals = {}
         self.commands = {}
+        # profile panel of normals each sample panel is made of
+        self.pon_sources = {}
         self.profile = None
 
-    def add_cnv(self, excel: dict, cmd: dict) -> bool:
+    def add_cnv(self, excel: dict, cmd: OptionLayers) -> bool:
         tmp = self.profile["ref_parameters"]["cnvpanelofnormals"]
         if SHA_TRG_NAME not in excel or not excel[SHA_TRG_NAME]:
             return False
         if not excel[SHA_TRG_NAME] in tmp[excel["RefGenome"]]:
             return False
+        cmd.push("cnv")
         cmd["cnv-normals-list"] = tmp[excel["RefGenome"]][excel[SHA_TRG_NAME]]
         cmd["cnv-target-bed"] = excel[SH_TARGET]
         cmd["enable-cnv"] = "true"
@@ -65,14 +74,16 @@ class ConstructDragenPipeline(Flow):
             cmd["msi-coverage-threshold"] = 500
         return cmd
 
-    def command_with_trim(self, excel: dict, pipe_elem: str) -> dict:
+    def command_with_trim(self, excel: dict, pipe_elem: str) -> OptionLayers:
         pipeline = excel.get(SH_PARAM)
         base_cmd = BaseDragenCommand(excel, self.profile, f"{pipeline}_{pipe_elem}")
         cmd = base_cmd.construct_commands()
         trim_cmd = adapter_trimming(self.profile, excel, cmd.get("read-trimmers"))
-        return {**cmd, **trim_cmd}
+        return cmd.push("trimming", trim_cmd)
 
-    def umi_pipeline(self, excel:dict, pipe_elem:str, tumor:bool=False) -> dict:
+    def umi_pipeline(
+        self, excel: dict, pipe_elem: str, tumor: bool = False
+    ) -> OptionLayers:
         pipeline = excel.get(SH_PARAM)
         cmd_base = BaseDragenCommand(
             excel, self.profile, f"{pipeline}_{pipe_elem}"
@@ -80,48 +91,52 @@ class ConstructDragenPipeline(Flow):
         cmd_base.set_umi_fastq(excel, tumor)
         return cmd_base.construct_commands()
 
-    def sample_pon(self, key: str, dryrun: bool, sample_dir: str, cmd: dict) -> None:
+    def sample_pon(
+        self, key: str, dryrun: bool, sample_dir: str, cmd: OptionLayers
+    ) -> None:
         # create temporary cnv pon with normal added
         add_normal = f"{self.normals[key]}.target.counts.gc-corrected.gz"
         new_panel = f"{sample_dir}/logs/cnv_pon.txt"
+        self.pon_sources[new_panel] = cmd["cnv-normals-list"]
         if not dryrun:
-            with open(new_panel, 'w') as new_list:
-                with open(cmd["cnv-normals-list"], 'r') as old_list:
-                    for line in old_list.readlines():
-                        new_list.write(line)
-                new_list.write(add_normal)
-        cmd["cnv-normals-list"] = new_panel
+            with open(cmd["cnv-normals-list"], 'r') as old_list:
+                fs.write_text(new_panel, old_list.read() + add_normal)
+        cmd.push("pairing", {"cnv-normals-list": new_panel})
 
     def get_normal_params(self, normal_key:str) -> dict:
         normal = self.normals[normal_key]
         replay_f = f"{normal}-replay.json"
-        params = {"fastq-file1" : None, "fastq-file2" : None,
-                  "RGID": None, "RGSM": None
-        }
         if normal_key in self.commands:
-            for i in self.commands[normal_key]:
-                if i in params:
-                    params[i] = self.commands[normal_key][i]
+            source = self.commands[normal_key]
         elif os.path.isfile(replay_f):
             normal_replay = load_json(f"{normal}-replay.json")
-            for i in normal_replay["dragen_config"]:
-                if i["name"] in params:
-                    params[i["name"]] = i["value"]
+            source = {i["name"]: i["value"] for i in normal_replay["dragen_config"]}
         else:
             raise ValueError(f"Unable to get normal fastq parameters.")
-        for i in ["fastq-file1","fastq-file2"]:
-            if not os.path.isabs(params[i]):
+        # normal given either as single lane fastqs or as a fastq list
+        if FASTQ_LIST_KEYS["normal"][0] in source:
+            params = {i: None for i in FASTQ_LIST_KEYS["normal"]}
+        else:
+            params = {i: None for i in FASTQ_KEYS["normal"]}
+        for i in params:
+            if i in source:
+                params[i] = source[i]
+        for i in ["fastq-file1", "fastq-file2", "fastq-list"]:
+            if i in params and params[i] and not os.path.isabs(params[i]):
                 params[i] = os.path.normpath(os.path.join(os.path.dirname(normal),params[i]))
         for i in params:
             if params[i] == None:
                 raise ValueError(f"Missing option '{i}'")
+        # ora fastqs of a normal given as fastq list can't be seen from its name
+        if "ora-reference" in source:
+            params["ora-reference"] = source["ora-reference"]
         return params
 
-    def save_command(self, key:str, command:dict) -> None:
+    def save_command(self, key: str, command: Mapping) -> None:
         self.commands[key] = command
 
     def constructor(self, excel: dict) -> Optional[List[str]]:
-        self.profile = load_json(script_path("dragen_config.json"))["profile1"]
+        self.profile = load_profile("dragen_config.json")["profile1"]
         # load pre and post scripts
         scripts = self.profile.get("scripts")
         if excel.get("disable_scripts"):
@@ -155,7 +170,7 @@ class ConstructDragenPipeline(Flow):
             self.normals[
                 f"{excel[SH_SM_PROJ]}/{excel[SH_SAMPLE]}"
             ] = f"../{excel[SH_SAMPLE]}/{cmd_d['output-file-prefix']}"
-            cmd_d.update(add_options(excel[SH_OVERRIDE]))
+            cmd_d.push("overrides", add_options(excel[SH_OVERRIDE]))
             self.save_command(f"{excel[SH_SM_PROJ]}/{excel[SH_SAMPLE]}",cmd_d)
             final_str = dragen_cli(cmd=cmd_d, excel=excel, scripts=scripts)
             return [final_str]
@@ -168,7 +183,7 @@ class ConstructDragenPipeline(Flow):
                 logging.info(f"{excel[SHA_RTYPE]}: executing tumor_pipeline")
                 cmd_d = self.command_with_trim(excel, "tumor_pipeline")
                 self.add_cnv(excel, cmd_d)
-            cmd_d.update(add_options(excel[SH_OVERRIDE]))
+            cmd_d.push("overrides", add_options(excel[SH_OVERRIDE]))
             final_str = dragen_cli(cmd=cmd_d, excel=excel, scripts=scripts)
             return [final_str]
 
@@ -180,11 +195,16 @@ class ConstructDragenPipeline(Flow):
             if excel[SHA_NPATH]:
                 normal_prefix = normal_prefix + "/EXTERNAL"
                 self.normals[normal_prefix] = (f"{excel[SHA_NPATH]}/{excel[SH_NORMAL]}")
+                record = excel.get(SHA_NREG)
+                if record:
+                    # registered normal, parameters known without its replay
+                    self.normals[normal_prefix] = record["prefix"]
+                    self.save_command(normal_prefix, record["fastq"])
             if pipeline.startswith("umi"):
                 # step 1 alignment
                 logging.info(f"{excel[SHA_RTYPE]}: preparing {pipeline} alignment template")
                 cmd_d1 = self.umi_pipeline(excel, "tumor_alignment", True)
-                cmd_d1.update(add_options(excel[SH_OVERRIDE],OPT_T_ALIGN))
+                cmd_d1.push("overrides", add_options(excel[SH_OVERRIDE], OPT_T_ALIGN))
                 final_str1 = dragen_cli(
                     cmd=cmd_d1, excel=excel, postf="alignment", scripts=scripts
                 )
@@ -200,8 +220,8 @@ class ConstructDragenPipeline(Flow):
                 cmd_d2.add(base_cmd)
                 cmd_d2.add(pv_cmd)
                 cmd_d=cmd_d2.construct_commands()
-                cmd_d.update(self.check_liquid_tumor(excel, cmd_d))
-                cmd_d.update(add_options(excel[SH_OVERRIDE],OPT_T_ANALYSIS))
+                cmd_d.push("liquid", self.check_liquid_tumor(excel, cmd_d))
+                cmd_d.push("overrides", add_options(excel[SH_OVERRIDE], OPT_T_ANALYSIS))
                 final_str2 = dragen_cli(
                     cmd=cmd_d, excel=excel, postf="analysis", scripts=scripts,
                 )
@@ -212,9 +232,14 @@ class ConstructDragenPipeline(Flow):
                 cmd = self.command_with_trim(excel, "tumor_normal")
                 if self.add_cnv(excel, cmd):
                     self.sample_pon(normal_prefix, excel["dry_run"], excel["fastq_dir"], cmd)
-                cmd.update(self.check_liquid_tumor(excel, cmd))
-                cmd.update(add_options(excel[SH_OVERRIDE],OPT_T_ALIGN))
-                cmd.update(self.get_normal_params(normal_prefix))
+                cmd.push("liquid", self.check_liquid_tumor(excel, cmd))
+                cmd.push("overrides", add_options(excel[SH_OVERRIDE], OPT_T_ALIGN))
+                normal_params = self.get_normal_params(normal_prefix)
+                normal_params.update(ora_options(excel, self.profile, normal_params))
+                # removed keys must be in a layer below the ones set again
+                cmd.push("pairing")
+                drop_fastq_keys(cmd, "normal", "fastq-list" not in normal_params)
+                cmd.push("pairing", normal_params)
                 final_str = dragen_cli(cmd=cmd, excel=excel, scripts=scripts)
                 arg_string.append(final_str)
             return arg_string
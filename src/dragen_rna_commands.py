@@ -1,12 +1,14 @@
-import copy
 from src.utility.dragen_utility import (
     fastq_file,
+    fastq_list_options,
+    ora_options,
     set_fileprefix,
     set_rgid,
     set_rgism,
     get_ref_parameter,
+    template_params,
 )
-from .utility.commands import Commands
+from .utility.commands import Commands, OptionLayers
 
 
 class BaseDragenRnaCommand(Commands):
@@ -27,23 +29,27 @@ class BaseDragenRnaCommand(Commands):
             "RGSM-tumor": set_rgism(self.excel)
         }
 
-    def construct_commands(self) -> dict:
+    def construct_commands(self) -> OptionLayers:
         # get the arg from json config filie
-        cmd_dict = copy.deepcopy(self.template[self.seq_pipeline])
+        template = self.template[self.seq_pipeline]
         # get the dict that needs to be filled in at runtime
-        param_list = [i for i in cmd_dict if str(cmd_dict[i]).startswith("{")]
+        param_list = template_params(self.template, self.seq_pipeline)
         if len(param_list) == 0:
             raise RuntimeError("Someting went wrong with parsing template")
+        sample, reference = dict(), dict()
         for val in param_list:
             if val in self.arg_registry:
-                cmd_dict[val] = self.arg_registry.get(val)
+                value = sample[val] = self.arg_registry.get(val)
             else:
-                tmp = cmd_dict[val][1:-1]
-                cmd_dict[val] = get_ref_parameter(self.excel,self.template,tmp)
-            if cmd_dict[val] == "":
-                print(f"missing key '{val}' in registry or '{cmd_dict[val]}' in ref_parameters")
+                tmp = template[val][1:-1]
+                value = reference[val] = get_ref_parameter(self.excel,self.template,tmp)
+            if value == "":
+                print(f"missing key '{val}' in registry or '{value}' in ref_parameters")
                 continue
-        return cmd_dict
+        reference.update(ora_options(self.excel, self.template, sample))
+        cmd_dict = OptionLayers("template", template)
+        cmd_dict.push("sample", sample).push("reference", reference)
+        return fastq_list_options(self.excel, cmd_dict)
 
 
 class ExtraRnaCommands(Commands):
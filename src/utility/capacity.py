@@ -0,0 +1,240 @@
+import json
+import logging
+import os
+from pathlib import Path
+import shutil
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from .dragen_utility import has_outputs, ORA_EXT, SH_PARAM, SH_TARGET, SHA_SSFPATH
+from .executors import job_dependencies
+from .fastq_check import sample_fastqs
+from .fs_meta import Action, MOVE
+from .ref_batch import SubmitJob
+
+CAPACITY_MODES = ["defer", "reject"]
+HISTORY_NAME = ".dragenflow_capacity.json"
+# output bytes per fastq.gz byte, until history of the kind says otherwise
+OUTPUT_RATIO = {
+    "genome": 1.3,
+    "exome": 1.5,
+    "umi": 2.5,
+    "rna": 1.2,
+    "methylation": 2.0,
+}
+# ora files are about a quarter of the fastq.gz they were made of
+ORA_EXPANSION = 4.0
+# samples of a kind seen before their ratio replaces the default
+MIN_HISTORY = 3
+# part of each volume left free
+RESERVE = 0.05
+
+
+def pipeline_kind(excel: dict) -> str:
+    pipeline = excel[SH_PARAM]
+    if not pipeline:
+        pipeline = "exome" if excel.get(SH_TARGET) else "genome"
+    for kind in ["rna", "methylation", "umi"]:
+        if pipeline.startswith(kind):
+            return kind
+    return "exome" if pipeline == "exome" else "genome"
+
+
+def planned_sources(actions: Iterable[Action]) -> Dict[str, str]:
+    """Files of planned moves by the path they are moved to"""
+    return {
+        os.path.join(i.arg, os.path.basename(i.path)): i.path
+        for i in actions
+        if i.kind == MOVE
+    }
+
+
+def fastq_bytes(excel: dict, sources: Optional[Dict[str, str]] = None) -> int:
+    # as fastq.gz, reads not found count as nothing, a fastq still to be
+    # moved into the sample dir is measured where it is
+    total = 0.0
+    for _, fastq_f, path in sample_fastqs(excel):
+        if path is None:
+            continue
+        path = str(Path(path).absolute())
+        try:
+            size = os.path.getsize((sources or {}).get(path, path))
+        except OSError as err:
+            logging.warning(f"No size of {path}: {err}")
+            continue
+        total += size * ORA_EXPANSION if fastq_f.endswith(ORA_EXT) else size
+    return int(total)
+
+
+def output_bytes(sample_dir: str, skip: Set[str]) -> int:
+    # everything written to a sample dir but its fastqs and logs
+    total = 0
+    for root, dirs, files in os.walk(sample_dir):
+        if root == sample_dir and "logs" in dirs:
+            dirs.remove("logs")
+        for name in files:
+            if root == sample_dir and name in skip:
+                continue
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def volume_of(path: str) -> Tuple[int, str]:
+    """Device and mount point of the nearest existing dir of path"""
+    existing = Path(path).absolute()
+    while not existing.exists():
+        existing = existing.parent
+    dev = existing.stat().st_dev
+    mount = existing
+    while mount.parent != mount and mount.parent.stat().st_dev == dev:
+        mount = mount.parent
+    return dev, str(mount)
+
+
+def size_text(size: float) -> str:
+    for unit in ["B", "KiB", "MiB", "GiB"]:
+        if abs(size) < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TiB"
+
+
+class CapacityPlanner(object):
+    """
+    Output size of jobs against free space of the volumes they write to
+
+    A job is estimated from fastq bytes of its rows times the output ratio
+    of their pipeline kind. Sample dirs of the sheet that already ran are
+    measured into a history file, by default next to the sheet, and once a
+    kind has MIN_HISTORY samples its measured ratio is used. Jobs that don't
+    fit, and jobs waiting for them, are deferred to a later run, or with
+    mode reject the run stops before anything is submitted.
+    """
+
+    def __init__(self, mode: str = "defer", history_file: Optional[str] = None):
+        if mode not in CAPACITY_MODES:
+            raise ValueError(f"Unknown capacity mode '{mode}'")
+        self.mode = mode
+        self.history_file = history_file
+        self.history: Dict[str, list] = {}
+        # device and mount point of each sample dir written to
+        self.volumes: Dict[str, Tuple[int, str]] = {}
+        self.sources: Dict[str, str] = {}
+
+    def load_history(self, path: str) -> None:
+        try:
+            with open(path) as hf:
+                self.history = json.load(hf)
+        except FileNotFoundError:
+            self.history = {}
+        except (OSError, ValueError):
+            logging.warning(f"Ignoring unreadable capacity history {path}")
+            self.history = {}
+
+    def save_history(self, path: str) -> None:
+        tmp_file = f"{path}.tmp"
+        try:
+            with open(tmp_file, "w") as hf:
+                json.dump(self.history, hf, sort_keys=True)
+            os.replace(tmp_file, path)
+        except OSError as err:
+            logging.warning(f"Unable to write capacity history {path}: {err}")
+
+    def observe(self, rows: Sequence[dict], running: Set[str]) -> int:
+        """Measure sample dirs of rows that ran, but not ones in running"""
+        by_dir: Dict[str, List[dict]] = {}
+        for row in rows:
+            by_dir.setdefault(str(row["fastq_dir"]), []).append(row)
+        seen = 0
+        for sample_dir, dir_rows in by_dir.items():
+            # measured by an earlier run, not walked again
+            if sample_dir in running or sample_dir in self.history:
+                continue
+            if not all(has_outputs(i) for i in dir_rows):
+                continue
+            fastqs = sum(fastq_bytes(i) for i in dir_rows)
+            if not fastqs:
+                continue
+            skip = {f for row in dir_rows for _, f, _ in sample_fastqs(row)}
+            kind = pipeline_kind(dir_rows[0])
+            self.history[sample_dir] = [kind, fastqs, output_bytes(sample_dir, skip)]
+            seen += 1
+        return seen
+
+    def ratio(self, kind: str) -> float:
+        seen = [i for i in self.history.values() if i[0] == kind]
+        if len(seen) < MIN_HISTORY:
+            return OUTPUT_RATIO[kind]
+        return sum(i[2] for i in seen) / sum(i[1] for i in seen)
+
+    def estimate(self, job: SubmitJob) -> Dict[int, int]:
+        """Bytes a job writes per volume device"""
+        need: Dict[int, int] = {}
+        for data, _ in job.members:
+            dev = self.volumes[str(data["fastq_dir"])][0]
+            size = fastq_bytes(data, self.sources) * self.ratio(pipeline_kind(data))
+            need[dev] = need.get(dev, 0) + int(size)
+        return need
+
+    def fit(
+        self,
+        jobs: List[SubmitJob],
+        rows: Sequence[dict],
+        actions: Iterable[Action] = (),
+    ) -> List[SubmitJob]:
+        """
+        Jobs that fit on their volumes, in order, reporting per volume
+
+        Actions are the planned filesystem changes, fastqs they move are
+        measured at their source. Raises RuntimeError in reject mode if any
+        job does not fit.
+        """
+        if not jobs:
+            return jobs
+        self.sources = planned_sources(actions)
+        history_file = self.history_file or str(
+            Path(rows[0][SHA_SSFPATH]).absolute().parent / HISTORY_NAME
+        )
+        self.load_history(history_file)
+        running = {str(data["fastq_dir"]) for job in jobs for data, _ in job.members}
+        if self.observe(rows, running):
+            self.save_history(history_file)
+        self.volumes = {i: volume_of(i) for i in running}
+        budget: Dict[int, float] = {}
+        for dev, mount in set(self.volumes.values()):
+            usage = shutil.disk_usage(mount)
+            budget[dev] = usage.free - usage.total * RESERVE
+        mounts = dict(self.volumes.values())
+        needed = {dev: 0 for dev in budget}
+        counts = {dev: 0 for dev in budget}
+        deferred: Set[int] = set()
+        for i, (job, needs) in enumerate(zip(jobs, job_dependencies(jobs))):
+            need = self.estimate(job)
+            for dev, size in need.items():
+                needed[dev] += size
+            left = {dev: budget[dev] - size for dev, size in need.items()}
+            # a tumor can't run without its normal
+            if deferred.intersection(needs) or min(left.values()) < 0:
+                deferred.add(i)
+                continue
+            budget.update(left)
+            for dev in need:
+                counts[dev] += 1
+        lines = []
+        for dev, mount in sorted(mounts.items(), key=lambda i: i[1]):
+            free = shutil.disk_usage(mount).free
+            lines.append(
+                f"{mount}: {size_text(needed[dev])} needed, {size_text(free)} "
+                f"free, {counts[dev]} jobs fit"
+            )
+        lines.extend(f"Does not fit: {jobs[i].sample}" for i in sorted(deferred))
+        for line in lines:
+            logging.info(line)
+            print(line)
+        if deferred and self.mode == "reject":
+            raise RuntimeError(f"{len(deferred)} job(s) would fill their volume")
+        if deferred:
+            print(f"Deferred {len(deferred)} job(s) to a later run")
+        return [job for i, job in enumerate(jobs) if i not in deferred]
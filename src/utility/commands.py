@@ -1,10 +1,14 @@
 # from __future__ import annotations
 
 from abc import ABC, abstractmethod
-from typing import List
+from collections.abc import Mapping, MutableMapping
+from typing import Dict, Iterator, List, Optional, Tuple
 
 
 class Commands(ABC):
+    # layer name of the options in a composite
+    layer = "commands"
+
     @property
     def parent(self):
         return self._parent
@@ -33,10 +37,116 @@ class CompositeCommands(Commands):
     def is_composite(self) -> bool:
         return True
 
-    def construct_commands(self, *args) -> dict:
-        finale_commands = {}
+    def construct_commands(self, *args) -> "OptionLayers":
+        finale_commands = OptionLayers()
         for child in self._children:
             pipe_dict = child.construct_commands(*args)
-            finale_commands.update(pipe_dict)
+            finale_commands.push(child.layer, pipe_dict)
 
         return finale_commands
+
+
+# marks an option removed by an upper layer
+DELETED = object()
+
+
+class OptionLayers(MutableMapping):
+    """
+    Dragen options as named layers, e.g. template, reference, pairing,
+    liquid, trimming and overrides
+
+    Layers are kept as given, not copied, and upper layers win. Writes go to
+    a layer of our own on top, so a template section is never changed.
+    Options are in the order merging the layers with dict.update would give,
+    source() tells which layer set the value of an option.
+    """
+
+    def __init__(self, name: Optional[str] = None, options: Mapping = None) -> None:
+        self._layers: List[Tuple[str, Mapping, Optional[dict]]] = []
+        self._own: Optional[dict] = None
+        if name is not None:
+            self.push(name, options)
+
+    def push(self, name: str, options: Mapping = None) -> "OptionLayers":
+        """Add layer on top, an empty one of our own if no options given"""
+        if isinstance(options, OptionLayers):
+            # take over the layers of a command part
+            self._layers.extend(options._layers)
+            self._own = None
+            return self
+        layer = {} if options is None else options
+        self._layers.append((name, layer, None))
+        self._own = layer if options is None else None
+        return self
+
+    def replace_all(self, name: str, options: Mapping) -> "OptionLayers":
+        """Options replace all layers, unchanged values keep their source"""
+        sources = {}
+        for key, value in options.items():
+            same = key in self and self[key] == value
+            sources[key] = self.source(key) if same else name
+        self._layers = [(name, options, sources)]
+        self._own = None
+        return self
+
+    def _writable(self) -> dict:
+        if self._own is None:
+            self.push(self._layers[-1][0] if self._layers else "edits")
+        return self._own  # type: ignore
+
+    def __getitem__(self, key: str):
+        for _, layer, _ in reversed(self._layers):
+            if key in layer:
+                value = layer[key]
+                if value is DELETED:
+                    break
+                return value
+        raise KeyError(key)
+
+    def __contains__(self, key: object) -> bool:
+        try:
+            self[key]  # type: ignore
+        except KeyError:
+            return False
+        return True
+
+    def __setitem__(self, key: str, value) -> None:
+        own = self._writable()
+        if own.get(key) is DELETED:
+            # set again after removal goes last, like in a dict
+            self.push(self._layers[-1][0])
+            own = self._writable()
+        own[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        if key not in self:
+            raise KeyError(key)
+        self._writable()[key] = DELETED
+
+    def __iter__(self) -> Iterator[str]:
+        order: Dict[str, None] = {}
+        for _, layer, _ in self._layers:
+            for key, value in layer.items():
+                if value is DELETED:
+                    order.pop(key, None)
+                else:
+                    order.setdefault(key)
+        return iter(order)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def source(self, key: str) -> str:
+        """Name of the layer that set the value of key"""
+        for name, layer, sources in reversed(self._layers):
+            if key in layer:
+                if layer[key] is DELETED:
+                    break
+                return sources[key] if sources else name
+        raise KeyError(key)
+
+    def sources(self) -> Dict[str, str]:
+        return {key: self.source(key) for key in self}
+
+    def __repr__(self) -> str:
+        return f"OptionLayers({dict(self.items())})"
@@ -1,19 +1,28 @@
 import csv
 import errno
+import io
 import json
 import os
 from pathlib import Path
 import re
-import shutil
-from typing import List, Optional
+from typing import List, Mapping, MutableMapping, Optional, Tuple
 import logging
 
+from .commands import OptionLayers
+from .fs_meta import fs
+from .run_context import run_context
+
 # values for the samplesheet columns, SH_ for ones in file, SHA_ for added constructs
 SHA_INDEX = 'row_index'
 SHA_NPATH = "_normal_sample_path"
+SHA_NREG = "_normal_registry"
 SHA_SSFPATH = '_file_path'
 SHA_RTYPE = "_run_type"
 SHA_TRG_NAME = "_target_name"
+SHA_FPRINT = "_fingerprint"
+SHA_FPSTATE = "_fingerprint_state"
+# job id of an earlier submission still queued or running
+SHA_QUEUED = "_queued_job"
 SH_NORMAL = "matching_normal_sample"
 SH_OVERRIDE = "override"
 SH_PARAM = "pipeline_parameters"
@@ -29,6 +38,25 @@ OPTH_OPT = 'dragen option'
 OPTH_VALUE = 'option value'
 OPTH_SPEC = 'option specifier'
 
+# multi-lane samples, columns that must match to merge rows
+SHA_LANES = "_lanes"
+# runtime filled options per profile section, added by profile compile
+PROFILE_PARAMS = "_placeholders"
+MERGE_COLS = [SH_SM_PROJ, SH_SAMPLE, SH_PARAM, "RefGenome", SH_TUMOR, SH_NORMAL]
+FASTQ_KEYS = {
+    "normal": ["fastq-file1", "fastq-file2", "RGID", "RGSM"],
+    "tumor": ["tumor-fastq1", "tumor-fastq2", "RGID-tumor", "RGSM-tumor"],
+}
+FASTQ_LIST_KEYS = {
+    "normal": ["fastq-list", "fastq-list-sample-id"],
+    "tumor": ["tumor-fastq-list", "tumor-fastq-list-sample-id"],
+}
+FASTQ_LIST_HEADER = ["RGID", "RGSM", "RGLB", "Lane", "Read1File", "Read2File"]
+# fastq formats, ora ones need the ora reference of the genome to decompress
+FASTQ_EXT = "fastq.gz"
+ORA_EXT = "fastq.ora"
+ORA_REF = "ora_reference"
+
 def custom_sort(val: str) -> float:
     rank = 0.0
     if len(str(val)) > 1:
@@ -50,6 +78,15 @@ def script_path(filename: str) -> str:
     return os.path.join(config_path, filename)
 
 
+def template_params(template: dict, section: str) -> List[str]:
+    # options of section filled at runtime, precompiled in profile cache
+    compiled = template.get(PROFILE_PARAMS)
+    if compiled and section in compiled:
+        return compiled[section]
+    options = template[section]
+    return [i for i in options if str(options[i]).startswith("{")]
+
+
 def load_json(file: str = "config.json") -> dict:
     with open(file) as jf:
         configs = json.load(jf)
@@ -89,52 +126,187 @@ def create_fastq_dir(excel: list, dry_run: bool = False) -> List[dict]:
         sample_id = row[SH_SAMPLE] if row.get(SH_SAMPLE) else row["Sample_ID"]
         new_path = path.parent / row[SH_SM_PROJ] / sample_id
         if not dry_run:
-            new_path.mkdir(exist_ok=True)
+            fs.mkdir(new_path, exist_ok=True)
         row["fastq_dir"] = new_path
         row["dry_run"] = dry_run
     return excel
 
 
-def fastq_file(excel: dict, read_n: int, copy_file: bool = True) -> str:
+def fastq_name(excel: dict, read_n: int, ext: str = FASTQ_EXT) -> str:
     sample_name = excel["Sample_Name"]
     sample_number = excel[SHA_INDEX]
     lane_number = excel.get("Lane")
     if lane_number:
-        file_name = (
-            f"{sample_name}_S{sample_number}_L00{lane_number}_R{read_n}_001.fastq.gz"
-        )
-    else:
-        file_name = f"{sample_name}_S{sample_number}_R{read_n}_001.fastq.gz"
+        return f"{sample_name}_S{sample_number}_L00{lane_number}_R{read_n}_001.{ext}"
+    return f"{sample_name}_S{sample_number}_R{read_n}_001.{ext}"
+
+
+def fastq_ext(excel: dict) -> str:
+    # ora if read 1 of the sample is there as ora, in project or sample dir
+    if not excel.get("fastq_dir"):
+        return FASTQ_EXT
+    ora_f = fastq_name(excel, 1, ORA_EXT)
+    if any(fs.exists(i) for i in fastq_locations(excel, ora_f)):
+        return ORA_EXT
+    return FASTQ_EXT
+
+
+def fastq_file(excel: dict, read_n: int, copy_file: bool = True) -> str:
+    file_name = fastq_name(excel, read_n, fastq_ext(excel))
     if copy_file:
         move_fast_q(excel, file_name)
     return file_name
 
 
-def move_fast_q(excel: dict, fastq_f: str) -> None:
+def fastq_locations(excel: dict, fastq_f: str) -> Tuple[Path, Path]:
+    # fastq is either still in project dir or already moved to sample dir
     sample_sheet_path = Path(excel[SHA_SSFPATH]).absolute().parent
     path_to_fastq = sample_sheet_path / excel[SH_SM_PROJ] / fastq_f
+    final_fastq_path = Path(excel["fastq_dir"]) / fastq_f
+    return path_to_fastq, final_fastq_path
+
+
+def move_fast_q(excel: dict, fastq_f: str) -> None:
+    path_to_fastq, final_fastq_path = fastq_locations(excel, fastq_f)
     destination_of_fastq = Path(excel["fastq_dir"])
-    final_fastq_path = destination_of_fastq / fastq_f
     if excel["dry_run"]:
-        if not (path_to_fastq.exists() or final_fastq_path.exists()):
+        if not (fs.exists(path_to_fastq) or fs.exists(final_fastq_path)):
             raise FileNotFoundError(
                 errno.ENOENT, os.strerror(errno.ENOENT), str(path_to_fastq)
             )
         return
-    if path_to_fastq.exists():
+    if fs.exists(path_to_fastq):
         # in case if file already exist in destination
-        if not final_fastq_path.exists():
-            shutil.move(str(path_to_fastq), str(destination_of_fastq))
+        if not fs.exists(final_fastq_path):
+            fs.move(path_to_fastq, destination_of_fastq)
         log_path = destination_of_fastq / "logs"
-        if not log_path.exists():
-            os.mkdir(str(log_path))
-    elif not final_fastq_path.exists():
+        if not fs.exists(log_path):
+            fs.mkdir(log_path)
+    elif not fs.exists(final_fastq_path):
         print("")
         raise FileNotFoundError(
             errno.ENOENT, os.strerror(errno.ENOENT), str(path_to_fastq)
         )
 
 
+def merge_lanes(excel: List[dict]) -> List[dict]:
+    # rows of one sample on several lanes become one row with all lanes
+    merged = []
+    first_rows = dict()
+    for row in excel:
+        lane_count = run_context(row[SHA_SSFPATH]).lane_count
+        lane = str(row.get("Lane") or "")
+        if lane.isdigit() and lane_count and int(lane) > lane_count:
+            raise ValueError(
+                f"Lane {lane} of {row[SH_SAMPLE]} not on the {lane_count} lane flowcell"
+            )
+        if row[SH_PARAM] == "umi" or not row.get("Lane"):
+            # umi fastq can't be given in fastq list
+            merged.append(row)
+            continue
+        key = tuple(row.get(i) for i in MERGE_COLS)
+        first = first_rows.get(key)
+        if first is None:
+            first_rows[key] = row
+            merged.append(row)
+            continue
+        lanes = first.get(SHA_LANES) or [
+            (first["Lane"], first[SHA_INDEX], first["Sample_Name"])
+        ]
+        if row["Lane"] in [i[0] for i in lanes]:
+            # same lane twice is a duplicate row, not a lane split
+            merged.append(row)
+            continue
+        logging.info(f"merging lane {row['Lane']} of {row[SH_SAMPLE]}")
+        lanes.append((row["Lane"], row[SHA_INDEX], row["Sample_Name"]))
+        first[SHA_LANES] = lanes
+    return merged
+
+
+def lane_rows(excel: dict) -> List[dict]:
+    # one row per lane with lane specific fastq naming
+    if not excel.get(SHA_LANES):
+        return [excel]
+    rows = []
+    for lane, index, sample_name in excel[SHA_LANES]:
+        row = dict(excel)
+        row["Lane"] = lane
+        row[SHA_INDEX] = index
+        row["Sample_Name"] = sample_name
+        rows.append(row)
+    return rows
+
+
+def fastq_list(excel: dict, copy_file: bool = True) -> str:
+    # write dragen fastq list csv covering every lane of the sample
+    list_file = os.path.join(
+        excel["fastq_dir"], f"{set_fileprefix(excel)}_fastq_list.csv"
+    )
+    lines = [FASTQ_LIST_HEADER]
+    for row in lane_rows(excel):
+        read1 = fastq_file(row, 1, copy_file)
+        read2 = fastq_file(row, 2, copy_file)
+        lines.append(
+            [
+                set_rgid(row),
+                set_rgism(row),
+                set_rgism(row),
+                row["Lane"],
+                os.path.join(excel["fastq_dir"], read1),
+                os.path.join(excel["fastq_dir"], read2),
+            ]
+        )
+    if not excel["dry_run"] and fs.isdir(excel["fastq_dir"]):
+        content = io.StringIO()
+        csv.writer(content).writerows(lines)
+        fs.write_text(list_file, content.getvalue())
+    return list_file
+
+
+def drop_fastq_keys(cmd: MutableMapping, role: str, as_list: bool) -> None:
+    # remove either single fastq or fastq list options of normal/tumor role
+    keys = FASTQ_LIST_KEYS[role] if as_list else FASTQ_KEYS[role]
+    for key in keys:
+        cmd.pop(key, None)
+
+
+def fastq_list_options(excel: dict, cmd: Mapping) -> Mapping:
+    # replace single lane fastq and read group options with a fastq list
+    if not excel.get(SHA_LANES):
+        return cmd
+    list_file = None
+    new_cmd = dict()
+    for key, val in cmd.items():
+        for role, keys in FASTQ_KEYS.items():
+            if key not in keys:
+                continue
+            list_key, id_key = FASTQ_LIST_KEYS[role]
+            if list_key not in new_cmd:
+                if list_file is None:
+                    list_file = fastq_list(excel)
+                new_cmd[list_key] = os.path.basename(list_file)
+                new_cmd[id_key] = set_rgism(excel)
+            break
+        else:
+            new_cmd[key] = val
+    if isinstance(cmd, OptionLayers):
+        return cmd.replace_all("fastq list", new_cmd)
+    return new_cmd
+
+
+def ora_options(excel: dict, template: dict, options: Mapping) -> dict:
+    # ora reference for commands reading ora fastqs
+    if not any(str(i).endswith(ORA_EXT) for i in options.values()):
+        return {}
+    ora_ref = get_ref_parameter(excel, template, ORA_REF)
+    if not ora_ref:
+        raise ValueError(
+            f"No '{ORA_REF}' in ref_parameters of {excel['RefGenome']}, "
+            f"needed for ora fastqs of {excel['Sample_Name']}"
+        )
+    return {"ora-reference": ora_ref}
+
+
 def check_key(dct: dict, k: str, val: str) -> dict:
     if k in dct.keys():
         dct[k] = val
@@ -144,17 +316,31 @@ def check_key(dct: dict, k: str, val: str) -> dict:
 
 
 def dragen_cli(
-    cmd: dict, excel: dict, postf: str = "", scripts: Optional[dict] = None
+    cmd: Mapping, excel: dict, postf: str = "", scripts: Optional[dict] = None
 ) -> str:
     default_str = " ".join(f"--{key} {val}" for (key, val) in cmd.items())
     grun_name = f"dragen-{excel['Sample_Name']}"
     if postf:
         grun_name = f"dragen-{excel['Sample_Name']}-{postf}"
+    if isinstance(cmd, OptionLayers):
+        logging.info(f"{grun_name} option sources: {cmd.sources()}")
     dragen_cmd = f"dragen {default_str}"
     if scripts:
         dragen_cmd = f"{scripts['pre']}\ndragen {default_str}\n{scripts['post']}"
-    final_str = f"srun.py -n {grun_name} -L logs -q dragen.q -c '{dragen_cmd}'" # noqa: E501, B950
-    return final_str
+    return srun_cli(grun_name, dragen_cmd)
+
+
+def srun_cli(name: str, script: str) -> str:
+    return f"srun.py -n {name} -L logs -q dragen.q -c '{script}'"
+
+
+def flow_name(excel: dict) -> str:
+    # registered flow constructing commands of the row
+    if excel[SH_PARAM].startswith("rna"):
+        return "dragen_rna"
+    if excel[SH_PARAM].startswith("methylation"):
+        return "dragen_met"
+    return "dragen_dna"
 
 
 def infer_pipeline(pipeline: str) -> str:
@@ -163,11 +349,8 @@ def infer_pipeline(pipeline: str) -> str:
 
 
 def get_flow_cell(path: str) -> str:
-    path = os.path.abspath(path)
-    split_path = path.split("/")
-    flow_cell = split_path[-3]
-    flow_cell_id = flow_cell.split("_")[-1]
-    return flow_cell_id
+    # from RunInfo.xml or the run folder name, read once per sheet
+    return run_context(path).flowcell
 
 
 def basic_reader(path: str) -> list:
@@ -253,7 +436,8 @@ def is_between_0_1(test_str: str) -> bool:
     except ValueError:
         return False
 
-def run_type(excel: List[dict]) -> List[dict]:
+def run_type(excel: List[dict], registry=None) -> List[dict]:
+    # registry gives normals of earlier runs, see normal_registry.py
     for dt in excel:
         if dt[SH_PARAM] == "rna" or dt[SH_PARAM].startswith("methylation"):
             dt[SHA_RTYPE] = ""
@@ -274,7 +458,21 @@ def run_type(excel: List[dict]) -> List[dict]:
             sample_id = dt[SH_SAMPLE]
             normal_id = dt[SH_NORMAL]            
             sample_project = dt[SH_SM_PROJ]
-            if check_sample(excel, normal_id, sample_project, dt[SHA_NPATH]):
+            dt[SHA_NREG] = None
+            in_sheet = not dt[SHA_NPATH] and check_sample(
+                excel, normal_id, sample_project, ""
+            )
+            if not in_sheet and registry is not None:
+                dt[SHA_NREG] = registry.lookup(
+                    sample_project, normal_id, dt[SHA_NPATH]
+                )
+            if in_sheet:
+                dt[SHA_RTYPE] = "somatic_paired"
+            elif dt[SHA_NREG]:
+                # registered normal from earlier run, no need to look at its dir
+                dt[SHA_NPATH] = os.path.dirname(dt[SHA_NREG]["prefix"])
+                dt[SHA_RTYPE] = "somatic_paired"
+            elif check_sample(excel, normal_id, sample_project, dt[SHA_NPATH]):
                 dt[SHA_RTYPE] = "somatic_paired"
             else:
                 if dt[SHA_NPATH]:
@@ -307,10 +505,10 @@ def check_target(excel: dict, targets: dict) -> None:
 def check_sample(excel: List[dict], sample_id: str, sample_project: str, sample_dir:str) -> bool:
     # if given path, check that it exists and that there is bam file
     if sample_dir:
-        if not os.path.isdir(sample_dir):
+        if not fs.isdir(sample_dir):
             return False
         pref = os.path.basename(sample_dir)
-        if os.path.isfile(os.path.join(sample_dir, pref + ".bam")):
+        if fs.isfile(os.path.join(sample_dir, pref + ".bam")):
             return True
         return False
     # some implicit assumption here that needs to be rechecked
@@ -329,6 +527,38 @@ def sort_list(excel: List[dict], sorting_col: str = SHA_RTYPE) -> List[dict]:
     return sorted_list
 
 
+def render_groups(
+    excel: List[dict], indices: List[int], with_normals: bool = False
+) -> List[List[int]]:
+    # rows sharing sample dir or normal must be constructed in order together
+    # with_normals also joins paired tumors with their normal in the sheet
+    owner: dict = dict()
+    parent = {i: i for i in indices}
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i in indices:
+        row = excel[i]
+        keys = [str(row["fastq_dir"]), f"{row[SH_SM_PROJ]}/{row[SH_SAMPLE]}"]
+        paired = with_normals and row.get(SHA_RTYPE) == "somatic_paired"
+        if row.get(SHA_NPATH) or paired:
+            # external normal is registered in pipeline while constructing
+            keys.append(f"{row[SH_SM_PROJ]}/{row[SH_NORMAL]}")
+        for key in keys:
+            if key in owner:
+                parent[find(i)] = find(owner[key])
+            else:
+                owner[key] = i
+    groups: dict = dict()
+    for i in indices:
+        groups.setdefault(find(i), []).append(i)
+    return list(groups.values())
+
+
 def add_samplesheet_cols(excel:dict, add_cols:list=None, text_dir:str=None) -> None:
     # add given columns as json file into dir
     data = dict()
@@ -340,40 +570,53 @@ def add_samplesheet_cols(excel:dict, add_cols:list=None, text_dir:str=None) -> N
         if i in excel:
             data[i] = excel[i]
     # if not sample dir at this point, then dryrun ... don't do anything'
-    if not os.path.isdir(excel["fastq_dir"]):
+    if not fs.isdir(excel["fastq_dir"]):
         return
     # write dir/text.json
-    if not os.path.isdir(text_dir):
-        os.mkdir(text_dir)
-    with open(outfile, 'w') as fs:
-        json.dump(data,fs,sort_keys=True)
+    if not fs.isdir(text_dir):
+        fs.mkdir(text_dir)
+    fs.write_text(outfile, json.dumps(data,sort_keys=True))
 
 
-def check_has_run(excel:dict) -> bool:
-    # check if sample command has executed: first find jobfiles
+def job_prefixes(excel:dict) -> Optional[List[str]]:
+    # output prefixes of dragen commands in job files, None if no jobfiles
     jobfiles = []
     logs = f"{excel['fastq_dir']}/logs"
-    if not os.path.isdir(logs):
-        return False
-    for fn in os.listdir(logs):
+    if not fs.isdir(logs):
+        return None
+    for fn in fs.listdir(logs):
         if fn.endswith('.job'):
             jobfiles.append(fn)
     if len(jobfiles) == 0:
-        return False
-    # then check prefixes from commands
+        return None
     prefix = []
     for fn in jobfiles:
         with open(f"{logs}/{fn}", 'r') as jobf:
             for line in jobf.readlines():
                 if not line.startswith('dragen'):
                     continue
-                m = re.search('--output-file-prefix (\S+)',line)
+                m = re.search(r'--output-file-prefix (\S+)',line)
                 if not m:
                     continue
                 prefix.append(m.group(1))
+    return prefix
+
+
+def check_has_run(excel:dict) -> bool:
+    # a job submitted earlier and not finished yet counts as run
+    if excel.get(SHA_QUEUED):
+        return True
+    return has_outputs(excel)
+
+
+def has_outputs(excel:dict) -> bool:
+    # check if sample command has executed: first find jobfiles
+    prefix = job_prefixes(excel)
+    if prefix is None:
+        return False
     # finally check that all [prefix]-replay.json files exists
     for i in prefix:
-        if not os.path.isfile(f"{excel['fastq_dir']}/{i}-replay.json"):
+        if not fs.isfile(f"{excel['fastq_dir']}/{i}-replay.json"):
             return False
     return True
 
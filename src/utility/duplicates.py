@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+import re
+from typing import Dict, FrozenSet, List, Tuple
+
+from .dragen_utility import lane_rows, SHA_INDEX, set_rgid
+from .ref_batch import job_script, Row, sample_name
+
+Target = Tuple[str, str]
+
+
+def row_key(data: dict) -> str:
+    # everything of a sheet row but its index, a copy has its own
+    return json.dumps(
+        {k: v for k, v in data.items() if k != SHA_INDEX},
+        sort_keys=True,
+        default=str,
+    )
+
+
+def drop_copies(rows: List[dict]) -> Tuple[List[dict], List[str]]:
+    """
+    Rows without copies of earlier ones, and lines about the copies
+
+    A copy differs from an earlier row only in its row index. It is left out
+    before anything is constructed, so none of its fastqs are moved and no
+    files written for it.
+    """
+    kept = []
+    lines = []
+    seen: Dict[str, dict] = {}
+    for data in rows:
+        key = row_key(data)
+        if key in seen:
+            lines.append(
+                f"Skipping {sample_name(data)} row {data[SHA_INDEX]}, same as "
+                f"row {seen[key][SHA_INDEX]}"
+            )
+            continue
+        seen[key] = data
+        kept.append(data)
+    return kept, lines
+
+
+def output_targets(data: dict, commands: List[str]) -> FrozenSet[Target]:
+    """Output dir and file prefix of each dragen line of the commands"""
+    targets = set()
+    for command in commands:
+        for line in (job_script(command) or command).splitlines():
+            prefix = re.search(r"--output-file-prefix (\S+)", line)
+            if not line.startswith("dragen") or prefix is None:
+                continue
+            out = re.search(r"--output-directory (\S+)", line)
+            out_dir = os.path.join(str(data["fastq_dir"]), out.group(1) if out else "")
+            targets.add((os.path.normpath(out_dir), prefix.group(1)))
+    return frozenset(targets)
+
+
+def command_fingerprint(data: dict, commands: List[str]) -> str:
+    # row index of the sheet is in fastq names and RGID, mask it so rows
+    # differing only in it compare equal
+    text = "\n".join(commands)
+    for row in lane_rows(data):
+        index = str(row[SHA_INDEX])
+        text = text.replace(set_rgid(row), set_rgid(dict(row, **{SHA_INDEX: "#"})))
+        text = text.replace(f"_S{index}_", "_S#_")
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def drop_same_outputs(
+    submissions: List[Row],
+) -> Tuple[List[Row], List[Row], List[str]]:
+    """
+    Submissions without the ones repeating an earlier one, those left out and
+    lines about both
+
+    A later row writing an output of an earlier row with the same commands
+    but for its row index would race it on the output dir, it is left out.
+    One writing it with other options, e.g. a lane of a sample not merged,
+    is a conflict and still submitted, its outputs are the ones left.
+    """
+    kept = []
+    dropped = []
+    lines = []
+    seen: Dict[Target, Tuple[dict, str]] = {}
+    for data, commands in submissions:
+        targets = output_targets(data, commands)
+        fingerprint = command_fingerprint(data, commands)
+        earlier = [(i, seen[i]) for i in sorted(targets) if i in seen]
+        same = [i for i in earlier if i[1][1] == fingerprint]
+        for (out_dir, prefix), (other, _) in (same or earlier)[:1]:
+            text = (
+                f"{sample_name(data)} row {data[SHA_INDEX]} writes {prefix} in "
+                f"{out_dir} like row {other[SHA_INDEX]}"
+            )
+            if same:
+                lines.append(f"Skipping {text} with the same options")
+            else:
+                lines.append(f"Conflict: {text} with other options")
+        if same:
+            dropped.append((data, commands))
+            continue
+        kept.append((data, commands))
+        for target in targets:
+            seen.setdefault(target, (data, fingerprint))
+    return kept, dropped, lines
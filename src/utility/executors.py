@@ -0,0 +1,435 @@
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+from pathlib import Path
+import shlex
+import signal
+import subprocess
+import threading
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .dragen_utility import SH_NORMAL, SH_SM_PROJ, SHA_NPATH, SHA_RTYPE, SHA_SSFPATH
+from .flow import FlowConstructor, JobResult
+from .fs_meta import fs
+from .job_monitor import (
+    COMPLETED,
+    FAILED,
+    FINISHED,
+    parse_job_id,
+    PENDING,
+    RUNNING,
+    SlurmScheduler,
+)
+from .ref_batch import job_script, prepare_job, sample_name, srun_option, SubmitJob
+from .submit_control import SubmitController
+
+EXECUTORS = ["srun", "sbatch-array", "local"]
+ARRAY_DIR = "dragen_arrays"
+
+
+def job_dependencies(jobs: Sequence[SubmitJob]) -> List[List[int]]:
+    """
+    Earlier jobs each job has to wait for
+
+    A job waits for the last earlier job of one of its samples, so rows of a
+    sample dir run in sheet order, and a paired tumor for the job of its
+    normal when that is in the sheet.
+    """
+    last: Dict[str, int] = {}
+    deps = []
+    for i, job in enumerate(jobs):
+        needs = set()
+        for data, _ in job.members:
+            keys = [sample_name(data)]
+            if data.get(SHA_RTYPE) == "somatic_paired" and not data.get(SHA_NPATH):
+                keys.append(f"{data[SH_SM_PROJ]}/{data[SH_NORMAL]}")
+            needs.update(last[key] for key in keys if key in last)
+        for data, _ in job.members:
+            last[sample_name(data)] = i
+        deps.append(sorted(needs))
+    return deps
+
+
+def dependency_waves(jobs: Sequence[SubmitJob]) -> List[int]:
+    # wave of a job is one after the last wave it waits for
+    waves: List[int] = []
+    for needs in job_dependencies(jobs):
+        waves.append(max((waves[i] + 1 for i in needs), default=0))
+    return waves
+
+
+class Executor(ABC):
+    """
+    Runs the commands of planned jobs
+
+    prepare() gets all jobs while the plan is recorded, submit() is then
+    called for each job in plan order and finish() once at the end. The
+    scheduler answers a JobMonitor about job ids of the results.
+    """
+
+    # job files for check_has_run, srun.py writes them itself
+    writes_jobfiles = True
+    # jobs run by us, a result only tells the job was started, finish()
+    # waits for them and the scheduler gives their end state
+    runs_jobs = False
+
+    def __init__(self) -> None:
+        self.scheduler = SlurmScheduler()
+
+    def prepare(self, jobs: Sequence[SubmitJob]) -> None:
+        for job in jobs:
+            prepare_job(job, self.writes_jobfiles)
+
+    @abstractmethod
+    def submit(
+        self, job: SubmitJob, controller: SubmitController
+    ) -> Iterator[JobResult]:
+        pass
+
+    def finish(self) -> List[str]:
+        """Wait for jobs run by us, returns lines describing failures"""
+        return []
+
+
+class SrunExecutor(Executor):
+    """Commands run as rendered, given to srun.py, or printed with echo"""
+
+    writes_jobfiles = False
+
+    def __init__(self, bash_cmd: str = "echo", timeout: Optional[float] = None):
+        super().__init__()
+        self.bash_cmd = bash_cmd
+        self.timeout = timeout
+
+    def execute_one(
+        self, wd_path: str, str_command: str, log_prefix: str
+    ) -> JobResult:
+        timed_out = False
+        try:
+            output, arglist = FlowConstructor.execute_flow(
+                command=str_command,
+                base_cmd=self.bash_cmd,
+                wd_path=wd_path,
+                timeout=self.timeout,
+                log_prefix=log_prefix,
+            )
+            returncode = output.returncode
+            logging.info(f"Executed command: {arglist}")
+        except subprocess.TimeoutExpired:
+            # child is killed by now, carry on with next sample
+            timed_out = True
+            returncode = -signal.SIGKILL
+            logging.error(f"Timeout after {self.timeout}s: {str_command}")
+        logging.info(f"Return code: {returncode}")
+        return JobResult(
+            returncode,
+            f"{log_prefix}.out",
+            f"{log_prefix}.err",
+            timed_out,
+            wd_path,
+            str_command,
+        )
+
+    def submit(
+        self, job: SubmitJob, controller: SubmitController
+    ) -> Iterator[JobResult]:
+        """Run submit commands of one job, output streamed to its logs dir"""
+        logs = os.path.join(job.wd_path, "logs")
+        for i, str_command in enumerate(job.commands, 1):
+            log_prefix = os.path.join(logs, f"{job.log_key}_submit{i}")
+            yield controller.submit(
+                lambda: self.execute_one(job.wd_path, str_command, log_prefix),
+                job.sample,
+            )
+
+
+def array_script(jobs: Sequence[SubmitJob]) -> str:
+    """Array task i runs the commands of job i in its dir, stops at a failure"""
+    lines = ["#!/bin/bash", 'case "$SLURM_ARRAY_TASK_ID" in']
+    for task, job in enumerate(jobs):
+        log = shlex.quote(f"logs/{job.log_key}_array")
+        steps = " && ".join(f"(\n{job_script(i) or i}\n)" for i in job.commands)
+        lines.extend(
+            [
+                f"{task})",
+                f"cd {shlex.quote(job.wd_path)} || exit 1",
+                f"exec > {log}.out 2> {log}.err",
+                steps,
+                ";;",
+            ]
+        )
+    lines.append("esac")
+    return "\n".join(lines) + "\n"
+
+
+class SbatchArrayExecutor(Executor):
+    """
+    Jobs submitted with sbatch as job arrays
+
+    Jobs of a dependency wave waiting for the same jobs share an array, so
+    jobs waiting for no other job are one array. An array waits with afterok
+    for the tasks of exactly the jobs its jobs need, a failed sample only
+    holds back its own dependents, which slurm cancels. Scripts and submit
+    logs are in dragen_arrays next to the sheet, output of a task in
+    logs/<job>_array.out and .err of its job dir.
+    """
+
+    def __init__(
+        self,
+        sbatch: str = "sbatch",
+        max_running: int = 0,
+        timeout: Optional[float] = None,
+    ) -> None:
+        super().__init__()
+        self.sbatch = sbatch
+        self.max_running = max_running
+        self.timeout = timeout
+        self.array_dir = ""
+        self.arrays: List[List[SubmitJob]] = []
+        self._jobs: List[SubmitJob] = []
+        self._needs: List[List[int]] = []
+        self._task: Dict[int, Tuple[int, int]] = {}
+        self._submitted: Dict[int, JobResult] = {}
+
+    def script_path(self, array: int) -> str:
+        return os.path.join(self.array_dir, f"array{array}.sh")
+
+    def prepare(self, jobs: Sequence[SubmitJob]) -> None:
+        super().prepare(jobs)
+        if not jobs:
+            return
+        first = jobs[0].members[0][0]
+        self.array_dir = str(Path(first[SHA_SSFPATH]).absolute().parent / ARRAY_DIR)
+        self._jobs = list(jobs)
+        deps = job_dependencies(jobs)
+        waves = dependency_waves(jobs)
+        groups: Dict[Tuple[int, Tuple[int, ...]], int] = {}
+        # jobs by their index in the plan, needs of an array are job indexes
+        for i in sorted(range(len(jobs)), key=lambda i: waves[i]):
+            key = (waves[i], tuple(deps[i]))
+            if key not in groups:
+                groups[key] = len(self.arrays)
+                self.arrays.append([])
+                self._needs.append(deps[i])
+            array = groups[key]
+            self._task[id(jobs[i])] = (array, len(self.arrays[array]))
+            self.arrays[array].append(jobs[i])
+        for path in [self.array_dir, os.path.join(self.array_dir, "logs")]:
+            if not fs.isdir(path):
+                fs.mkdir(path)
+        for array, array_jobs in enumerate(self.arrays):
+            fs.write_text(self.script_path(array), array_script(array_jobs))
+
+    def sbatch_args(self, array: int, after: Sequence[str]) -> List[str]:
+        jobs = self.arrays[array]
+        tasks = f"0-{len(jobs) - 1}"
+        if self.max_running > 0:
+            tasks = f"{tasks}%{self.max_running}"
+        args = shlex.split(self.sbatch) + [
+            "-J",
+            f"dragenflow-array{array}",
+            f"--array={tasks}",
+            "-o",
+            f"logs/array{array}_%a.out",
+        ]
+        queue = srun_option(jobs[0].commands[0], "-q")
+        if queue:
+            args.extend(["-p", queue])
+        if after:
+            args.append(f"--dependency=afterok:{':'.join(after)}")
+            # dependents of a failed task are cancelled, not left pending
+            args.append("--kill-on-invalid-dep=yes")
+        args.append(self.script_path(array))
+        return args
+
+    def submit_array(self, array: int, after: Sequence[str]) -> JobResult:
+        command = " ".join(shlex.quote(i) for i in self.sbatch_args(array, after))
+        log_prefix = os.path.join(self.array_dir, "logs", f"array{array}_submit")
+        return SrunExecutor(command, self.timeout).execute_one(
+            self.array_dir, command, log_prefix
+        )
+
+    def array_id(self, array: int) -> Optional[str]:
+        result = self._submitted[array]
+        if result.returncode != 0:
+            return None
+        with open(result.stdout_log) as out:
+            return parse_job_id(out.read())
+
+    def not_submitted(self, array: int, missing: SubmitJob) -> JobResult:
+        # no id of a job waited for, submitting without it would run too early
+        log_prefix = os.path.join(self.array_dir, "logs", f"array{array}_submit")
+        message = f"array {array} not submitted, no job id of {missing.sample}"
+        logging.error(message)
+        with open(f"{log_prefix}.out", "w"), open(f"{log_prefix}.err", "w") as err:
+            err.write(f"{message}\n")
+        return JobResult(
+            -1, f"{log_prefix}.out", f"{log_prefix}.err", False, self.array_dir, ""
+        )
+
+    def task_id(self, job: SubmitJob) -> Optional[str]:
+        # job id of the array task running a job, None if not submitted
+        array, task = self._task[id(job)]
+        if array not in self._submitted:
+            return None
+        array_id = self.array_id(array)
+        return f"{array_id}_{task}" if array_id else None
+
+    def submit(
+        self, job: SubmitJob, controller: SubmitController
+    ) -> Iterator[JobResult]:
+        array, task = self._task[id(job)]
+        if array not in self._submitted:
+            needed = [self._jobs[i] for i in self._needs[array]]
+            after = [self.task_id(i) for i in needed]
+            if None in after:
+                missing = needed[after.index(None)]
+                self._submitted[array] = self.not_submitted(array, missing)
+            else:
+                self._submitted[array] = controller.submit(
+                    lambda: self.submit_array(array, after),  # type: ignore
+                    f"array {array}",
+                )
+        result = self._submitted[array]
+        yield result._replace(wd_path=job.wd_path, job_id=self.task_id(job) or "")
+
+
+class LocalExecutor(Executor):
+    """
+    Jobs run as processes on this host, at most max_running at a time
+
+    A job starts when the jobs it waits for finished, if one of them failed
+    it fails without running. Commands of a job run one after another in
+    its dir, output goes to logs/<job>_local.out and .err there. Answers the
+    status queries of a JobMonitor in place of a scheduler.
+    """
+
+    runs_jobs = True
+
+    def __init__(self, max_running: int = 1, shell: str = "bash") -> None:
+        self.scheduler = self
+        self.max_running = max(1, max_running)
+        self.shell = shell
+        self.jobs: Dict[str, SubmitJob] = {}
+        self.states: Dict[str, str] = {}
+        self.returncodes: Dict[str, int] = {}
+        self._ids: Dict[int, str] = {}
+        self._deps: Dict[str, List[str]] = {}
+        self._waiting: List[str] = []
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._changed = threading.Condition()
+
+    def prepare(self, jobs: Sequence[SubmitJob]) -> None:
+        super().prepare(jobs)
+        ids = [f"local{i}" for i in range(1, len(jobs) + 1)]
+        for job_id, job, needs in zip(ids, jobs, job_dependencies(jobs)):
+            self._ids[id(job)] = job_id
+            self._deps[job_id] = [ids[i] for i in needs]
+
+    def log_prefix(self, job_id: str) -> str:
+        job = self.jobs[job_id]
+        return os.path.join(job.wd_path, "logs", f"{job.log_key}_local")
+
+    def submit(
+        self, job: SubmitJob, controller: SubmitController
+    ) -> Iterator[JobResult]:
+        job_id = self._ids[id(job)]
+        with self._changed:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_running)
+            self.jobs[job_id] = job
+            self.states[job_id] = PENDING
+            self._waiting.append(job_id)
+            self._start_ready()
+        log_prefix = self.log_prefix(job_id)
+        yield JobResult(
+            0,
+            f"{log_prefix}.out",
+            f"{log_prefix}.err",
+            False,
+            job.wd_path,
+            "\n".join(job.commands),
+            job_id,
+        )
+
+    def _start_ready(self) -> None:
+        # called with lock held, a failed job can make others fail in turn
+        changed = True
+        while changed:
+            changed = False
+            for job_id in list(self._waiting):
+                deps = [self.states.get(i) for i in self._deps[job_id]]
+                if any(i not in FINISHED for i in deps):
+                    continue
+                self._waiting.remove(job_id)
+                changed = True
+                if FAILED in deps:
+                    with open(f"{self.log_prefix(job_id)}.err", "w") as err:
+                        err.write("not run, a job it waits for failed\n")
+                    self.returncodes[job_id] = -1
+                    self.states[job_id] = FAILED
+                    continue
+                self.states[job_id] = RUNNING
+                self._pool.submit(self._run, job_id)  # type: ignore
+
+    def _run(self, job_id: str) -> None:
+        job = self.jobs[job_id]
+        log_prefix = self.log_prefix(job_id)
+        returncode = -1
+        try:
+            with open(f"{log_prefix}.out", "w") as out, open(
+                f"{log_prefix}.err", "w"
+            ) as err:
+                for command in job.commands:
+                    script = job_script(command) or command
+                    returncode = subprocess.run(
+                        [self.shell, "-c", script],
+                        cwd=job.wd_path,
+                        stdout=out,
+                        stderr=err,
+                    ).returncode
+                    if returncode != 0:
+                        break
+        except OSError as error:
+            logging.error(f"{job.sample}: local job failed to run: {error}")
+        logging.info(f"{job.sample}: local job {job_id} return code {returncode}")
+        with self._changed:
+            self.returncodes[job_id] = returncode
+            self.states[job_id] = COMPLETED if returncode == 0 else FAILED
+            self._start_ready()
+            self._changed.notify_all()
+
+    def status(self, job_ids: Sequence[str]) -> Dict[str, str]:
+        with self._changed:
+            return {i: self.states[i] for i in job_ids if i in self.states}
+
+    def finish(self) -> List[str]:
+        with self._changed:
+            self._changed.wait_for(
+                lambda: all(i in FINISHED for i in self.states.values())
+            )
+        if self._pool is not None:
+            self._pool.shutdown()
+        return [
+            f"Failed {self.jobs[i].sample}: return code {self.returncodes[i]}, "
+            f"see {self.log_prefix(i)}.err"
+            for i in self.jobs
+            if self.states[i] == FAILED
+        ]
+
+
+def make_executor(
+    name: str,
+    bash_cmd: str = "echo",
+    timeout: Optional[float] = None,
+    max_running: int = 0,
+) -> Executor:
+    """Executor of given name, max_running of 0 is the default of each"""
+    if name == "srun":
+        return SrunExecutor(bash_cmd, timeout)
+    if name == "sbatch-array":
+        return SbatchArrayExecutor(max_running=max_running, timeout=timeout)
+    if name == "local":
+        return LocalExecutor(max_running or 1)
+    raise ValueError(f"Unknown executor '{name}', one of {', '.join(EXECUTORS)}")
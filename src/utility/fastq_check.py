@@ -0,0 +1,254 @@
+from concurrent.futures import ProcessPoolExecutor
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import zlib
+
+from .dragen_utility import (
+    fastq_file,
+    fastq_locations,
+    lane_rows,
+    ORA_EXT,
+    SH_PARAM,
+    SH_SAMPLE,
+    SH_SM_PROJ,
+    SHA_SSFPATH,
+)
+from .fs_meta import fs
+from .run_context import run_context
+
+GZIP_MAGIC = b"\x1f\x8b\x08"
+# how much is read/decompressed per probe
+BLOCK_SIZE = 64 * 1024
+# window at the end of file searched for the last gzip member
+TAIL_WINDOW = 1024 * 1024
+# smaller/larger mate file size ratio that is still considered plausible
+MIN_PAIR_RATIO = 0.5
+CACHE_NAME = ".fastq_preflight.json"
+# magic occurrences tried per sampled window before falling back to full pass
+MAX_CANDIDATES = 8
+
+
+def _probe_member(fh, offset: int, to_eof: bool = False) -> bool:
+    # decompress from offset, either one block or every member until EOF
+    fh.seek(offset)
+    if not to_eof:
+        dobj = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            dobj.decompress(fh.read(BLOCK_SIZE), BLOCK_SIZE)
+        except zlib.error:
+            return False
+        return True
+    dobj = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    while True:
+        chunk = fh.read(BLOCK_SIZE)
+        if not chunk:
+            # all input used, valid only if last member got its trailer
+            return dobj.eof
+        while chunk:
+            if dobj.eof:
+                # next member of a multi-member file
+                dobj = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            # keep output bounded, output itself is not needed
+            dobj.decompress(chunk, BLOCK_SIZE)
+            chunk = dobj.unconsumed_tail or dobj.unused_data
+
+
+def _probe_window(fh, offset: int, window: bytes) -> bool:
+    # magic bytes also occur inside deflate data, try each candidate
+    pos = window.find(GZIP_MAGIC)
+    if pos < 0:
+        return True
+    for _ in range(MAX_CANDIDATES):
+        if pos < 0:
+            break
+        if _probe_member(fh, offset + pos):
+            return True
+        pos = window.find(GZIP_MAGIC, pos + 1)
+    return False
+
+
+def _check_tail(fh, size: int) -> bool:
+    # last member must end with a complete trailer exactly at EOF
+    start = max(0, size - TAIL_WINDOW)
+    fh.seek(start)
+    window = fh.read()
+    pos = window.rfind(GZIP_MAGIC)
+    while pos >= 0:
+        try:
+            if _probe_member(fh, start + pos, to_eof=True):
+                return True
+        except zlib.error:
+            pass
+        pos = window.rfind(GZIP_MAGIC, 0, pos)
+    if start == 0:
+        return False
+    # single large member, only way to verify is a full pass
+    return _probe_member(fh, 0, to_eof=True)
+
+
+def check_gzip(path: str, sample_blocks: int = 4) -> str:
+    """
+    Check gzip header, a sample of blocks and the trailer at EOF
+
+    Returns an empty string for a valid file, else the reason of failure.
+    """
+    try:
+        size = os.path.getsize(path)
+        if size == 0:
+            return "empty file"
+        with open(path, "rb") as fh:
+            if fh.read(3) != GZIP_MAGIC:
+                return "not a gzip file"
+            if not _probe_member(fh, 0):
+                return "corrupt first block"
+            # members starting after evenly spaced offsets
+            for i in range(1, sample_blocks + 1):
+                offset = size * i // (sample_blocks + 1)
+                fh.seek(offset)
+                window = fh.read(BLOCK_SIZE)
+                if _probe_window(fh, offset, window):
+                    continue
+                # candidates may all be inside one member, a full pass decides
+                if not _probe_member(fh, 0, to_eof=True):
+                    return f"corrupt block near byte {offset}"
+                return ""
+            if not _check_tail(fh, size):
+                return "truncated file, no gzip trailer at EOF"
+    except zlib.error as err:
+        return f"corrupt data: {err}"
+    except OSError as err:
+        return f"unreadable: {err}"
+    return ""
+
+
+def check_fastq(path: str, sample_blocks: int = 4) -> str:
+    # ora is not gzip, only dragen can decompress it
+    if path.endswith(ORA_EXT):
+        try:
+            return "" if os.path.getsize(path) else "empty file"
+        except OSError as err:
+            return f"unreadable: {err}"
+    return check_gzip(path, sample_blocks)
+
+
+def sample_fastqs(excel: dict) -> List[Tuple[int, str, Optional[Path]]]:
+    # reads needed for sample, path is None if file not found
+    reads = [1, 2]
+    if excel[SH_PARAM] == "umi":
+        reads.append(3)
+    found = []
+    for row in lane_rows(excel):
+        for read_n in reads:
+            fastq_f = fastq_file(row, read_n, False)
+            path = None
+            for candidate in fastq_locations(row, fastq_f):
+                if fs.exists(candidate):
+                    path = candidate
+                    break
+            found.append((read_n, fastq_f, path))
+    return found
+
+
+def _file_key(path: Path) -> List[int]:
+    st = path.stat()
+    return [st.st_ino, st.st_size, st.st_mtime_ns]
+
+
+def load_cache(cache_file: Path) -> Dict[str, dict]:
+    if not cache_file.is_file():
+        return {}
+    try:
+        with open(cache_file) as cf:
+            return json.load(cf)
+    except (OSError, ValueError):
+        logging.warning(f"Ignoring unreadable preflight cache {cache_file}")
+        return {}
+
+
+def save_cache(cache_file: Path, cache: Dict[str, dict]) -> None:
+    tmp_file = cache_file.with_name(cache_file.name + ".tmp")
+    try:
+        with open(tmp_file, "w") as cf:
+            json.dump(cache, cf, sort_keys=True)
+        os.replace(tmp_file, cache_file)
+    except OSError as err:
+        logging.warning(f"Unable to write preflight cache {cache_file}: {err}")
+
+
+def mate_reads(excel: dict) -> Tuple[int, int]:
+    # umi samples have a short umi read between the mates, left out
+    if excel[SH_PARAM] != "umi":
+        return 1, 2
+    umi_n = run_context(excel[SHA_SSFPATH]).umi_read or 2
+    first, second = [i for i in [1, 2, 3] if i != umi_n]
+    return first, second
+
+
+def pair_problem(sizes: Dict[int, int], mates: Tuple[int, int] = (1, 2)) -> str:
+    # the two mates should be of roughly same size
+    first, second = mates
+    if first not in sizes or second not in sizes:
+        return ""
+    small, large = sorted([sizes[first], sizes[second]])
+    if large and small / large < MIN_PAIR_RATIO:
+        return (
+            f"R{first}/R{second} size mismatch "
+            f"({sizes[first]} vs {sizes[second]} bytes)"
+        )
+    return ""
+
+
+def preflight_fastq(
+    excel: List[dict], workers: Optional[int] = None, sample_blocks: int = 4
+) -> Dict[str, List[str]]:
+    """
+    Validate all fastq files of the sample sheet rows on a process pool
+
+    Results are cached next to the sample sheet keyed by inode, size and
+    mtime so unchanged files are not read again. Returns problems per sample.
+    """
+    if not excel:
+        return {}
+    cache_file = Path(excel[0][SHA_SSFPATH]).absolute().parent / CACHE_NAME
+    cache = load_cache(cache_file)
+    problems: Dict[str, List[str]] = {}
+    sample_files = {}
+    to_check = {}
+    for row in excel:
+        sample = f"{row[SH_SM_PROJ]}/{row[SH_SAMPLE]}"
+        problems.setdefault(sample, [])
+        sizes: Dict[int, int] = {}
+        for read_n, fastq_f, path in sample_fastqs(row):
+            if path is None:
+                problems[sample].append(f"R{read_n}: {fastq_f} not found")
+                continue
+            key = str(path)
+            file_key = _file_key(path)
+            sizes[read_n] = sizes.get(read_n, 0) + file_key[1]
+            sample_files.setdefault(sample, []).append((read_n, key))
+            cached = cache.get(key)
+            if cached is None or cached["key"] != file_key:
+                to_check[key] = file_key
+        mismatch = pair_problem(sizes, mate_reads(row))
+        if mismatch:
+            problems[sample].append(mismatch)
+    if to_check:
+        logging.info(f"preflight: checking {len(to_check)} fastq files")
+        paths = sorted(to_check)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(
+                check_fastq, paths, [sample_blocks] * len(paths), chunksize=4
+            )
+            for path, error in zip(paths, results):
+                cache[path] = {"key": to_check[path], "error": error}
+        save_cache(cache_file, cache)
+    for sample, files in sample_files.items():
+        for read_n, key in files:
+            if cache[key]["error"]:
+                problems[sample].append(
+                    f"R{read_n}: {os.path.basename(key)} {cache[key]['error']}"
+                )
+    return {sample: err for sample, err in problems.items() if err}
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import subprocess
+import time
+from typing import Dict, List, Optional, Tuple
+
+from .dragen_utility import (
+    load_json,
+    SH_OVERRIDE,
+    SH_PARAM,
+    SH_TARGET,
+    SHA_FPRINT,
+    SHA_FPSTATE,
+    SHA_INDEX,
+    SHA_QUEUED,
+    SHA_RTYPE,
+    SHA_SSFPATH,
+)
+from .job_monitor import FINISHED
+from .profile_cache import load_profile
+
+FINGERPRINT_FILE = "dragenflow_fingerprint.json"
+# row keys that don't change the rendered command
+IGNORED_KEYS = {"dry_run", SHA_FPRINT, SHA_FPSTATE, SHA_QUEUED}
+# profile sections used per run type of dna pipelines
+RUN_SECTIONS = {
+    "germline": ["normal_pipeline"],
+    "somatic_single": ["tumor_pipeline"],
+    "somatic_paired": ["tumor_normal", "tumor_alignment", "paired_variant_call"],
+}
+
+
+def resolved_profile(excel: dict) -> dict:
+    # profile sections and reference tables the row is rendered from
+    pipeline = excel[SH_PARAM]
+    if not pipeline:
+        pipeline = "exome" if excel[SH_TARGET] else "genome"
+    if pipeline.startswith("rna"):
+        profile = load_profile("dragen_rna.json")
+        sections = ["rna"]
+    elif pipeline.startswith("methylation"):
+        profile = load_profile("dragen_met.json")
+        sections = [pipeline]
+    else:
+        profile = load_profile("dragen_config.json")["profile1"]
+        run_sections = RUN_SECTIONS.get(excel[SHA_RTYPE], [])
+        sections = [f"{pipeline}_{i}" for i in run_sections]
+    resolved = {i: profile.get(i) for i in sections}
+    ref = excel.get("RefGenome")
+    for table, values in profile.get("ref_parameters", {}).items():
+        resolved[table] = values.get(ref)
+    for i in ["adapters", "scripts", "samplesheet"]:
+        resolved[i] = profile.get(i)
+    return resolved
+
+
+def override_content(excel: dict) -> str:
+    opt_file = excel.get(SH_OVERRIDE)
+    if not opt_file or not os.path.isfile(opt_file):
+        return ""
+    with open(opt_file, "rb") as optfs:
+        return hashlib.sha256(optfs.read()).hexdigest()
+
+
+def row_fingerprint(excel: dict, normal_fingerprint: str = "") -> str:
+    """
+    Fingerprint of everything a rendered command depends on
+
+    Covers the sample sheet row, resolved profile sections, override file
+    content and for paired samples the fingerprint of the normal.
+    """
+    row = {k: v for k, v in excel.items() if k not in IGNORED_KEYS}
+    if row.get(SHA_SSFPATH):
+        # same sheet given by a relative or an absolute path
+        row[SHA_SSFPATH] = os.path.abspath(row[SHA_SSFPATH])
+    content = {
+        "row": row,
+        "profile": resolved_profile(excel),
+        "override": override_content(excel),
+        "normal": normal_fingerprint,
+    }
+    encoded = json.dumps(content, sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def fingerprint_path(excel: dict) -> str:
+    return os.path.join(excel["fastq_dir"], "logs", FINGERPRINT_FILE)
+
+
+def fingerprint_key(excel: dict) -> str:
+    # several rows can share a sample dir, key them like their fastqs
+    return f"{excel['Sample_Name']}_S{excel[SHA_INDEX]}_L{excel.get('Lane', '')}"
+
+
+def _load_all(path: str) -> Dict[str, dict]:
+    if not os.path.isfile(path):
+        return {}
+    try:
+        return load_json(path)
+    except ValueError:
+        logging.warning(f"Ignoring unreadable fingerprint {path}")
+        return {}
+
+
+def load_fingerprint(excel: dict) -> Optional[dict]:
+    return _load_all(fingerprint_path(excel)).get(fingerprint_key(excel))
+
+
+def save_fingerprint(
+    excel: dict, fingerprint: str, commands: List[str], job_id: str = ""
+) -> None:
+    # stored with the submission, prefixes allow finding stale outputs later
+    # and the job id whether the row still runs
+    prefixes = []
+    for cmd in commands:
+        prefixes.extend(re.findall(r"--output-file-prefix (\S+)", cmd))
+    path = fingerprint_path(excel)
+    data = _load_all(path)
+    data[fingerprint_key(excel)] = {
+        "fingerprint": fingerprint,
+        "prefixes": prefixes,
+        "submitted": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "job_id": job_id,
+    }
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as fs:
+        json.dump(data, fs, sort_keys=True)
+
+
+def stale_outputs(excel: dict, stored: dict) -> List[str]:
+    # outputs of an earlier submission that no longer match the sheet
+    stale = []
+    for prefix in stored.get("prefixes", []):
+        replay = os.path.join(excel["fastq_dir"], f"{prefix}-replay.json")
+        if os.path.isfile(replay):
+            stale.append(replay)
+    return stale
+
+
+def lost_rows(pending: List[Tuple[dict, str]], scheduler) -> List[dict]:
+    """
+    Rows submitted before, without outputs and whose job has finished
+
+    Takes rows with the job id stored with their fingerprint. A row without
+    job id, or with a job the scheduler doesn't report, might still run and
+    is kept. If the scheduler can't be asked all rows are kept.
+    """
+    job_ids = sorted({job_id for _, job_id in pending if job_id})
+    states: Dict[str, str] = {}
+    if job_ids and scheduler is not None:
+        try:
+            states = scheduler.status(job_ids)
+        except (OSError, subprocess.SubprocessError) as err:
+            logging.warning(f"No job states, unfinished rows kept: {err}")
+            return []
+    return [data for data, job_id in pending if states.get(job_id) in FINISHED]
@@ -2,7 +2,20 @@ from abc import ABC, abstractmethod
 from pathlib import Path
 import shlex
 import subprocess
-from typing import List
+from typing import List, NamedTuple
+
+
+class JobResult(NamedTuple):
+    """Outcome of one executed command, output is in the log files"""
+
+    returncode: int
+    stdout_log: str
+    stderr_log: str
+    timed_out: bool
+    wd_path: str
+    command: str
+    # id given by the executor, else read from stdout of the submitter
+    job_id: str = ""
 
 
 class FlowConstructor:
@@ -40,27 +53,42 @@ class FlowConstructor:
     def execute_flow(command: str, **kwargs) -> tuple:
         """
         Helper function applicable to all Flow (this is optional)
+
+        With log_prefix stdout and stderr are streamed to <log_prefix>.out and
+        <log_prefix>.err instead of kept in memory. subprocess.TimeoutExpired
+        is raised if timeout seconds pass, the command is killed by then.
         """
         base_cmd = kwargs.get("base_cmd")
         command = command
         wd_path = kwargs.get("wd_path", Path.cwd())
+        timeout = kwargs.get("timeout")
+        log_prefix = kwargs.get("log_prefix")
         if base_cmd == "echo":
             arg_list = ["echo", command]
+        else:
+            arg_list = shlex.split(command)
+        if log_prefix is None:
             output = subprocess.run(
                 arg_list,
                 universal_newlines=True,
                 stdout=subprocess.PIPE,
-                shell=False,
+                stderr=subprocess.PIPE,
                 cwd=wd_path,
+                shell=False,
+                timeout=timeout,
             )
-        else:
-            arg_list = shlex.split(command)
+            return (output, arg_list)
+        with open(f"{log_prefix}.out", "w") as out, open(
+            f"{log_prefix}.err", "w"
+        ) as err:
             output = subprocess.run(
                 arg_list,
                 universal_newlines=True,
-                stdout=subprocess.PIPE,
+                stdout=out,
+                stderr=err,
                 cwd=wd_path,
                 shell=False,
+                timeout=timeout,
             )
         return (output, arg_list)
 
@@ -0,0 +1,238 @@
+import contextlib
+import os
+import shutil
+import threading
+import time
+from typing import Dict, Hashable, Iterator, List, NamedTuple, Optional, Set, Union
+
+PathLike = Union[str, os.PathLike]
+DEFAULT_TTL = 30.0
+# entry types kept per directory listing
+FILE = "f"
+DIR = "d"
+OTHER = "o"
+# changes recorded while planning
+MKDIR = "mkdir"
+MOVE = "move"
+REMOVE = "remove"
+WRITE = "write"
+
+
+class Action(NamedTuple):
+    """A filesystem change, arg is destination dir of move or file content"""
+
+    kind: str
+    path: str
+    arg: str = ""
+
+
+class FsMeta(object):
+    """
+    Cached filesystem metadata
+
+    Questions about a path are answered from one listing of its parent
+    directory, so checking every fastq of a project dir costs a single
+    round trip. Listings are kept for ttl seconds, changes made through this
+    class update them in place.
+
+    Inside recording() changes are not made but collected as actions, the
+    listings then show the filesystem as if they were made and don't expire.
+    owners has for each action what it was recorded for, set with owner() by
+    the thread recording it, None if nothing was set.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_TTL) -> None:
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._listings: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self._actions: Optional[List[Action]] = None
+        self.owners: Dict[Action, Set[Optional[Hashable]]] = {}
+        self._local = threading.local()
+
+    def _scan(self, path: str) -> Optional[Dict[str, str]]:
+        # None if path is not a readable directory
+        try:
+            entries = {}
+            with os.scandir(path) as it:
+                for entry in it:
+                    if entry.is_dir():
+                        entries[entry.name] = DIR
+                    elif entry.is_file():
+                        entries[entry.name] = FILE
+                    else:
+                        entries[entry.name] = OTHER
+            return entries
+        except OSError:
+            return None
+
+    def _listing(self, path: str) -> Optional[Dict[str, str]]:
+        now = time.monotonic()
+        with self._lock:
+            cached = self._listings.get(path)
+            if cached is not None and (
+                self._actions is not None or now - cached[0] < self.ttl
+            ):
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+        # scan outside of lock, other threads keep using cached listings
+        entries = self._scan(path)
+        with self._lock:
+            self._listings[path] = (time.monotonic(), entries)
+        return entries
+
+    def _kind(self, path: PathLike) -> Optional[str]:
+        path = os.path.abspath(path)
+        parent, name = os.path.split(path)
+        if not name:
+            # filesystem root
+            return DIR if os.path.isdir(path) else None
+        entries = self._listing(parent)
+        if entries is None:
+            return None
+        return entries.get(name)
+
+    def _note(self, path: PathLike, kind: Optional[str]) -> None:
+        # keep cached parent listing in line with a change we made
+        path = os.path.abspath(path)
+        parent, name = os.path.split(path)
+        if self._actions is not None:
+            # planned change must show even if parent was not listed yet
+            self._listing(parent)
+        with self._lock:
+            cached = self._listings.get(parent)
+            if cached is None or cached[1] is None:
+                return
+            if kind is None:
+                cached[1].pop(name, None)
+            else:
+                cached[1][name] = kind
+            if kind == DIR and self._actions is not None:
+                # planned dir, nothing in it yet
+                self._listings[path] = (time.monotonic(), {})
+                return
+        if kind == DIR:
+            self.invalidate(path)
+
+    def _record(self, action: Action) -> bool:
+        # True if action was recorded instead of made
+        with self._lock:
+            if self._actions is None:
+                return False
+            self._actions.append(action)
+            self._own(action)
+            return True
+
+    def _own(self, action: Action) -> None:
+        # called with lock held
+        owner = getattr(self._local, "owner", None)
+        self.owners.setdefault(action, set()).add(owner)
+
+    def exists(self, path: PathLike) -> bool:
+        return self._kind(path) is not None
+
+    def isfile(self, path: PathLike) -> bool:
+        return self._kind(path) == FILE
+
+    def isdir(self, path: PathLike) -> bool:
+        return self._kind(path) == DIR
+
+    def listdir(self, path: PathLike) -> List[str]:
+        entries = self._listing(os.path.abspath(path))
+        if entries is None:
+            raise FileNotFoundError(f"No such directory: '{path}'")
+        return sorted(entries)
+
+    def mkdir(self, path: PathLike, exist_ok: bool = False) -> None:
+        if self._actions is not None and self.isdir(path):
+            if not exist_ok:
+                raise FileExistsError(f"Directory exists: '{path}'")
+            with self._lock:
+                # a planned dir is needed by this owner too
+                planned = Action(MKDIR, os.path.abspath(path))
+                if planned in self.owners:
+                    self._own(planned)
+            return
+        if not self._record(Action(MKDIR, os.path.abspath(path))):
+            try:
+                os.mkdir(path)
+            except FileExistsError:
+                if not exist_ok:
+                    raise
+        self._note(path, DIR)
+
+    def move(self, src: PathLike, dst_dir: PathLike) -> None:
+        action = Action(MOVE, os.path.abspath(src), os.path.abspath(dst_dir))
+        if not self._record(action):
+            shutil.move(str(src), str(dst_dir))
+        self._note(src, None)
+        self._note(os.path.join(dst_dir, os.path.basename(src)), FILE)
+
+    def remove(self, path: PathLike) -> None:
+        if not self._record(Action(REMOVE, os.path.abspath(path))):
+            os.remove(path)
+        self._note(path, None)
+
+    def write_text(self, path: PathLike, content: str) -> None:
+        if not self._record(Action(WRITE, os.path.abspath(path), content)):
+            with open(path, "w", newline="") as wf:
+                wf.write(content)
+        self._note(path, FILE)
+
+    def touched(self, path: PathLike) -> None:
+        """Record a file written without going through this class"""
+        self._note(path, FILE)
+
+    @contextlib.contextmanager
+    def owner(self, key: Hashable) -> Iterator[None]:
+        """Changes recorded by this thread meanwhile are made for key"""
+        previous = getattr(self._local, "owner", None)
+        self._local.owner = key
+        try:
+            yield
+        finally:
+            self._local.owner = previous
+
+    @contextlib.contextmanager
+    def recording(self) -> Iterator[List[Action]]:
+        """Collect changes instead of making them, in the order they came"""
+        actions: List[Action] = []
+        with self._lock:
+            self._actions = actions
+            self.owners = {}
+        try:
+            yield actions
+        finally:
+            with self._lock:
+                self._actions = None
+            # listings show planned state, not what is on disk
+            self.invalidate()
+
+    def invalidate(self, path: Optional[PathLike] = None) -> None:
+        with self._lock:
+            if path is None:
+                self._listings.clear()
+            else:
+                self._listings.pop(os.path.abspath(path), None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "cached_dirs": len(self._listings),
+            }
+
+
+# shared by the utility functions of one invocation
+fs = FsMeta()
+
+
+def configure(ttl: float = DEFAULT_TTL) -> None:
+    # start of an invocation, nothing cached and counters at zero
+    fs.ttl = ttl
+    fs.hits = 0
+    fs.misses = 0
+    fs.invalidate()
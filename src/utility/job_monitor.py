@@ -0,0 +1,288 @@
+import logging
+import os
+import re
+import shlex
+import subprocess
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+
+# normalized job states
+PENDING = "pending"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+FINISHED = (COMPLETED, FAILED)
+# matches "Submitted batch job 123" and "Your job 123 ... has been submitted"
+JOB_ID_PATTERN = r"(?:Submitted batch job|Your job(?:-array)?) (\d+)"
+# polls a job may stay unknown to the scheduler before it is taken as failed
+MAX_UNKNOWN_POLLS = 20
+# pending tasks of an array job, e.g. 123_[4-6,9%2]
+ARRAY_PATTERN = r"(\d+)_\[([\d,-]+)(?:%\d+)?\]$"
+
+
+class JobEvent(NamedTuple):
+    job_id: str
+    state: str
+    sample: str
+    info: dict
+
+
+def parse_job_id(text: str, pattern: str = JOB_ID_PATTERN) -> Optional[str]:
+    # last match, submitter might print several lines
+    found = re.findall(pattern, text)
+    return found[-1] if found else None
+
+
+def expand_array_id(job_id: str) -> List[str]:
+    """Task ids of a compressed array id like 123_[4-6,9], else the id"""
+    match = re.match(ARRAY_PATTERN, job_id)
+    if match is None:
+        return [job_id]
+    tasks = []
+    for part in match.group(2).split(","):
+        first, _, last = part.partition("-")
+        tasks.extend(range(int(first), int(last or first) + 1))
+    return [f"{match.group(1)}_{i}" for i in tasks]
+
+
+def row_events(event: JobEvent) -> List[JobEvent]:
+    """
+    Events of the rows run in a batch job, from their status files
+
+    A row without status file never ran, e.g. the job was cancelled before
+    getting to it, and is failed. Other jobs give their own event.
+    """
+    members = event.info.get("members")
+    if not members:
+        return [event]
+    events = []
+    for member in members:
+        try:
+            with open(member["status_file"]) as sf:
+                ok = sf.read().strip() == "0"
+        except OSError:
+            ok = False
+        info = dict(event.info, **member)
+        state = COMPLETED if ok else FAILED
+        events.append(JobEvent(event.job_id, state, member["sample"], info))
+    return events
+
+
+class SlurmScheduler(object):
+    """
+    State of many jobs with one sacct call
+
+    Array tasks are asked for by their array job, sacct reports tasks still
+    pending under one compressed id. States not listed are end states that
+    are failures, e.g. CANCELLED or TIMEOUT.
+    """
+
+    STATES = {
+        "PENDING": PENDING,
+        "REQUEUED": PENDING,
+        "REQUEUE_HOLD": PENDING,
+        "REQUEUE_FED": PENDING,
+        "RESV_DEL_HOLD": PENDING,
+        "RUNNING": RUNNING,
+        "CONFIGURING": RUNNING,
+        "COMPLETING": RUNNING,
+        "RESIZING": RUNNING,
+        "SIGNALING": RUNNING,
+        "STAGE_OUT": RUNNING,
+        "STOPPED": RUNNING,
+        "SUSPENDED": RUNNING,
+        "COMPLETED": COMPLETED,
+    }
+
+    def __init__(self, sacct: str = "sacct") -> None:
+        self.sacct = sacct
+
+    def status(self, job_ids: Iterable[str]) -> Dict[str, str]:
+        # tasks of an array by their array job, pending ones have no own line
+        job_ids = sorted({i.split("_")[0] for i in job_ids})
+        if not job_ids:
+            return {}
+        cmd = shlex.split(self.sacct) + [
+            "-n",
+            "-P",
+            "-X",
+            "-o",
+            "JobID,State",
+            "-j",
+            ",".join(job_ids),
+        ]
+        output = subprocess.run(
+            cmd,
+            universal_newlines=True,
+            stdout=subprocess.PIPE,
+            timeout=60,
+            check=True,
+        )
+        states = {}
+        for line in output.stdout.splitlines():
+            if "|" not in line:
+                continue
+            job_id, state = line.split("|", 1)
+            # e.g. "CANCELLED by 0", other end states are failures
+            state = state.split()[0] if state else ""
+            for task_id in expand_array_id(job_id):
+                states[task_id] = self.STATES.get(state, FAILED if state else PENDING)
+        return states
+
+
+class LocalScheduler(object):
+    """
+    Stand-in scheduler running jobs as local processes
+
+    Used for testing the monitor and the events without a cluster.
+    """
+
+    def __init__(self) -> None:
+        self.jobs: Dict[str, subprocess.Popen] = {}
+        self.queries = 0
+        self._next_id = 1
+
+    def submit(self, command: str, wd_path: Optional[str] = None) -> str:
+        job_id = str(self._next_id)
+        self._next_id += 1
+        self.jobs[job_id] = subprocess.Popen(
+            command,
+            shell=True,
+            cwd=wd_path,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        return job_id
+
+    def status(self, job_ids: Iterable[str]) -> Dict[str, str]:
+        self.queries += 1
+        states = {}
+        for job_id in job_ids:
+            proc = self.jobs.get(job_id)
+            if proc is None:
+                continue
+            code = proc.poll()
+            if code is None:
+                states[job_id] = RUNNING
+            else:
+                states[job_id] = COMPLETED if code == 0 else FAILED
+        return states
+
+
+class JobMonitor(object):
+    """
+    Follow submitted jobs with one batched status query per interval
+
+    The interval starts at min_interval and grows by backoff up to
+    max_interval while nothing changes, it is reset when a job changes state.
+    Handlers registered with on() are called with a JobEvent when a job
+    completes or fails, for a batch job once per row in it. A job the
+    scheduler doesn't know after max_unknown polls has failed.
+    """
+
+    def __init__(
+        self,
+        scheduler,
+        min_interval: float = 10.0,
+        max_interval: float = 300.0,
+        backoff: float = 1.5,
+        sleep: Callable[[float], None] = time.sleep,
+        max_unknown: int = MAX_UNKNOWN_POLLS,
+    ) -> None:
+        self.scheduler = scheduler
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.interval = min_interval
+        self.sleep = sleep
+        self.max_unknown = max_unknown
+        self.unknown: Dict[str, int] = {}
+        self.outstanding: Dict[str, dict] = {}
+        self.states: Dict[str, str] = {}
+        self.handlers: Dict[str, List[Callable[[JobEvent], None]]] = {
+            COMPLETED: [],
+            FAILED: [],
+        }
+        self._lock = threading.Lock()
+
+    def on(self, state: str, handler: Callable[[JobEvent], None]) -> None:
+        self.handlers[state].append(handler)
+
+    def track(self, job_id: str, sample: str, **info) -> None:
+        with self._lock:
+            self.outstanding[job_id] = dict(info, sample=sample)
+            self.states[job_id] = PENDING
+
+    def poll(self) -> List[JobEvent]:
+        """Query all outstanding jobs once and emit events of finished ones"""
+        with self._lock:
+            job_ids = sorted(self.outstanding)
+        if not job_ids:
+            return []
+        try:
+            states = self.scheduler.status(job_ids)
+        except (OSError, subprocess.SubprocessError) as err:
+            # e.g. no sacct on the cluster, jobs are asked again next poll
+            logging.warning(f"No job states, {len(job_ids)} jobs kept: {err}")
+            self.interval = min(self.max_interval, self.interval * self.backoff)
+            return []
+        events = []
+        changed = False
+        with self._lock:
+            for job_id in job_ids:
+                state = states.get(job_id)
+                if state is None:
+                    # not known to scheduler yet, or a wrong id was parsed
+                    self.unknown[job_id] = self.unknown.get(job_id, 0) + 1
+                    if self.unknown[job_id] < self.max_unknown:
+                        continue
+                    logging.warning(f"job {job_id} unknown to scheduler, failed")
+                    state = FAILED
+                if state != self.states[job_id]:
+                    changed = True
+                    self.states[job_id] = state
+                if state in FINISHED:
+                    info = self.outstanding.pop(job_id)
+                    event = JobEvent(job_id, state, info["sample"], info)
+                    events.extend(row_events(event))
+        if changed:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.max_interval, self.interval * self.backoff)
+        for event in events:
+            logging.info(f"job {event.job_id} of {event.sample} {event.state}")
+            for handler in self.handlers[event.state]:
+                handler(event)
+        return events
+
+    def wait(self, timeout: Optional[float] = None) -> List[JobEvent]:
+        """Poll until no job is outstanding or timeout seconds passed"""
+        waited = 0.0
+        events = self.poll()
+        while self.outstanding:
+            if timeout is not None and waited >= timeout:
+                break
+            self.sleep(self.interval)
+            waited += self.interval
+            events.extend(self.poll())
+        return events
+
+
+def command_handler(command: str) -> Callable[[JobEvent], None]:
+    """Handler running a shell command in the sample dir, e.g. staging cleanup"""
+
+    def run(event: JobEvent) -> None:
+        env = dict(
+            os.environ,
+            DRAGENFLOW_JOB_ID=event.job_id,
+            DRAGENFLOW_STATE=event.state,
+            DRAGENFLOW_SAMPLE=event.sample,
+        )
+        output = subprocess.run(
+            command, shell=True, cwd=event.info.get("wd_path"), env=env
+        )
+        if output.returncode != 0:
+            logging.warning(f"event command for {event.sample} failed: {command}")
+
+    return run
@@ -0,0 +1,196 @@
+import contextlib
+import fcntl
+import json
+import logging
+import os
+import socket
+import subprocess
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Set
+
+from .job_monitor import FINISHED
+
+RUN_LOCK = ".dragenflow.lock"
+SAMPLE_LOCK_DIR = ".dragenflow_locks"
+# seconds to wait for another instance to finish planning the run folder
+RUN_LOCK_WAIT = 3600.0
+POLL_INTERVAL = 1.0
+SUBMITTED_EXT = ".submitted"
+# seconds a submitted marker is kept while the scheduler doesn't know its job
+SUBMITTED_MAX_AGE = 7 * 24 * 3600.0
+
+
+def holder_info() -> str:
+    since = time.strftime("%Y-%m-%dT%H:%M:%S")
+    return f"{socket.gethostname()} pid {os.getpid()} since {since}"
+
+
+def run_dir(sheet_path: str) -> str:
+    # sample dirs are made next to the sheet
+    return os.path.dirname(os.path.abspath(sheet_path))
+
+
+class FileLock(object):
+    """
+    Advisory lock on a file, shared by processes on all hosts
+
+    On NFS flock is carried out with fcntl locks by the client, so the lock
+    holds across hosts mounting the run folder. The holder writes who it is
+    into the file for the ones waiting.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._fd: Optional[int] = None
+
+    def acquire(self, wait: float = 0) -> bool:
+        """Take the lock, waiting up to wait seconds. False if not taken"""
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o664)
+        deadline = time.monotonic() + wait
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    os.close(fd)
+                    return False
+                time.sleep(POLL_INTERVAL)
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{holder_info()}\n".encode())
+        self._fd = fd
+        return True
+
+    def holder(self) -> str:
+        try:
+            with open(self.path) as lf:
+                return lf.read().strip()
+        except OSError:
+            return ""
+
+    def release(self) -> None:
+        # file is kept, removing it could split waiters over two files
+        if self._fd is None:
+            return
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
+
+
+@contextlib.contextmanager
+def run_lock(sheet_path: str, wait: float = RUN_LOCK_WAIT) -> Iterator[None]:
+    """Held while a run folder is planned and the plan applied"""
+    lock = FileLock(os.path.join(run_dir(sheet_path), RUN_LOCK))
+    if not lock.acquire():
+        message = f"waiting for run folder lock held by {lock.holder()}"
+        logging.info(message)
+        print(message)
+        if not lock.acquire(wait):
+            raise RuntimeError(
+                f"Run folder {run_dir(sheet_path)} still locked after {wait}s "
+                f"by {lock.holder()}"
+            )
+    try:
+        yield
+    finally:
+        lock.release()
+
+
+class SampleLocks(object):
+    """
+    Locks of the samples of a run folder this process submits
+
+    A sample is locked when its commands are planned and stays locked until
+    release_all, so another instance skips it instead of submitting it again.
+    Jobs submitted for a sample are marked next to its lock, so later runs
+    skip it while the jobs are queued or running, see queued_jobs.
+    """
+
+    def __init__(self, sheet_path: str) -> None:
+        self.lock_dir = os.path.join(run_dir(sheet_path), SAMPLE_LOCK_DIR)
+        self._held: Dict[str, FileLock] = {}
+        self._marked: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str) -> str:
+        """Empty string if the sample is ours, else who holds it"""
+        with self._lock:
+            if key in self._held:
+                return ""
+            os.makedirs(self.lock_dir, exist_ok=True)
+            lock = FileLock(sample_file(self.lock_dir, key, ".lock"))
+            if not lock.acquire():
+                return lock.holder() or "another process"
+            self._held[key] = lock
+            return ""
+
+    def mark_submitted(self, key: str, job_id: str) -> None:
+        """Note a job submitted for a sample held, replacing older runs' jobs"""
+        if not job_id:
+            # nothing a later run could ask the scheduler about
+            return
+        with self._lock:
+            if key not in self._held:
+                logging.warning(f"{key} submitted without its lock, not marked")
+                return
+            path = sample_file(self.lock_dir, key, SUBMITTED_EXT)
+            jobs = read_submitted(path) if key in self._marked else []
+            self._marked.add(key)
+            jobs.append({"job_id": job_id, "submitted": time.time()})
+            with open(f"{path}.tmp", "w") as sf:
+                json.dump(jobs, sf)
+            os.replace(f"{path}.tmp", path)
+
+    def release_all(self) -> None:
+        with self._lock:
+            for lock in self._held.values():
+                lock.release()
+            self._held.clear()
+
+
+def sample_file(lock_dir: str, key: str, ext: str) -> str:
+    return os.path.join(lock_dir, f"{key.replace(os.sep, '__')}{ext}")
+
+
+def read_submitted(path: str) -> List[dict]:
+    try:
+        with open(path) as sf:
+            return json.load(sf)
+    except (OSError, ValueError):
+        return []
+
+
+def queued_jobs(sheet_path: str, keys: Set[str], scheduler) -> Dict[str, str]:
+    """
+    Samples of keys with a marked job not finished, and the job id
+
+    The states of all marked jobs are asked at once. A job the scheduler
+    doesn't report is taken as queued until its marker is SUBMITTED_MAX_AGE
+    old, also when the scheduler can't be asked.
+    """
+    lock_dir = os.path.join(run_dir(sheet_path), SAMPLE_LOCK_DIR)
+    marked = {}
+    for key in keys:
+        jobs = read_submitted(sample_file(lock_dir, key, SUBMITTED_EXT))
+        if jobs:
+            marked[key] = jobs
+    job_ids = sorted({i["job_id"] for jobs in marked.values() for i in jobs})
+    states: Dict[str, str] = {}
+    if job_ids and scheduler is not None:
+        try:
+            states = scheduler.status(job_ids)
+        except (OSError, subprocess.SubprocessError) as err:
+            logging.warning(f"No job states, submitted samples kept: {err}")
+    queued = {}
+    now = time.time()
+    for key, jobs in marked.items():
+        for job in jobs:
+            state = states.get(job["job_id"])
+            if state in FINISHED:
+                continue
+            if state is None and now - job["submitted"] > SUBMITTED_MAX_AGE:
+                continue
+            queued[key] = job["job_id"]
+            break
+    return queued
@@ -0,0 +1,134 @@
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .fs_meta import Action, MOVE
+
+PREFIX = "dragenflow"
+# seconds between writes while submitting, stage changes always write
+WRITE_INTERVAL = 15.0
+# name: help, all values are of the last run so every metric is a gauge
+HELP = {
+    "samples": "Sheet rows by planning outcome",
+    "commands": "Submit commands by outcome",
+    "queue_depth": "Planned jobs not yet submitted",
+    "stage_seconds": "Wall time of a stage of the run",
+    "fastq_moved_bytes": "Bytes of fastqs moved into sample dirs",
+    "fs_operations": "Filesystem changes applied by kind",
+    "fs_cache": "Directory listing cache lookups",
+    "run_start_time_seconds": "Unix time the run started",
+    "run_success": "1 if the run finished without error",
+}
+
+Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def number(value: float) -> str:
+    # exact, e.g. unix times, without a trailing .0 on counts
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def moved_bytes(actions: Iterable[Action]) -> int:
+    # fastqs still to be moved, ones moved by an earlier run are gone
+    total = 0
+    for action in actions:
+        if action.kind == MOVE and os.path.isfile(action.path):
+            total += os.path.getsize(action.path)
+    return total
+
+
+class Metrics(object):
+    """
+    Counts of a run in the format of the node exporter textfile collector
+
+    Without out_dir nothing is written. The file is named after the run
+    folder and shard, so instances sharing a collector dir don't overwrite
+    each other, and replaced atomically, as the collector may read it any
+    time. Stages work like PhaseProfiler phases.
+    """
+
+    def __init__(
+        self,
+        out_dir: Optional[str] = None,
+        run: str = "",
+        shard: Optional[Tuple[int, int]] = None,
+    ) -> None:
+        self.out_dir = out_dir
+        self.labels = {"run": run}
+        name = f"{PREFIX}_{run}" if run else PREFIX
+        if shard is not None:
+            self.labels["shard"] = f"{shard[0]}/{shard[1]}"
+            name = f"{name}_shard{shard[0]}of{shard[1]}"
+        self.path = os.path.join(out_dir, f"{name}.prom") if out_dir else None
+        self.values: Dict[Key, float] = {}
+        self.current: Optional[str] = None
+        self.started = 0.0
+        self.last_write = 0.0
+        self._lock = threading.Lock()
+        self.set("run_start_time_seconds", time.time())
+
+    def key(self, name: str, labels: Dict[str, str]) -> Key:
+        if name not in HELP:
+            raise KeyError(f"Unknown metric {name}")
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        key = self.key(name, labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        key = self.key(name, labels)
+        with self._lock:
+            self.values[key] = value
+
+    def get(self, name: str, **labels: str) -> float:
+        with self._lock:
+            return self.values.get(self.key(name, labels), 0)
+
+    def stage(self, name: str) -> None:
+        """End the running stage and start name, a stage run twice adds up"""
+        self.stop()
+        self.current = name
+        self.started = time.monotonic()
+
+    def stop(self) -> None:
+        if self.current is not None:
+            elapsed = time.monotonic() - self.started
+            self.inc("stage_seconds", elapsed, stage=self.current)
+            self.current = None
+            self.write()
+
+    def render(self) -> str:
+        with self._lock:
+            values = sorted(self.values.items())
+        lines: List[str] = []
+        for name in sorted({key[0] for key, _ in values}):
+            lines.append(f"# HELP {PREFIX}_{name} {HELP[name]}")
+            lines.append(f"# TYPE {PREFIX}_{name} gauge")
+            for (key_name, labels), value in values:
+                if key_name != name:
+                    continue
+                pairs = sorted(self.labels.items()) + list(labels)
+                text = ",".join(f'{k}="{escape(str(v))}"' for k, v in pairs)
+                lines.append(f"{PREFIX}_{name}{{{text}}} {number(value)}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, force: bool = True) -> None:
+        """Replace the metrics file, unless written less than WRITE_INTERVAL ago"""
+        if self.path is None:
+            return
+        now = time.monotonic()
+        if not force and now - self.last_write < WRITE_INTERVAL:
+            return
+        self.last_write = now
+        os.makedirs(self.out_dir, exist_ok=True)  # type: ignore
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as mf:
+            mf.write(self.render())
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,112 @@
+import json
+import os
+import sqlite3
+import time
+from typing import Dict, Optional
+
+from .dragen_utility import (
+    FASTQ_KEYS,
+    FASTQ_LIST_KEYS,
+    SH_SAMPLE,
+    SH_SM_PROJ,
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS normals (
+    project TEXT NOT NULL,
+    sample_id TEXT NOT NULL,
+    sample_dir TEXT NOT NULL,
+    prefix TEXT NOT NULL,
+    alignment TEXT NOT NULL,
+    fastq TEXT NOT NULL,
+    cnv_counts TEXT NOT NULL,
+    registered TEXT NOT NULL,
+    PRIMARY KEY (project, sample_id)
+);
+CREATE INDEX IF NOT EXISTS normals_sample_dir ON normals (sample_dir);
+"""
+COLUMNS = [
+    "project",
+    "sample_id",
+    "sample_dir",
+    "prefix",
+    "alignment",
+    "fastq",
+    "cnv_counts",
+    "registered",
+]
+
+
+def normal_record(excel: dict, cmd: dict) -> dict:
+    """Registry entry of a germline row from its constructed command"""
+    sample_dir = os.path.abspath(str(excel["fastq_dir"]))
+    prefix = os.path.join(sample_dir, cmd["output-file-prefix"])
+    # same choice between single lane fastqs and fastq list as the pipeline
+    if FASTQ_LIST_KEYS["normal"][0] in cmd:
+        keys = FASTQ_LIST_KEYS["normal"]
+    else:
+        keys = FASTQ_KEYS["normal"]
+    fastq = {i: cmd.get(i) for i in keys}
+    for i in ["fastq-file1", "fastq-file2", "fastq-list"]:
+        if fastq.get(i) and not os.path.isabs(fastq[i]):
+            fastq[i] = os.path.normpath(os.path.join(sample_dir, fastq[i]))
+    cnv_counts = ""
+    if str(cmd.get("enable-cnv", "")).lower() == "true":
+        cnv_counts = f"{prefix}.target.counts.gc-corrected.gz"
+    return {
+        "project": excel[SH_SM_PROJ],
+        "sample_id": excel[SH_SAMPLE],
+        "sample_dir": sample_dir,
+        "prefix": prefix,
+        "alignment": f"{prefix}.{str(cmd.get('output-format', 'bam')).lower()}",
+        "fastq": fastq,
+        "cnv_counts": cnv_counts,
+    }
+
+
+class NormalRegistry(object):
+    """
+    Normals submitted by earlier runs, kept in a sqlite file
+
+    Indexed by project and sample id and by sample directory so a tumor on a
+    later flowcell finds its normal without reading the normal's directory.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+
+    def register(self, record: dict) -> None:
+        # newer submission of the same normal replaces the old one
+        row = dict(record)
+        row["fastq"] = json.dumps(row["fastq"], sort_keys=True)
+        row["registered"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        with self.conn:
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO normals ({', '.join(COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(COLUMNS))})",
+                [row[i] for i in COLUMNS],
+            )
+
+    def lookup(
+        self, project: str, sample_id: str, sample_dir: str = ""
+    ) -> Optional[Dict[str, object]]:
+        """Find normal by its directory if given, else by project and id"""
+        if sample_dir:
+            query = "SELECT * FROM normals WHERE sample_dir = ?"
+            args = [os.path.abspath(sample_dir.rstrip("/"))]
+        else:
+            query = "SELECT * FROM normals WHERE project = ? AND sample_id = ?"
+            args = [project, sample_id]
+        row = self.conn.execute(query, args).fetchone()
+        if row is None:
+            return None
+        record = dict(row)
+        record["fastq"] = json.loads(record["fastq"])
+        return record
+
+    def close(self) -> None:
+        self.conn.close()
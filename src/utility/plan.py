@@ -0,0 +1,134 @@
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+import shutil
+from typing import Dict, Hashable, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from .fs_meta import Action, MKDIR, MOVE, REMOVE, WRITE
+from .ref_batch import SubmitJob
+
+APPLY_WORKERS = 8
+
+
+class Plan(NamedTuple):
+    """
+    Everything a run does, worked out before anything is done
+
+    actions are the filesystem changes in the order they were planned, jobs
+    the submissions in submit order, normals the rows of normals that ran in
+    earlier runs, to register with the plan applied.
+    """
+
+    actions: Tuple[Action, ...]
+    jobs: Tuple[SubmitJob, ...]
+    normals: Tuple[dict, ...] = ()
+
+
+def _mkdir(action: Action) -> bool:
+    if os.path.isdir(action.path):
+        return False
+    os.makedirs(action.path, exist_ok=True)
+    return True
+
+
+def _move(action: Action) -> bool:
+    target = os.path.join(action.arg, os.path.basename(action.path))
+    if not os.path.exists(action.path) and os.path.exists(target):
+        # moved by an earlier apply
+        return False
+    shutil.move(action.path, action.arg)
+    return True
+
+
+def _remove(action: Action) -> bool:
+    try:
+        os.remove(action.path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def _write(action: Action) -> bool:
+    try:
+        with open(action.path, newline="") as cf:
+            if cf.read() == action.arg:
+                return False
+    except FileNotFoundError:
+        pass
+    tmp_path = f"{action.path}.tmp"
+    with open(tmp_path, "w", newline="") as wf:
+        wf.write(action.arg)
+    os.replace(tmp_path, action.path)
+    return True
+
+
+APPLY = {MKDIR: _mkdir, MOVE: _move, REMOVE: _remove, WRITE: _write}
+
+
+def run_action(action: Action) -> bool:
+    return APPLY[action.kind](action)
+
+
+def stages(actions: Iterable[Action]) -> List[List[Action]]:
+    """
+    Actions grouped so that each group can run in parallel
+
+    Dirs are made first, parents before children, then fastqs are moved
+    and stale files removed, files are written last. An action repeated on a
+    path is made once, writes with the last content.
+    """
+    last: Dict[Tuple[str, str], Action] = {}
+    for action in actions:
+        last[(action.kind, action.path)] = action
+    dirs: Dict[int, List[Action]] = {}
+    for action in last.values():
+        if action.kind == MKDIR:
+            depth = action.path.rstrip(os.sep).count(os.sep)
+            dirs.setdefault(depth, []).append(action)
+    groups = [dirs[depth] for depth in sorted(dirs)]
+    for kind in [MOVE, REMOVE, WRITE]:
+        group = [i for i in last.values() if i.kind == kind]
+        if group:
+            groups.append(group)
+    return groups
+
+
+def without_rows(
+    actions: Iterable[Action],
+    owners: Dict[Action, Set[Optional[Hashable]]],
+    left_out: Iterable[dict],
+    rows: Iterable[dict],
+) -> List[Action]:
+    """
+    Actions but the ones recorded only for rows left out of a plan
+
+    Owners of actions are ids of rows. The sample dir of a row left out is
+    not made either, unless another row of the plan has it.
+    """
+    left_ids = {id(i) for i in left_out}
+    kept_dirs = {os.path.abspath(i["fastq_dir"]) for i in rows if id(i) not in left_ids}
+    left_dirs = {os.path.abspath(i["fastq_dir"]) for i in left_out} - kept_dirs
+    return [
+        i
+        for i in actions
+        if not owners.get(i, {None}) <= left_ids
+        and not (i.kind == MKDIR and i.path in left_dirs)
+    ]
+
+
+def apply_actions(
+    actions: Iterable[Action], workers: int = APPLY_WORKERS
+) -> Dict[str, int]:
+    """
+    Make planned filesystem changes, returns number of changes per kind
+
+    Changes already on disk are skipped, so applying a plan again after a
+    failure only makes what is missing.
+    """
+    done = {kind: 0 for kind in APPLY}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for group in stages(actions):
+            for action, changed in zip(group, pool.map(run_action, group)):
+                done[action.kind] += changed
+    logging.info(f"applied filesystem changes: {done}")
+    return done
@@ -0,0 +1,126 @@
+import json
+import logging
+import os
+import pickle  # noqa: S403
+from typing import Dict, List, Optional
+
+from .dragen_utility import PROFILE_PARAMS, script_path
+
+PROFILES = ["dragen_config.json", "dragen_rna.json", "dragen_met.json"]
+CACHE_VERSION = 1
+CACHE_SUFFIX = ".pickle"
+# keys every profile has besides its pipeline sections
+COMMON_KEYS = {"ref_parameters": dict, "adapters": dict, "scripts": dict}
+SCALARS = (str, int, float, bool)
+_loaded: Dict[str, dict] = {}
+
+
+def profile_body(profile: dict) -> dict:
+    # dna profile is wrapped in profile1
+    return profile.get("profile1", profile)
+
+
+def validate_profile(profile: dict, name: str = "profile") -> None:
+    """Raise ValueError listing everything wrong in profile structure"""
+    body = profile_body(profile)
+    errors = []
+    for key, kind in COMMON_KEYS.items():
+        if not isinstance(body.get(key), kind):
+            errors.append(f"'{key}' missing or not a {kind.__name__}")
+    samplesheet = body.get("samplesheet")
+    if samplesheet is not None and not (
+        isinstance(samplesheet, list) and all(isinstance(i, str) for i in samplesheet)
+    ):
+        errors.append("'samplesheet' is not a list of column names")
+    for table, values in (body.get("ref_parameters") or {}).items():
+        if not isinstance(values, dict):
+            errors.append(f"ref_parameters '{table}' is not a dict")
+    skip = {"samplesheet", PROFILE_PARAMS}
+    sections = [i for i in body if i not in COMMON_KEYS and i not in skip]
+    if not sections:
+        errors.append("no pipeline sections")
+    for section in sections:
+        options = body[section]
+        if not isinstance(options, dict):
+            errors.append(f"section '{section}' is not a dict")
+            continue
+        for option, value in options.items():
+            if not isinstance(value, SCALARS):
+                errors.append(f"'{section}.{option}' is not a single value")
+    if errors:
+        raise ValueError(f"Invalid {name}: " + "; ".join(errors))
+
+
+def compile_profile(profile: dict) -> dict:
+    # options filled in at runtime per section, see template_params
+    body = profile_body(profile)
+    body[PROFILE_PARAMS] = {
+        section: [i for i in options if str(options[i]).startswith("{")]
+        for section, options in body.items()
+        if section not in COMMON_KEYS and isinstance(options, dict)
+    }
+    return profile
+
+
+def _source_key(path: str) -> List[int]:
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def cache_path(path: str) -> str:
+    return path + CACHE_SUFFIX
+
+
+def read_cache(path: str) -> Optional[dict]:
+    """Compiled profile if cache exists and matches the json, else None"""
+    cache_f = cache_path(path)
+    try:
+        with open(cache_f, "rb") as cf:
+            # written by write_cache next to our own profiles only
+            cached = pickle.load(cf)  # noqa: S301
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        return None
+    if not isinstance(cached, dict) or cached.get("version") != CACHE_VERSION:
+        return None
+    if cached.get("source") != _source_key(path):
+        logging.info(f"Profile cache {cache_f} is stale, using json")
+        return None
+    return cached["profile"]
+
+
+def load_json_profile(path: str) -> dict:
+    with open(path) as jf:
+        profile = json.load(jf)
+    validate_profile(profile, os.path.basename(path))
+    return compile_profile(profile)
+
+
+def write_cache(path: str) -> str:
+    """Validate and compile json profile, write it next to json"""
+    profile = load_json_profile(path)
+    cache_f = cache_path(path)
+    tmp_f = f"{cache_f}.tmp"
+    cached = {"version": CACHE_VERSION, "source": _source_key(path), "profile": profile}
+    with open(tmp_f, "wb") as cf:
+        pickle.dump(cached, cf, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_f, cache_f)
+    return cache_f
+
+
+def compile_profiles(names: List[str] = PROFILES) -> List[str]:
+    return [write_cache(script_path(name)) for name in names]
+
+
+def load_profile(name: str) -> dict:
+    """
+    Profile by file name, from the compiled cache when it is up to date
+
+    Loaded once per process, callers must not change the returned dict.
+    """
+    if name not in _loaded:
+        path = script_path(name)
+        profile = read_cache(path)
+        if profile is None:
+            profile = load_json_profile(path)
+        _loaded[name] = profile
+    return _loaded[name]
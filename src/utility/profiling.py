@@ -0,0 +1,112 @@
+import cProfile
+import logging
+import os
+import pstats
+from typing import Dict, List, Optional, Tuple
+
+# (file, line, function) as used by pstats
+Func = Tuple[str, int, str]
+# stop following call paths below this many microseconds
+MIN_PATH_US = 1.0
+
+
+def func_label(func: Func) -> str:
+    file_name, line, name = func
+    if file_name == "~":
+        # builtins like <method 'deepcopy' ...>
+        return name.replace(";", ",")
+    return f"{name} ({os.path.basename(file_name)}:{line})".replace(";", ",")
+
+
+def collapsed_stacks(stats: pstats.Stats) -> Dict[str, int]:
+    """
+    Flamegraph input, "root;...;func" to own microseconds
+
+    cProfile keeps caller to callee edges only, so own time of a function is
+    split over its callers by their share of its cumulative time. Good
+    enough to find the wide frames, exact stacks need a sampling profiler.
+    """
+    raw = stats.stats  # type: ignore
+    callees: Dict[Func, List[Tuple[Func, float]]] = {}
+    for func, (_, _, _, ct, callers) in raw.items():
+        for caller, edge in callers.items():
+            share = edge[3] / ct if ct else 0.0
+            callees.setdefault(caller, []).append((func, share))
+    roots = [func for func, value in raw.items() if not value[4]]
+    stacks: Dict[str, int] = {}
+
+    def walk(func: Func, path: List[Func], weight: float) -> None:
+        own_us = raw[func][2] * weight * 1e6
+        stack = path + [func]
+        if own_us >= 1:
+            key = ";".join(func_label(i) for i in stack)
+            stacks[key] = stacks.get(key, 0) + int(own_us)
+        for callee, share in callees.get(func, []):
+            if callee in stack:
+                # recursion, time already counted on the outer frame
+                continue
+            if raw[callee][3] * weight * share * 1e6 < MIN_PATH_US:
+                continue
+            walk(callee, stack, weight * share)
+
+    for root in roots:
+        walk(root, [], 1.0)
+    return stacks
+
+
+def hot_spots(stats: pstats.Stats, top: int = 10) -> List[str]:
+    """Lines for the functions with the most own time"""
+    raw = stats.stats  # type: ignore
+    ranked = sorted(raw.items(), key=lambda i: i[1][2], reverse=True)[:top]
+    return [
+        f"{tt:8.3f}s own {ct:8.3f}s total {nc:8d} calls  {func_label(func)}"
+        for func, (_, nc, tt, ct, _) in ranked
+    ]
+
+
+class PhaseProfiler(object):
+    """
+    cProfile per phase of a run, e.g. planning and submission
+
+    start() ends the running phase, a phase started twice adds up. Without
+    out_dir nothing is profiled. Only the calling thread is profiled, so
+    planning with several workers misses the work done in the pool.
+    """
+
+    def __init__(self, out_dir: Optional[str] = None, top: int = 10) -> None:
+        self.out_dir = out_dir
+        self.top = top
+        self.profiles: Dict[str, cProfile.Profile] = {}
+        self.current: Optional[str] = None
+
+    def start(self, phase: str) -> None:
+        if self.out_dir is None:
+            return
+        self.stop()
+        self.profiles.setdefault(phase, cProfile.Profile()).enable()
+        self.current = phase
+
+    def stop(self) -> None:
+        if self.current is not None:
+            self.profiles[self.current].disable()
+            self.current = None
+
+    def write(self) -> List[str]:
+        """Write <phase>.pstats and <phase>.collapsed, return summary lines"""
+        self.stop()
+        if self.out_dir is None or not self.profiles:
+            return []
+        os.makedirs(self.out_dir, exist_ok=True)
+        lines = []
+        for phase, profile in self.profiles.items():
+            stats = pstats.Stats(profile)
+            base = os.path.join(self.out_dir, phase)
+            stats.dump_stats(f"{base}.pstats")
+            with open(f"{base}.collapsed", "w") as cf:
+                for stack, us in sorted(collapsed_stacks(stats).items()):
+                    cf.write(f"{stack} {us}\n")
+            total = stats.total_tt  # type: ignore
+            lines.append(f"{phase}: {total:.3f}s profiled, written to {base}.*")
+            lines.extend(hot_spots(stats, self.top))
+            logging.info(f"profile of {phase} written to {base}.pstats")
+        return lines
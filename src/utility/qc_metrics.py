@@ -0,0 +1,172 @@
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import json
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+from .dragen_utility import job_prefixes, SH_SAMPLE, SH_SM_PROJ
+from .fingerprint import load_fingerprint
+from .fs_meta import fs
+
+METRICS_SUFFIX = "_metrics.csv"
+META_COLS = ["sample", "prefix", "source"]
+MANIFEST = ".qc_manifest.json"
+
+
+def row_prefixes(excel: dict) -> List[str]:
+    # prefixes dragenflow planned for row, from last submission and job files
+    prefixes = []
+    stored = load_fingerprint(excel)
+    if stored:
+        prefixes.extend(stored.get("prefixes", []))
+    prefixes.extend(job_prefixes(excel) or [])
+    return list(dict.fromkeys(prefixes))
+
+
+def metric_type(file_name: str, prefix: str) -> Optional[str]:
+    # <prefix>.<type>_metrics.csv, dot in type means a longer prefix
+    if not file_name.startswith(f"{prefix}.") or not file_name.endswith(
+        METRICS_SUFFIX
+    ):
+        return None
+    name = file_name[len(prefix) + 1 : -len(METRICS_SUFFIX)]
+    if not name or "." in name:
+        return None
+    return name
+
+
+def find_metrics(excel: List[dict]) -> Dict[str, Tuple[str, str, str]]:
+    """Metrics files of sheet rows as path: (metric type, sample, prefix)"""
+    found = {}
+    for row in excel:
+        fastq_dir = str(row["fastq_dir"])
+        if not fs.isdir(fastq_dir):
+            continue
+        prefixes = row_prefixes(row)
+        if not prefixes:
+            continue
+        sample = f"{row[SH_SM_PROJ]}/{row[SH_SAMPLE]}"
+        for file_name in fs.listdir(fastq_dir):
+            for prefix in prefixes:
+                mtype = metric_type(file_name, prefix)
+                if mtype:
+                    path = os.path.join(fastq_dir, file_name)
+                    found[path] = (mtype, sample, prefix)
+    return found
+
+
+def parse_metrics(path: str) -> Dict[str, str]:
+    """
+    Read a DRAGEN metrics csv line by line
+
+    Lines are section,group,metric,value[,percent], columns are named
+    section:metric. Per read group lines are left out as their names differ
+    between samples.
+    """
+    values = {}
+    with open(path, newline="") as mf:
+        for line in csv.reader(mf):
+            if len(line) < 4:
+                continue
+            section, _, metric, value = line[:4]
+            if "PER RG" in section:
+                continue
+            column = f"{section}:{metric}"
+            values[column] = value
+            if len(line) > 4 and line[4] != "":
+                values[f"{column} %"] = line[4]
+    return values
+
+
+def _file_key(path: str) -> List[int]:
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _load_manifest(path: str) -> Dict[str, List[int]]:
+    if not os.path.isfile(path):
+        return {}
+    try:
+        with open(path) as mf:
+            return json.load(mf)
+    except ValueError:
+        logging.warning(f"Ignoring unreadable qc manifest {path}")
+        return {}
+
+
+def _read_header(path: str) -> List[str]:
+    with open(path, newline="") as tf:
+        return next(csv.reader(tf, delimiter="\t"), [])
+
+
+def _write_table(path: str, header: List[str], rows: List[dict]) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", newline="") as tf:
+        writer = csv.DictWriter(tf, header, delimiter="\t", restval="")
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(tmp_path, path)
+
+
+def update_table(path: str, new_rows: List[dict], replaced: set) -> None:
+    # append when possible, rewrite if columns were added or rows replaced
+    columns = list(META_COLS)
+    for row in new_rows:
+        columns.extend(i for i in row if i not in columns)
+    if not os.path.isfile(path):
+        _write_table(path, columns, new_rows)
+        return
+    header = _read_header(path)
+    if not replaced and set(columns) <= set(header):
+        with open(path, "a", newline="") as tf:
+            writer = csv.DictWriter(tf, header, delimiter="\t", restval="")
+            writer.writerows(new_rows)
+        return
+    with open(path, newline="") as tf:
+        rows = [
+            i
+            for i in csv.DictReader(tf, delimiter="\t")
+            if i["source"] not in replaced
+        ]
+    header.extend(i for i in columns if i not in header)
+    _write_table(path, header, rows + new_rows)
+
+
+def aggregate_metrics(
+    found: Dict[str, Tuple[str, str, str]],
+    out_dir: str,
+    workers: Optional[int] = None,
+) -> Dict[str, int]:
+    """
+    Write one table per metric type into out_dir, <type>.tsv
+
+    Only files that are new or changed since last call are parsed, on a
+    process pool. Returns number of rows added per metric type.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, MANIFEST)
+    manifest = _load_manifest(manifest_path)
+    keys = {path: _file_key(path) for path in found}
+    to_parse = sorted(i for i in found if manifest.get(i) != keys[i])
+    if not to_parse:
+        return {}
+    logging.info(f"qc metrics: parsing {len(to_parse)} files")
+    by_type: Dict[str, List[dict]] = {}
+    replaced: Dict[str, set] = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        parsed = pool.map(parse_metrics, to_parse, chunksize=8)
+        for path, values in zip(to_parse, parsed):
+            mtype, sample, prefix = found[path]
+            row = {"sample": sample, "prefix": prefix, "source": path}
+            row.update(values)
+            by_type.setdefault(mtype, []).append(row)
+            if path in manifest:
+                replaced.setdefault(mtype, set()).add(path)
+    for mtype, rows in sorted(by_type.items()):
+        table = os.path.join(out_dir, f"{mtype}.tsv")
+        update_table(table, rows, replaced.get(mtype, set()))
+    manifest.update({i: keys[i] for i in to_parse})
+    with open(manifest_path, "w") as mf:
+        json.dump(manifest, mf, sort_keys=True)
+    return {mtype: len(rows) for mtype, rows in by_type.items()}
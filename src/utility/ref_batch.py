@@ -0,0 +1,176 @@
+import os
+from pathlib import Path
+import re
+import shlex
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from .dragen_utility import (
+    flow_name,
+    SH_SAMPLE,
+    SH_SM_PROJ,
+    SHA_SSFPATH,
+    srun_cli,
+)
+from .fingerprint import fingerprint_key
+from .fs_meta import fs
+
+BATCH_DIR = "dragen_batches"
+REF_DIR_PATTERN = r"--ref-dir (\S+)"
+Row = Tuple[dict, List[str]]
+
+
+class SubmitJob(NamedTuple):
+    """Commands submitted from wd_path, for one row or a batch of rows"""
+
+    wd_path: str
+    sample: str
+    log_key: str
+    commands: List[str]
+    members: List[Row]
+
+    @property
+    def batched(self) -> bool:
+        return len(self.members) > 1
+
+
+def sample_name(data: dict) -> str:
+    return f"{data[SH_SM_PROJ]}/{data[SH_SAMPLE]}"
+
+
+def srun_option(command: str, flag: str) -> Optional[str]:
+    # value of an option given to the submitter, e.g. -q for the queue
+    args = shlex.split(command)
+    if flag not in args[:-1]:
+        return None
+    return args[args.index(flag) + 1]
+
+
+def job_script(command: str) -> Optional[str]:
+    # script given to the submitter with -c
+    return srun_option(command, "-c")
+
+
+def batch_key(commands: List[str]) -> Optional[str]:
+    """Reference dir shared by all commands of a row, None if not batchable"""
+    ref_dirs = set()
+    for command in commands:
+        script = job_script(command)
+        if script is None or "'" in script:
+            return None
+        ref_dirs.update(re.findall(REF_DIR_PATTERN, script))
+    if len(ref_dirs) != 1:
+        return None
+    return ref_dirs.pop()
+
+
+def status_path(data: dict) -> str:
+    # exit status of a row run inside a batch job
+    return os.path.join(
+        str(data["fastq_dir"]), "logs", f"{fingerprint_key(data)}_batch.rc"
+    )
+
+
+def jobfile_path(data: dict) -> str:
+    # check_has_run finds dragen lines of rows not given to srun.py here
+    return os.path.join(
+        str(data["fastq_dir"]), "logs", f"{fingerprint_key(data)}_batch.job"
+    )
+
+
+def batch_script(members: List[Row]) -> str:
+    """
+    Run rows one after another, each in its own sample dir
+
+    Commands of a row stop at the first failing one, its exit status is
+    written to the status file of the row. The job fails if any row failed.
+    """
+    lines = ["failed=0"]
+    for data, commands in members:
+        steps = " && ".join(f"(\n{job_script(i)}\n)" for i in commands)
+        lines.append(f'cd "{data["fastq_dir"]}" && {steps}')
+        lines.append(
+            f's=$?; echo $s > "{status_path(data)}"; [ $s -eq 0 ] || failed=1'
+        )
+    lines.append("exit $failed")
+    return "\n".join(lines)
+
+
+def prepare_job(job: SubmitJob, jobfiles: bool = False) -> None:
+    """
+    Dirs and files a job needs before it is submitted
+
+    Job files of rows are written for batches, and with jobfiles for any job
+    not given to srun.py, which otherwise writes them.
+    """
+    if not fs.isdir(job.wd_path):
+        fs.mkdir(job.wd_path)
+    logs = os.path.join(job.wd_path, "logs")
+    if not fs.isdir(logs):
+        fs.mkdir(logs)
+    if not (job.batched or jobfiles):
+        return
+    for data, commands in job.members:
+        logs = os.path.join(str(data["fastq_dir"]), "logs")
+        if not fs.isdir(logs):
+            fs.mkdir(logs)
+        # status of an earlier batch would read as this one finished
+        if job.batched and fs.exists(status_path(data)):
+            fs.remove(status_path(data))
+        scripts = "".join(f"{job_script(i)}\n" for i in commands)
+        fs.write_text(jobfile_path(data), scripts)
+
+
+def row_job(data: dict, commands: List[str]) -> SubmitJob:
+    return SubmitJob(
+        str(data["fastq_dir"]),
+        sample_name(data),
+        fingerprint_key(data),
+        commands,
+        [(data, commands)],
+    )
+
+
+def batch_job(members: List[Row], index: int) -> SubmitJob:
+    first = members[0][0]
+    name = f"batch{index}-{first['Sample_Name']}"
+    wd_path = Path(first[SHA_SSFPATH]).absolute().parent / BATCH_DIR
+    return SubmitJob(
+        str(wd_path),
+        f"{name} ({len(members)} samples)",
+        name,
+        [srun_cli(f"dragen-{name}", batch_script(members))],
+        members,
+    )
+
+
+def plan_jobs(submissions: List[Row], batch_size: int = 0) -> List[SubmitJob]:
+    """
+    Submit jobs for rendered rows, in order of the rows
+
+    With a batch_size above 1, rows of the same pipeline and reference dir
+    are put into jobs of up to batch_size rows, so the reference is loaded
+    onto the card once per job. A batch is placed where its first row was,
+    normals stay ahead of tumors paired with them.
+    """
+    if batch_size <= 1:
+        return [row_job(data, commands) for data, commands in submissions]
+    groups: Dict[Tuple[str, str], List[Row]] = {}
+    planned: List[List[Row]] = []
+    for data, commands in submissions:
+        ref_dir = batch_key(commands)
+        if ref_dir is None:
+            planned.append([(data, commands)])
+            continue
+        key = (flow_name(data), ref_dir)
+        group = groups.get(key)
+        if group is None or len(group) >= batch_size:
+            group = groups[key] = []
+            planned.append(group)
+        group.append((data, commands))
+    jobs = []
+    for members in planned:
+        if len(members) == 1:
+            jobs.append(row_job(*members[0]))
+        else:
+            jobs.append(batch_job(members, len(jobs) + 1))
+    return jobs
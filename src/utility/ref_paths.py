@@ -0,0 +1,98 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import re
+import stat
+from typing import Dict, List, Optional, Tuple
+
+from .ref_batch import job_script, Row, sample_name
+
+# dragen options taking a reference, target BED/GFF or PoN path, and whether
+# it is a dir or a file
+REFERENCE_OPTIONS = {
+    "ref-dir": "dir",
+    "ora-reference": "dir",
+    "annotation-file": "file",
+    "qc-coverage-region-1": "file",
+    "vc-snp-error-cal-bed": "file",
+    "umi-metrics-interval-file": "file",
+    "vc-target-bed": "file",
+    "cnv-target-bed": "file",
+    "cnv-normals-list": "file",
+    "cnv-normals-file": "file",
+    "cnv-population-b-allele-vcf": "file",
+    "vc-systematic-noise": "file",
+    "sv-systematic-noise": "file",
+}
+OPTION_PATTERN = r"--(%s) (\S+)" % "|".join(map(re.escape, REFERENCE_OPTIONS))
+# paths are stat'ed at once, network filesystems answer slowly one by one
+CHECK_WORKERS = 16
+
+Reference = Tuple[str, str]
+
+
+def reference_paths(
+    submissions: List[Row], sources: Optional[Dict[str, str]] = None
+) -> Dict[Reference, List[str]]:
+    """
+    Distinct (path, kind) of reference options, with samples needing each
+
+    A path made by the plan itself, e.g. the panel of normals of a paired
+    sample, is replaced by the one it is made of as given in sources.
+    """
+    needed: Dict[Reference, List[str]] = {}
+    for data, commands in submissions:
+        for command in commands:
+            for line in (job_script(command) or command).splitlines():
+                if not line.startswith("dragen"):
+                    continue
+                for option, path in re.findall(OPTION_PATTERN, line):
+                    path = (sources or {}).get(path, path)
+                    key = (path, REFERENCE_OPTIONS[option])
+                    samples = needed.setdefault(key, [])
+                    if sample_name(data) not in samples:
+                        samples.append(sample_name(data))
+    return needed
+
+
+def check_reference(path: str, kind: str) -> str:
+    """Empty string for a readable dir or non empty file, else the reason"""
+    # jobs run in the sample dir, a relative path is a leftover placeholder
+    if not os.path.isabs(path):
+        return f"{path}: not an absolute path"
+    try:
+        st = os.stat(path)
+    except OSError as err:
+        return f"{path}: {err.strerror or err}"
+    if kind == "dir" and not stat.S_ISDIR(st.st_mode):
+        return f"{path}: not a directory"
+    if kind == "file" and not stat.S_ISREG(st.st_mode):
+        return f"{path}: not a file"
+    if kind == "file" and st.st_size == 0:
+        return f"{path}: empty file"
+    if not os.access(path, os.R_OK | (os.X_OK if kind == "dir" else 0)):
+        return f"{path}: not readable"
+    return ""
+
+
+def check_references(
+    submissions: List[Row],
+    sources: Optional[Dict[str, str]] = None,
+    workers: int = CHECK_WORKERS,
+) -> Dict[str, List[str]]:
+    """
+    Problems of reference, target and PoN paths by sample
+
+    Each distinct path is checked once, in parallel, and its result given to
+    every sample using it.
+    """
+    needed = reference_paths(submissions, sources)
+    if not needed:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(workers, len(needed))) as pool:
+        results = pool.map(lambda i: check_reference(*i), needed)
+        checked = dict(zip(needed, results))
+    problems: Dict[str, List[str]] = {}
+    for key, samples in needed.items():
+        for sample in samples if checked[key] else []:
+            problems.setdefault(sample, []).append(checked[key])
+    return problems
@@ -0,0 +1,159 @@
+import csv
+import functools
+import logging
+import os
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import xml.etree.ElementTree as ET
+
+RUN_INFO = "RunInfo.xml"
+# older instruments name it runParameters.xml
+RUN_PARAMETERS = ["RunParameters.xml", "runParameters.xml"]
+# e.g. 210317_A00464_0300_BHW7FTDMXX: date, instrument, run number, flowcell
+RUN_FOLDER_PATTERN = r"^\d{6}_([^_]+)_\d+_([^_]+)$"
+# parents of the sheet dir searched for the run folder
+MAX_DEPTH = 3
+
+
+class Read(NamedTuple):
+    number: int
+    cycles: int
+    indexed: bool
+
+
+class RunContext(NamedTuple):
+    """Metadata of the sequencing run a sheet belongs to, read once per sheet"""
+
+    run_dir: str
+    run_id: str
+    flowcell: str
+    instrument: str
+    lane_count: int
+    reads: Tuple[Read, ...]
+    header: Dict[str, str]
+    parameters: Dict[str, str]
+
+    @property
+    def read_lengths(self) -> List[int]:
+        # cycles of reads written to fastqs, in fastq read order
+        return [i.cycles for i in self.reads if not i.indexed]
+
+    @property
+    def umi_read(self) -> Optional[int]:
+        """Fastq read number of a umi read between the two mates, if any"""
+        lengths = self.read_lengths
+        if len(lengths) != 3:
+            return None
+        return lengths.index(min(lengths)) + 1
+
+
+def parse_run_info(path: str) -> dict:
+    root = ET.parse(path).getroot()
+    run = root.find("Run")
+    if run is None:
+        raise ValueError(f"No Run element in {path}")
+    layout = run.find("FlowcellLayout")
+    reads = [
+        Read(
+            int(i.get("Number", 0)),
+            int(i.get("NumCycles", 0)),
+            i.get("IsIndexedRead") == "Y",
+        )
+        for i in run.iter("Read")
+    ]
+    return {
+        "run_id": run.get("Id", ""),
+        "flowcell": run.findtext("Flowcell", ""),
+        "instrument": run.findtext("Instrument", ""),
+        "lane_count": int(layout.get("LaneCount", 0)) if layout is not None else 0,
+        "reads": tuple(sorted(reads)),
+    }
+
+
+def parse_run_parameters(path: str) -> Dict[str, str]:
+    # elements holding a value, by tag, first one wins
+    values: Dict[str, str] = {}
+    for elem in ET.parse(path).getroot().iter():
+        text = (elem.text or "").strip()
+        if len(elem) == 0 and text:
+            values.setdefault(elem.tag, text)
+    return values
+
+
+def parse_sheet_sections(path: str) -> Tuple[Dict[str, str], List[int]]:
+    """[Header] key value pairs and [Reads] lengths of a sample sheet"""
+    header: Dict[str, str] = {}
+    reads: List[int] = []
+    section = ""
+    with open(path, newline="", encoding="utf-8") as inf:
+        for row in csv.reader(inf):
+            if not row or not row[0]:
+                continue
+            if row[0].startswith("["):
+                section = row[0].strip()
+                if section == "[Data]":
+                    break
+                continue
+            if section == "[Header]":
+                header[row[0]] = row[1] if len(row) > 1 else ""
+            elif section == "[Reads]" and row[0].strip().isdigit():
+                reads.append(int(row[0]))
+    return header, reads
+
+
+def find_run_dir(sheet_dir: str) -> Tuple[str, bool]:
+    """Nearest dir with RunInfo.xml, else named like a run folder, else ''"""
+    dirs = [sheet_dir]
+    for _ in range(MAX_DEPTH):
+        dirs.append(os.path.dirname(dirs[-1]))
+    for path in dirs:
+        if os.path.isfile(os.path.join(path, RUN_INFO)):
+            return path, True
+    for path in dirs:
+        if re.match(RUN_FOLDER_PATTERN, os.path.basename(path)):
+            return path, False
+    return "", False
+
+
+@functools.lru_cache(maxsize=None)
+def run_context(sheet_path: str) -> RunContext:
+    """
+    Run of a sheet from RunInfo.xml, RunParameters.xml and sheet sections
+
+    Without RunInfo.xml flowcell and instrument come from the name of the run
+    folder, read lengths from [Reads] of the sheet. Cached per sheet path.
+    """
+    sheet_path = os.path.abspath(sheet_path)
+    run_dir, has_info = find_run_dir(os.path.dirname(sheet_path))
+    header: Dict[str, str] = {}
+    sheet_reads: List[int] = []
+    if os.path.isfile(sheet_path):
+        header, sheet_reads = parse_sheet_sections(sheet_path)
+    info = {
+        "run_id": "",
+        "flowcell": "",
+        "instrument": "",
+        "lane_count": 0,
+        "reads": tuple(Read(i, n, False) for i, n in enumerate(sheet_reads, 1)),
+    }
+    if has_info:
+        info.update(parse_run_info(os.path.join(run_dir, RUN_INFO)))
+    parameters: Dict[str, str] = {}
+    for name in RUN_PARAMETERS if run_dir else []:
+        if os.path.isfile(os.path.join(run_dir, name)):
+            parameters = parse_run_parameters(os.path.join(run_dir, name))
+            break
+    info["instrument"] = info["instrument"] or parameters.get("InstrumentName", "")
+    if not info["flowcell"]:
+        info["flowcell"] = parameters.get("FlowCellSerialBarcode", "")
+    match = re.match(RUN_FOLDER_PATTERN, os.path.basename(run_dir))
+    if match:
+        info["run_id"] = info["run_id"] or os.path.basename(run_dir)
+        info["instrument"] = info["instrument"] or match.group(1)
+        info["flowcell"] = info["flowcell"] or match.group(2)
+    if not info["flowcell"]:
+        # no run folder found, sheets used to be two levels below it
+        parts = sheet_path.split("/")
+        info["flowcell"] = parts[-3].split("_")[-1] if len(parts) > 2 else ""
+        logging.warning(f"No run folder of {sheet_path}, flowcell {info['flowcell']}")
+    return RunContext(run_dir, header=header, parameters=parameters, **info)
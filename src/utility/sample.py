@@ -0,0 +1,138 @@
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from .dragen_utility import (
+    SH_NORMAL,
+    SH_OVERRIDE,
+    SH_PARAM,
+    SH_SAMPLE,
+    SH_SM_PROJ,
+    SH_TARGET,
+    SH_TUMOR,
+    SHA_FPRINT,
+    SHA_FPSTATE,
+    SHA_INDEX,
+    SHA_LANES,
+    SHA_NPATH,
+    SHA_NREG,
+    SHA_RTYPE,
+    SHA_SSFPATH,
+    SHA_TRG_NAME,
+)
+from .profile_cache import load_profile, profile_body, PROFILES
+
+# sample sheet columns read by the pipelines
+SHEET_FIELDS = (
+    "Lane",
+    SH_SM_PROJ,
+    SH_SAMPLE,
+    "Sample_Name",
+    "RefGenome",
+    SH_TARGET,
+    "AdapterTrim",
+    "pipeline",
+    SH_PARAM,
+    SH_OVERRIDE,
+    SH_TUMOR,
+    SH_NORMAL,
+)
+# values added while planning
+DERIVED_FIELDS = (
+    SHA_INDEX,
+    SHA_SSFPATH,
+    SHA_NPATH,
+    SHA_NREG,
+    SHA_RTYPE,
+    SHA_TRG_NAME,
+    SHA_LANES,
+    SHA_FPRINT,
+    SHA_FPSTATE,
+    "fastq_dir",
+    "dry_run",
+    "disable_scripts",
+)
+FIELDS = SHEET_FIELDS + DERIVED_FIELDS
+_FIELD_SET = frozenset(FIELDS)
+
+
+class Sample(MutableMapping):
+    """
+    Compact sample sheet row
+
+    Only columns used by the pipelines and the derived values are kept as
+    slots, other columns asked for are kept in a small dict. Works as a
+    mapping so the utility functions can use it as the row dict.
+    """
+
+    __slots__ = FIELDS + ("_extra_cols",)
+
+    def __init__(self, row: Optional[Dict[str, Any]] = None) -> None:
+        self._extra_cols: Optional[Dict[str, Any]] = None
+        if row:
+            for key, val in row.items():
+                self[key] = val
+
+    def __getitem__(self, key: str) -> Any:
+        if key in _FIELD_SET:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra_cols is not None and key in self._extra_cols:
+            return self._extra_cols[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, val: Any) -> None:
+        if key in _FIELD_SET:
+            setattr(self, key, val)
+            return
+        if self._extra_cols is None:
+            self._extra_cols = {}
+        self._extra_cols[key] = val
+
+    def __delitem__(self, key: str) -> None:
+        if key in _FIELD_SET:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+            return
+        if self._extra_cols is None or key not in self._extra_cols:
+            raise KeyError(key)
+        del self._extra_cols[key]
+
+    def __iter__(self) -> Iterator[str]:
+        for key in FIELDS:
+            if hasattr(self, key):
+                yield key
+        if self._extra_cols:
+            yield from self._extra_cols
+
+    def __len__(self) -> int:
+        extra = len(self._extra_cols) if self._extra_cols else 0
+        return sum(1 for key in FIELDS if hasattr(self, key)) + extra
+
+    def __repr__(self) -> str:
+        return f"Sample({dict(self.items())})"
+
+
+def profile_columns() -> List[str]:
+    # columns profiles save into samplesheet_text.json
+    columns = []
+    for profile_f in PROFILES:
+        profile = profile_body(load_profile(profile_f))
+        columns.extend(profile.get("samplesheet") or [])
+    return columns
+
+
+def to_samples(excel: List[dict], keep: Iterable[str] = ()) -> List[Sample]:
+    """Convert parsed sheet rows, dropping columns nobody reads"""
+    keep = set(keep)
+    samples = []
+    for row in excel:
+        sample = Sample()
+        for key, val in row.items():
+            if key in _FIELD_SET or key in keep:
+                sample[key] = val
+        samples.append(sample)
+    return samples
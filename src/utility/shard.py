@@ -0,0 +1,37 @@
+from typing import List, Tuple
+import zlib
+
+from .dragen_utility import render_groups, SH_SAMPLE, SH_SM_PROJ
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """'i/N' as (i, N), shards are counted from 1"""
+    try:
+        index, count = (int(i) for i in value.split("/"))
+    except ValueError:
+        raise ValueError(f"Shard '{value}' is not of form i/N")
+    if not 1 <= index <= count:
+        raise ValueError(f"Shard '{value}' out of range, i must be 1 to N")
+    return index, count
+
+
+def shard_of(key: str, count: int) -> int:
+    # crc32 is the same on every host, unlike hash()
+    return zlib.crc32(key.encode()) % count + 1
+
+
+def shard_rows(excel: List[dict], index: int, count: int) -> List[dict]:
+    """
+    Rows of shard index out of count, in sheet order
+
+    Rows sharing a sample dir and paired tumors with their normal are in one
+    shard, chosen by the smallest sample key of the group. Every instance
+    given the same sheet splits it the same way.
+    """
+    groups = render_groups(excel, list(range(len(excel))), with_normals=True)
+    keep = set()
+    for group in groups:
+        key = min(f"{excel[i][SH_SM_PROJ]}/{excel[i][SH_SAMPLE]}" for i in group)
+        if shard_of(key, count) == index:
+            keep.update(group)
+    return [row for i, row in enumerate(excel) if i in keep]
@@ -0,0 +1,123 @@
+import logging
+import random
+import threading
+import time
+from typing import Callable, Iterable, List, Optional
+
+from .flow import JobResult
+
+# sysexits codes for temporary failures, e.g. scheduler not answering
+DEFAULT_RETRY_CODES = (69, 75)
+RETRYABLE = "retryable"
+FATAL = "fatal"
+TIMED_OUT = "timed out"
+
+
+class TokenBucket(object):
+    """
+    Allow rate calls per second on average with bursts of burst calls
+
+    A rate of 0 or less means no limit.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.clock = clock
+        self.sleep = sleep
+        self.last = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take a token, waiting for one if needed. Returns time waited"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= 1
+            wait = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+        if wait:
+            self.sleep(wait)
+        return wait
+
+
+def classify(result: JobResult, retry_codes: Iterable[int]) -> str:
+    # killed submitter may have queued the job already, never resubmit it
+    if result.timed_out:
+        return TIMED_OUT
+    if result.returncode in retry_codes:
+        return RETRYABLE
+    return FATAL
+
+
+class SubmitController(object):
+    """
+    Submit through a rate limit, retrying temporary failures
+
+    Retries wait base_delay * 2**attempt seconds at most max_delay, with full
+    jitter so that several dragenflow runs don't retry in step. Submissions
+    that failed for good are kept for the final report.
+    """
+
+    def __init__(
+        self,
+        rate: float = 0,
+        burst: int = 1,
+        retries: int = 3,
+        base_delay: float = 2.0,
+        max_delay: float = 60.0,
+        retry_codes: Iterable[int] = DEFAULT_RETRY_CODES,
+        sleep: Callable[[float], None] = time.sleep,
+        jitter: Callable[[float, float], float] = random.uniform,
+    ) -> None:
+        self.bucket = TokenBucket(rate, burst, sleep=sleep)
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_codes = set(retry_codes)
+        self.sleep = sleep
+        self.jitter = jitter
+        self.failed: List[tuple] = []
+
+    def backoff(self, attempt: int) -> float:
+        return self.jitter(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def submit(
+        self, execute: Callable[[], JobResult], sample: Optional[str] = None
+    ) -> JobResult:
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            result = execute()
+            if result.returncode == 0:
+                return result
+            kind = classify(result, self.retry_codes)
+            if kind != RETRYABLE or attempt >= self.retries:
+                if kind == RETRYABLE:
+                    kind = f"{kind}, gave up after {attempt + 1} attempts"
+                self.failed.append((sample or result.wd_path, result, kind))
+                return result
+            delay = self.backoff(attempt)
+            attempt += 1
+            logging.warning(
+                f"{sample or result.wd_path}: return code {result.returncode}, "
+                f"retry {attempt} of {self.retries} in {delay:.1f}s"
+            )
+            self.sleep(delay)
+
+    def report(self) -> List[str]:
+        """Lines describing submissions that never succeeded"""
+        return [
+            f"Not submitted {sample}: return code {result.returncode} ({kind}), "
+            f"see {result.stderr_log}"
+            for sample, result, kind in self.failed
+        ]
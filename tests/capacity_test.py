@@ -0,0 +1,132 @@
+from collections import namedtuple
+
+import pytest
+
+from src.utility import capacity
+from src.utility.capacity import (
+    CapacityPlanner,
+    fastq_bytes,
+    pipeline_kind,
+    planned_sources,
+)
+from src.utility.dragen_utility import (
+    SH_NORMAL,
+    SH_PARAM,
+    SH_SAMPLE,
+    SH_TARGET,
+    SHA_RTYPE,
+    srun_cli,
+)
+from src.utility.fs_meta import fs
+from src.utility.ref_batch import row_job
+
+Usage = namedtuple("Usage", "total used free")
+MB = 2 ** 20
+
+
+def with_fastqs(data, size=MB):
+    for read_n in [1, 2]:
+        name = f"{data[SH_SAMPLE]}_S1_L001_R{read_n}_001.fastq.gz"
+        (data["fastq_dir"] / name).write_bytes(b"\0" * (size // 2))
+    return data
+
+
+def make_job(data):
+    script = f"dragen --output-file-prefix {data[SH_SAMPLE]}"
+    return row_job(data, [srun_cli(f"dragen-{data[SH_SAMPLE]}", script)])
+
+
+def finish(data, output):
+    # job file and replay of a sample that ran
+    logs = data["fastq_dir"] / "logs"
+    logs.mkdir()
+    (logs / "run.job").write_text(f"dragen --output-file-prefix {data[SH_SAMPLE]}\n")
+    (data["fastq_dir"] / f"{data[SH_SAMPLE]}-replay.json").write_bytes(b"\0" * output)
+
+
+@pytest.fixture
+def free_space(monkeypatch):
+    def set_free(free):
+        usage = Usage(100 * MB, 0, free)
+        monkeypatch.setattr(capacity.shutil, "disk_usage", lambda path: usage)
+
+    fs.invalidate()
+    return set_free
+
+
+def test_pipeline_kind():
+    row = {SH_PARAM: "", SH_TARGET: "targets.bed"}
+    assert pipeline_kind(row) == "exome"
+    assert pipeline_kind(dict(row, **{SH_PARAM: "umi_tumor"})) == "umi"
+    assert pipeline_kind(dict(row, **{SH_PARAM: "methylation_directional"})) == (
+        "methylation"
+    )
+    assert pipeline_kind(dict(row, **{SH_PARAM: "genome"})) == "genome"
+
+
+def test_jobs_over_free_space_deferred_with_their_tumors(free_space, make_row):
+    # 5 MB reserved, 1.3 MB needed per MB of fastqs
+    free_space(8 * MB)
+    tumor = make_row("T1", **{SHA_RTYPE: "somatic_paired", SH_NORMAL: "N1"})
+    jobs = [
+        make_job(with_fastqs(make_row("S1"))),
+        make_job(with_fastqs(make_row("N1"), 2 * MB)),
+        make_job(with_fastqs(make_row("S2"))),
+        make_job(with_fastqs(tumor, MB // 10)),
+    ]
+    kept = CapacityPlanner().fit(jobs, [i.members[0][0] for i in jobs])
+    assert [i.sample for i in kept] == ["proj/S1", "proj/S2"]
+    free_space(MB)
+    with pytest.raises(RuntimeError):
+        CapacityPlanner("reject").fit(jobs, [i.members[0][0] for i in jobs])
+
+
+def test_ratio_learnt_from_samples_that_ran(tmp_path, free_space, make_row):
+    free_space(50 * MB)
+    done = [with_fastqs(make_row(f"D{i}")) for i in range(3)]
+    for data in done:
+        finish(data, 3 * MB)
+    jobs = [make_job(with_fastqs(make_row("S1")))]
+    history = str(tmp_path / "history.json")
+    planner = CapacityPlanner(history_file=history)
+    assert planner.fit(jobs, done + [jobs[0].members[0][0]]) == jobs
+    assert planner.ratio("genome") == pytest.approx(3.0)
+    assert planner.ratio("rna") == capacity.OUTPUT_RATIO["rna"]
+    assert len(planner.history) == 3
+    # history carries over to a run that has no finished samples
+    free_space(7 * MB)
+    assert CapacityPlanner(history_file=history).fit(jobs, []) == []
+
+
+def test_fastqs_still_to_be_moved_measured_at_source(tmp_path, free_space, make_row):
+    free_space(50 * MB)
+    data = with_fastqs(make_row("S1"))
+    sample_dir = data["fastq_dir"]
+    # fastqs of a fresh run are next to the sample dir until moved into it
+    fastqs = sorted(sample_dir.glob("*.fastq.gz"))
+    for fastq in fastqs:
+        fastq.rename(tmp_path / "proj" / fastq.name)
+    fs.invalidate()
+    with fs.recording() as actions:
+        for fastq in fastqs:
+            fs.move(tmp_path / "proj" / fastq.name, sample_dir)
+        # planned path, the file is not there yet
+        assert fastq_bytes(data) == 0
+        assert fastq_bytes(data, planned_sources(actions)) == MB
+        jobs = [make_job(data)]
+        planner = CapacityPlanner()
+        assert planner.fit(jobs, [data], actions) == jobs
+        assert list(planner.estimate(jobs[0]).values()) == [int(1.3 * MB)]
+
+
+def test_history_dirs_not_walked_again(free_space, monkeypatch, make_row):
+    free_space(50 * MB)
+    done = [with_fastqs(make_row(f"D{i}")) for i in range(3)]
+    for data in done:
+        finish(data, 3 * MB)
+    planner = CapacityPlanner()
+    assert planner.observe(done, set()) == 3
+    walked = []
+    monkeypatch.setattr(capacity, "output_bytes", lambda *i: walked.append(i))
+    assert planner.observe(done, set()) == 0
+    assert walked == []
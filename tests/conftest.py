@@ -1,7 +1,57 @@
 from os.path import dirname, join
 import sys
 
+import pytest
+
 my_path = dirname(__file__)
 my_path = join(my_path, "..")
 
 sys.path.insert(0, my_path)
+
+from src.utility.dragen_utility import (  # noqa: E402
+    SH_NORMAL,
+    SH_PARAM,
+    SH_SAMPLE,
+    SH_SM_PROJ,
+    SH_TARGET,
+    SH_TUMOR,
+    SHA_INDEX,
+    SHA_NPATH,
+    SHA_RTYPE,
+    SHA_SSFPATH,
+)
+
+
+@pytest.fixture
+def make_row(tmp_path):
+    """
+    Factory of sample sheet rows with their sample dir made in tmp_path
+
+    A row is a germline genome row of lane 1, keyword arguments override or
+    add columns. With run the sheet is in a run folder of that name.
+    """
+
+    def make(sample="S1", project="proj", run="", **columns):
+        run_dir = tmp_path / run if run else tmp_path
+        fastq_dir = run_dir / project / sample
+        fastq_dir.mkdir(parents=True, exist_ok=True)
+        row = {
+            SH_SM_PROJ: project,
+            SH_SAMPLE: sample,
+            "Sample_Name": sample,
+            SH_PARAM: "genome",
+            SH_TARGET: "",
+            SH_TUMOR: "0",
+            SH_NORMAL: "",
+            SHA_NPATH: "",
+            SHA_RTYPE: "germline",
+            SHA_INDEX: 1,
+            SHA_SSFPATH: str(run_dir / "sheet.csv"),
+            "Lane": "1",
+            "RefGenome": "GRCh38",
+            "fastq_dir": fastq_dir,
+        }
+        row.update(columns)
+        return row
+
+    return make
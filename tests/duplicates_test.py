@@ -0,0 +1,52 @@
+from src.utility.dragen_utility import SH_SAMPLE, SHA_INDEX, set_rgid, srun_cli
+from src.utility.duplicates import drop_copies, drop_same_outputs, output_targets
+
+
+RUN = "210317_A00464_0300_BHW7FTDMXX"
+
+
+def run_row(make_row, index, sample="S1", lane="1"):
+    return make_row(sample, run=RUN, Lane=lane, **{SHA_INDEX: index})
+
+
+def submission(data, extra=""):
+    fastq = f"{data['Sample_Name']}_S{data[SHA_INDEX]}_L00{data['Lane']}_R1_001"
+    script = (
+        f"dragen --output-directory . --output-file-prefix {data[SH_SAMPLE]} "
+        f"--fastq-file1 {fastq}.fastq.gz --RGID {set_rgid(data)}{extra}"
+    )
+    return data, [srun_cli(f"dragen-{data[SH_SAMPLE]}", script)]
+
+
+def test_output_targets(make_row):
+    data, commands = submission(run_row(make_row, 1))
+    assert output_targets(data, commands) == {(str(data["fastq_dir"]), "S1")}
+    assert output_targets(data, ["echo S1"]) == frozenset()
+
+
+def test_copy_of_a_row_left_out(make_row):
+    rows = [run_row(make_row, 1), run_row(make_row, 2, "S2"), run_row(make_row, 3)]
+    kept, lines = drop_copies(rows)
+    assert [i[SHA_INDEX] for i in kept] == [1, 2]
+    assert lines == ["Skipping proj/S1 row 3, same as row 1"]
+    # other lane of the sample is no copy
+    assert drop_copies([rows[0], run_row(make_row, 3, lane="2")])[1] == []
+
+
+def test_same_outputs_left_out_or_reported(make_row):
+    rows = [
+        submission(run_row(make_row, 1)),
+        submission(run_row(make_row, 2, lane="2")),
+        submission(run_row(make_row, 3)),
+        submission(run_row(make_row, 4, "S2")),
+    ]
+    # row 3 differs from row 1 in its index and some column no command uses
+    rows[2][0]["Description"] = "rerun"
+    kept, dropped, lines = drop_same_outputs(rows)
+    assert kept == [rows[0], rows[1], rows[3]]
+    assert dropped == [rows[2]]
+    assert lines[0].startswith("Conflict: proj/S1 row 2 writes S1 in")
+    assert lines[0].endswith("like row 1 with other options")
+    assert lines[1].startswith("Skipping proj/S1 row 3 writes S1 in")
+    assert lines[1].endswith("like row 1 with the same options")
+    assert len(lines) == 2
@@ -0,0 +1,139 @@
+import os
+import subprocess
+
+from src.utility.dragen_utility import (
+    SH_NORMAL,
+    SH_SAMPLE,
+    SHA_RTYPE,
+    srun_cli,
+)
+from src.utility.executors import (
+    dependency_waves,
+    job_dependencies,
+    LocalExecutor,
+    SbatchArrayExecutor,
+)
+from src.utility.job_monitor import (
+    COMPLETED,
+    FAILED,
+    JobMonitor,
+    PENDING,
+    RUNNING,
+    SlurmScheduler,
+)
+from src.utility.ref_batch import jobfile_path, row_job
+from src.utility.submit_control import SubmitController
+
+
+def make_job(data, script):
+    return row_job(data, [srun_cli(f"dragen-{data[SH_SAMPLE]}", script)])
+
+
+def paired_jobs(make_row, normal_script="true"):
+    normal = make_row("N1")
+    return [
+        make_job(normal, f"echo normal >> ../order; {normal_script}"),
+        make_job(make_row("S1"), "echo other >> ../order"),
+        make_job(make_row("N1", Lane="2"), "echo lane2 >> ../order"),
+        make_job(
+            make_row("T1", **{SHA_RTYPE: "somatic_paired", SH_NORMAL: "N1"}),
+            "echo tumor >> ../order",
+        ),
+    ]
+
+
+def submit_all(executor, jobs):
+    executor.prepare(jobs)
+    controller = SubmitController()
+    return [r for job in jobs for r in executor.submit(job, controller)]
+
+
+def test_tumor_waits_for_last_job_of_its_normal(make_row):
+    jobs = paired_jobs(make_row)
+    assert job_dependencies(jobs) == [[], [], [0], [2]]
+    assert dependency_waves(jobs) == [0, 0, 1, 2]
+
+
+def test_local_jobs_run_after_their_dependencies(tmp_path, make_row):
+    executor = LocalExecutor(max_running=4)
+    results = submit_all(executor, paired_jobs(make_row))
+    assert executor.finish() == []
+    order = (tmp_path / "proj" / "order").read_text().split()
+    assert order.index("normal") < order.index("lane2") < order.index("tumor")
+    states = executor.status([i.job_id for i in results])
+    assert set(states.values()) == {COMPLETED}
+    # check_has_run finds the dragen lines of a sample run here
+    assert os.path.isfile(jobfile_path(make_row("T1")))
+
+
+def test_failed_dependency_fails_waiting_jobs(tmp_path, make_row):
+    executor = LocalExecutor(max_running=2)
+    results = submit_all(executor, paired_jobs(make_row, "exit 3"))
+    failed = executor.finish()
+    assert len(failed) == 3
+    states = executor.status([i.job_id for i in results])
+    assert [states[i.job_id] for i in results] == [FAILED, COMPLETED, FAILED, FAILED]
+    order = (tmp_path / "proj" / "order").read_text().split()
+    assert sorted(order) == ["normal", "other"]
+    with open(results[3].stderr_log) as err:
+        assert "not run" in err.read()
+
+
+def test_arrays_wait_for_tasks_of_their_jobs(tmp_path, make_row):
+    sbatch = tmp_path / "sbatch"
+    calls = tmp_path / "calls"
+    sbatch.write_text(
+        f'#!/bin/sh\necho "$@" >> {calls}\n'
+        f'echo Submitted batch job $((76 + $(wc -l < {calls})))\n'
+    )
+    sbatch.chmod(0o755)
+    executor = SbatchArrayExecutor(str(sbatch), max_running=2)
+    jobs = paired_jobs(make_row)
+    jobs.append(make_job(make_row("S1", Lane="2"), "echo s1 >> ../order"))
+    results = submit_all(executor, jobs)
+    assert [i.job_id for i in results] == ["77_0", "77_1", "78_0", "79_0", "80_0"]
+    assert results[1].wd_path == str(tmp_path / "proj" / "S1")
+    arrays = calls.read_text().splitlines()
+    assert len(arrays) == 4
+    assert "--array=0-1%2" in arrays[0] and "-p dragen.q" in arrays[0]
+    assert "--dependency" not in arrays[0]
+    # lane 2 of N1 waits for N1 only, not for S1 in the same array
+    assert "--dependency=afterok:77_0 --kill-on-invalid-dep=yes" in arrays[1]
+    assert "--dependency=afterok:78_0 " in arrays[2]
+    assert "--dependency=afterok:77_1 " in arrays[3]
+    # a task runs the commands of its job in the job dir
+    env = dict(os.environ, SLURM_ARRAY_TASK_ID="1")
+    subprocess.run(["bash", executor.script_path(0)], env=env, check=True)
+    assert (tmp_path / "proj" / "order").read_text() == "other\n"
+
+
+def test_array_without_id_of_its_dependency_not_submitted(tmp_path, make_row):
+    sbatch = tmp_path / "sbatch"
+    sbatch.write_text(f"#!/bin/sh\necho \"$@\" >> {tmp_path}/calls\necho queued\n")
+    sbatch.chmod(0o755)
+    executor = SbatchArrayExecutor(str(sbatch))
+    results = submit_all(executor, paired_jobs(make_row))
+    # only the first array went to sbatch, no id was printed for it
+    assert len((tmp_path / "calls").read_text().splitlines()) == 1
+    assert [i.returncode for i in results[2:]] == [-1, -1]
+    assert [i.job_id for i in results] == ["", "", "", ""]
+    with open(results[3].stderr_log) as err:
+        assert "not submitted" in err.read()
+
+
+def test_pending_array_tasks_tracked(tmp_path, make_row):
+    sbatch = tmp_path / "sbatch"
+    sbatch.write_text("#!/bin/sh\necho Submitted batch job 77\n")
+    sbatch.chmod(0o755)
+    sacct = tmp_path / "sacct"
+    sacct.write_text("#!/bin/sh\necho '77_0|RUNNING'\necho '77_[1-3%2]|PENDING'\n")
+    sacct.chmod(0o755)
+    executor = SbatchArrayExecutor(str(sbatch))
+    jobs = [make_job(make_row(f"S{i}"), "true") for i in range(3)]
+    results = submit_all(executor, jobs)
+    assert [i.job_id for i in results] == ["77_0", "77_1", "77_2"]
+    monitor = JobMonitor(SlurmScheduler(str(sacct)), max_unknown=1)
+    for result in results:
+        monitor.track(result.job_id, "proj/S")
+    assert monitor.poll() == []
+    assert monitor.states == {"77_0": RUNNING, "77_1": PENDING, "77_2": PENDING}
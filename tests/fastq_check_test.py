@@ -0,0 +1,122 @@
+import gzip
+
+import pytest
+
+from src.utility.dragen_utility import fastq_file, ora_options
+from src.utility.fastq_check import (
+    CACHE_NAME,
+    check_gzip,
+    pair_problem,
+    preflight_fastq,
+)
+from src.utility.fs_meta import fs
+
+
+@pytest.fixture
+def run_dir(tmp_path):
+    project = tmp_path / "testproject"
+    (project / "testsample").mkdir(parents=True)
+    data = b"@read\nACGT\n+\nFFFF\n" * 1000
+    for read_n in [1, 2]:
+        with open(project / f"testsample_S1_L001_R{read_n}_001.fastq.gz", "wb") as f:
+            f.write(gzip.compress(data))
+    return tmp_path
+
+
+@pytest.fixture
+def excel_dict(run_dir, make_row):
+    return make_row("testsample", "testproject", SampleID="testsample")
+
+
+def test_check_gzip(tmp_path):
+    good = tmp_path / "good.fastq.gz"
+    good.write_bytes(gzip.compress(b"@read\nACGT\n+\nFFFF\n" * 1000))
+    assert check_gzip(str(good)) == ""
+    truncated = tmp_path / "truncated.fastq.gz"
+    truncated.write_bytes(good.read_bytes()[:-6])
+    assert "truncated" in check_gzip(str(truncated))
+    empty = tmp_path / "empty.fastq.gz"
+    empty.write_bytes(b"")
+    assert check_gzip(str(empty)) == "empty file"
+    plain = tmp_path / "plain.fastq.gz"
+    plain.write_bytes(b"@read\nACGT\n")
+    assert check_gzip(str(plain)) == "not a gzip file"
+
+
+def test_check_gzip_magic_inside_member(tmp_path):
+    # stored blocks keep the magic bytes of the data as they are
+    data = (b"@read\nACGT\n+\n" + b"\x1f\x8b\x08" * 30 + b"\n") * 20000
+    stored = tmp_path / "stored.fastq.gz"
+    stored.write_bytes(gzip.compress(data, compresslevel=0))
+    assert check_gzip(str(stored)) == ""
+    corrupt = tmp_path / "corrupt.fastq.gz"
+    corrupt.write_bytes(stored.read_bytes()[:10] + b"\xff" * 100)
+    assert check_gzip(str(corrupt)) == "corrupt first block"
+
+
+@pytest.mark.parametrize(
+    "sizes,expected",
+    [({1: 100, 2: 90}, False), ({1: 100, 2: 10}, True), ({1: 100}, False)],
+)
+def test_pair_problem(sizes, expected):
+    assert bool(pair_problem(sizes)) == expected
+
+
+def test_preflight_fastq(excel_dict, run_dir):
+    assert preflight_fastq([excel_dict], workers=1) == {}
+    assert (run_dir / CACHE_NAME).is_file()
+    # truncate R2, new size invalidates the cached result
+    r2 = run_dir / "testproject" / "testsample_S1_L001_R2_001.fastq.gz"
+    r2.write_bytes(r2.read_bytes()[:-6])
+    problems = preflight_fastq([excel_dict], workers=1)
+    assert list(problems) == ["testproject/testsample"]
+    assert "R2" in problems["testproject/testsample"][0]
+
+
+def test_preflight_umi_sample(excel_dict, run_dir):
+    # short umi read R2 is not compared with the mates R1 and R3
+    project = run_dir / "testproject"
+    mate = project / "testsample_S1_L001_R1_001.fastq.gz"
+    (project / "testsample_S1_L001_R3_001.fastq.gz").write_bytes(mate.read_bytes())
+    (project / "testsample_S1_L001_R2_001.fastq.gz").write_bytes(
+        gzip.compress(b"@read\nAC\n+\nFF\n")
+    )
+    excel_dict["pipeline_parameters"] = "umi"
+    assert preflight_fastq([excel_dict], workers=1) == {}
+    assert pair_problem({1: 100, 2: 10, 3: 90}, (1, 3)) == ""
+    assert pair_problem({1: 100, 2: 90, 3: 10}, (1, 3)).startswith("R1/R3")
+
+
+def test_preflight_missing(excel_dict):
+    excel_dict["pipeline_parameters"] = "umi"
+    problems = preflight_fastq([excel_dict], workers=1)
+    assert "R3" in problems["testproject/testsample"][0]
+
+
+def test_ora_fastqs_chosen_per_sample(excel_dict, run_dir):
+    project = run_dir / "testproject"
+    assert fastq_file(excel_dict, 1, False).endswith(".fastq.gz")
+    for read_n in [1, 2]:
+        name = f"testsample_S1_L001_R{read_n}_001.fastq"
+        (project / f"{name}.gz").unlink()
+        (project / f"{name}.ora").write_bytes(b"ora data")
+    fs.invalidate()
+    excel_dict["dry_run"] = False
+    fastq_f = fastq_file(excel_dict, 1)
+    assert fastq_f == "testsample_S1_L001_R1_001.fastq.ora"
+    assert (project / "testsample" / fastq_f).is_file()
+    # not gzip, still passes preflight
+    assert preflight_fastq([excel_dict], workers=1) == {}
+    (project / "testsample_S1_L001_R2_001.fastq.ora").write_bytes(b"")
+    problems = preflight_fastq([excel_dict], workers=1)
+    assert any("empty file" in i for i in problems["testproject/testsample"])
+
+
+def test_ora_reference_option():
+    template = {"ref_parameters": {"RefGenome": {"hg": {"ora_reference": "/ora"}}}}
+    excel = {"RefGenome": "hg", "Sample_Name": "S1"}
+    assert ora_options(excel, template, {"fastq-file1": "a.fastq.gz"}) == {}
+    options = {"fastq-file1": "a.fastq.ora"}
+    assert ora_options(excel, template, options) == {"ora-reference": "/ora"}
+    with pytest.raises(ValueError):
+        ora_options(excel, {"ref_parameters": {"RefGenome": {"hg": {}}}}, options)
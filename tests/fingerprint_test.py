@@ -0,0 +1,77 @@
+import pytest
+
+from src.utility.fingerprint import (
+    load_fingerprint,
+    lost_rows,
+    row_fingerprint,
+    save_fingerprint,
+    stale_outputs,
+)
+
+
+@pytest.fixture
+def excel_dict(make_row):
+    return make_row(
+        "testsample", "testproject", SampleID="testsample", override="", dry_run=False
+    )
+
+
+def test_row_fingerprint(excel_dict, tmp_path):
+    fingerprint = row_fingerprint(excel_dict)
+    excel_dict["dry_run"] = True
+    assert row_fingerprint(excel_dict) == fingerprint
+    assert row_fingerprint(excel_dict, "normal") != fingerprint
+    # override file content is part of the fingerprint
+    override = tmp_path / "override.tsv"
+    override.write_text("dragen option\toption value\nenable-sv\tfalse\n")
+    excel_dict["override"] = str(override)
+    with_override = row_fingerprint(excel_dict)
+    assert with_override != fingerprint
+    override.write_text("dragen option\toption value\nenable-sv\ttrue\n")
+    assert row_fingerprint(excel_dict) != with_override
+
+
+def test_sheet_path_relative_or_absolute(excel_dict, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    excel_dict["_file_path"] = "sheet.csv"
+    fingerprint = row_fingerprint(excel_dict)
+    excel_dict["_file_path"] = str(tmp_path / "sheet.csv")
+    assert row_fingerprint(excel_dict) == fingerprint
+
+
+def test_save_fingerprint(excel_dict):
+    assert load_fingerprint(excel_dict) is None
+    cmd = "srun.py -n x -c 'dragen --output-file-prefix testsample --enable-sv true'"
+    save_fingerprint(excel_dict, "abc", [cmd])
+    stored = load_fingerprint(excel_dict)
+    assert stored["fingerprint"] == "abc"
+    assert stored["job_id"] == ""
+    assert stored["prefixes"] == ["testsample"]
+    # other row in the same sample dir is stored separately
+    excel_dict["row_index"] = 2
+    assert load_fingerprint(excel_dict) is None
+    assert stale_outputs(excel_dict, stored) == []
+    replay = excel_dict["fastq_dir"] / "testsample-replay.json"
+    replay.write_text("{}")
+    assert stale_outputs(excel_dict, stored) == [str(replay)]
+
+
+class Scheduler(object):
+    def __init__(self, states):
+        self.states = states
+
+    def status(self, job_ids):
+        if self.states is None:
+            raise OSError("sacct not found")
+        return {i: self.states[i] for i in job_ids if i in self.states}
+
+
+def test_lost_rows():
+    rows = [{"n": i} for i in range(4)]
+    pending = [(rows[0], "1"), (rows[1], "2"), (rows[2], "3"), (rows[3], "")]
+    scheduler = Scheduler({"1": "running", "2": "failed"})
+    # only the failed one, unknown to scheduler or no job id might still run
+    assert lost_rows(pending, scheduler) == rows[1:2]
+    assert lost_rows(pending[:1], Scheduler({"1": "completed"})) == rows[:1]
+    assert lost_rows(pending[:1], Scheduler({"1": "pending"})) == []
+    assert lost_rows(pending, Scheduler(None)) == []
@@ -1,3 +1,5 @@
+import subprocess
+
 import pytest
 
 from src.utility.flow import Flow, FlowConstructor
@@ -53,3 +55,21 @@ def test_echo_flow(flow_context_echo):
     assert output.returncode == 0
     assert command == ["ls", "-l", "./tests"]
     assert str_command == ["ls -l ./tests"]
+
+
+def test_flow_output_to_log_files(tmp_path):
+    log_prefix = str(tmp_path / "job1")
+    output, command = FlowConstructor.execute_flow(
+        command="sh -c 'echo out; echo err >&2'", log_prefix=log_prefix
+    )
+    assert output.returncode == 0
+    assert output.stdout is None
+    assert (tmp_path / "job1.out").read_text() == "out\n"
+    assert (tmp_path / "job1.err").read_text() == "err\n"
+
+
+def test_flow_timeout(tmp_path):
+    with pytest.raises(subprocess.TimeoutExpired):
+        FlowConstructor.execute_flow(
+            command="sleep 5", timeout=0.2, log_prefix=str(tmp_path / "job1")
+        )
@@ -0,0 +1,69 @@
+from src.utility.fs_meta import FsMeta
+
+
+def test_siblings_share_one_listing(tmp_path):
+    for name in ["a.fastq.gz", "b.fastq.gz"]:
+        (tmp_path / name).write_bytes(b"")
+    (tmp_path / "logs").mkdir()
+    fs = FsMeta()
+    assert fs.isfile(tmp_path / "a.fastq.gz")
+    assert fs.exists(tmp_path / "b.fastq.gz")
+    assert fs.isdir(tmp_path / "logs")
+    assert not fs.isfile(tmp_path / "logs")
+    assert not fs.exists(tmp_path / "c.fastq.gz")
+    assert fs.stats()["misses"] == 1
+    assert fs.stats()["hits"] == 4
+
+
+def test_missing_parent(tmp_path):
+    fs = FsMeta()
+    assert not fs.exists(tmp_path / "nodir" / "a.fastq.gz")
+    assert not fs.isdir(tmp_path / "nodir")
+
+
+def test_changes_made_through_cache_are_seen(tmp_path):
+    src_dir = tmp_path / "proj"
+    src_dir.mkdir()
+    (src_dir / "a.fastq.gz").write_bytes(b"")
+    fs = FsMeta()
+    assert not fs.isdir(src_dir / "sample")
+    fs.mkdir(src_dir / "sample")
+    assert fs.isdir(src_dir / "sample")
+    assert fs.listdir(src_dir / "sample") == []
+    fs.move(src_dir / "a.fastq.gz", src_dir / "sample")
+    assert not fs.exists(src_dir / "a.fastq.gz")
+    assert fs.isfile(src_dir / "sample" / "a.fastq.gz")
+    assert fs.listdir(src_dir / "sample") == ["a.fastq.gz"]
+    assert (src_dir / "sample" / "a.fastq.gz").is_file()
+
+
+def test_ttl_expires_listing(tmp_path):
+    fs = FsMeta(ttl=0)
+    assert not fs.exists(tmp_path / "a.txt")
+    # written by someone else, seen once listing expires
+    (tmp_path / "a.txt").write_text("")
+    assert fs.isfile(tmp_path / "a.txt")
+    cached = FsMeta(ttl=60)
+    assert not cached.exists(tmp_path / "b.txt")
+    (tmp_path / "b.txt").write_text("")
+    assert not cached.exists(tmp_path / "b.txt")
+    cached.invalidate(tmp_path)
+    assert cached.exists(tmp_path / "b.txt")
+
+
+def test_recording_changes_nothing_on_disk(tmp_path):
+    (tmp_path / "a.fastq.gz").write_bytes(b"")
+    fs = FsMeta()
+    with fs.recording() as actions:
+        fs.mkdir(tmp_path / "sample")
+        fs.mkdir(tmp_path / "sample" / "logs")
+        fs.move(tmp_path / "a.fastq.gz", tmp_path / "sample")
+        fs.write_text(tmp_path / "sample" / "logs" / "cols.json", "{}")
+        # planned state is what the rest of planning sees
+        assert fs.isdir(tmp_path / "sample" / "logs")
+        assert fs.listdir(tmp_path / "sample") == ["a.fastq.gz", "logs"]
+        assert not fs.exists(tmp_path / "a.fastq.gz")
+        fs.mkdir(tmp_path / "sample", exist_ok=True)
+    assert [i.kind for i in actions] == ["mkdir", "mkdir", "move", "write"]
+    assert sorted(i.name for i in tmp_path.iterdir()) == ["a.fastq.gz"]
+    assert not fs.exists(tmp_path / "sample")
@@ -0,0 +1,142 @@
+import time
+
+from src.utility.job_monitor import (
+    command_handler,
+    COMPLETED,
+    expand_array_id,
+    FAILED,
+    JobMonitor,
+    LocalScheduler,
+    parse_job_id,
+    PENDING,
+    RUNNING,
+    SlurmScheduler,
+)
+
+
+def test_parse_job_id():
+    assert parse_job_id("Submitted batch job 4242\n") == "4242"
+    assert parse_job_id('Your job 17 ("dragen-S1") has been submitted') == "17"
+    assert parse_job_id("no id here") is None
+    assert parse_job_id("job dragen-S12 queued\nSubmitted batch job 99") == "99"
+    assert parse_job_id("job dragen-S12 queued") is None
+
+
+def test_events_from_batched_polls():
+    scheduler = LocalScheduler()
+    monitor = JobMonitor(scheduler, min_interval=0.05, max_interval=0.2)
+    events = []
+    monitor.on(COMPLETED, events.append)
+    monitor.on(FAILED, events.append)
+    monitor.track(scheduler.submit("exit 0"), "proj/N1")
+    monitor.track(scheduler.submit("sleep 0.3; exit 1"), "proj/T1")
+    monitor.track(scheduler.submit("sleep 0.1"), "proj/T2")
+    finished = monitor.wait(timeout=10)
+    assert finished == events
+    assert {(e.sample, e.state) for e in events} == {
+        ("proj/N1", COMPLETED),
+        ("proj/T1", FAILED),
+        ("proj/T2", COMPLETED),
+    }
+    assert not monitor.outstanding
+    # one query per poll however many jobs are outstanding
+    assert scheduler.queries < 15
+
+
+def test_interval_grows_while_nothing_changes():
+    scheduler = LocalScheduler()
+    monitor = JobMonitor(scheduler, min_interval=1, max_interval=4, backoff=2)
+    job_id = scheduler.submit("sleep 5")
+    monitor.track(job_id, "proj/S1")
+    monitor.poll()
+    assert monitor.states[job_id] == RUNNING
+    assert monitor.interval == 1
+    monitor.poll()
+    monitor.poll()
+    monitor.poll()
+    assert monitor.interval == 4
+    scheduler.jobs[job_id].kill()
+    scheduler.jobs[job_id].wait()
+    assert [e.state for e in monitor.poll()] == [FAILED]
+    assert monitor.interval == 1
+
+
+def test_wait_gives_up_after_timeout():
+    slept = []
+    scheduler = LocalScheduler()
+    monitor = JobMonitor(scheduler, min_interval=1, sleep=slept.append)
+    job_id = scheduler.submit("sleep 5")
+    monitor.track(job_id, "proj/S1")
+    assert monitor.wait(timeout=3) == []
+    assert job_id in monitor.outstanding
+    assert sum(slept) >= 3
+    scheduler.jobs[job_id].kill()
+
+
+def test_job_unknown_to_scheduler_fails():
+    scheduler = LocalScheduler()
+    monitor = JobMonitor(scheduler, sleep=lambda i: None, max_unknown=3)
+    events = []
+    monitor.on(FAILED, events.append)
+    monitor.track("12", "proj/S12")
+    assert [e.state for e in monitor.wait()] == [FAILED]
+    assert events[0].sample == "proj/S12"
+    assert scheduler.queries == 3
+    assert not monitor.outstanding
+
+
+def test_slurm_states_from_one_sacct_call(tmp_path):
+    sacct = tmp_path / "sacct"
+    sacct.write_text(
+        "#!/bin/sh\n"
+        "echo '11|COMPLETED'\necho '12|RUNNING'\necho '13|CANCELLED by 0'\n"
+    )
+    sacct.chmod(0o755)
+    scheduler = SlurmScheduler(str(sacct))
+    states = scheduler.status(["11", "12", "13"])
+    assert states == {"11": COMPLETED, "12": RUNNING, "13": FAILED}
+
+
+def test_slurm_states_of_array_tasks(tmp_path):
+    sacct = tmp_path / "sacct"
+    sacct.write_text(
+        "#!/bin/sh\n"
+        f'echo "$@" > {tmp_path}/args.txt\n'
+        "echo '20_1|RUNNING'\necho '20_[2-3,5%2]|PENDING'\necho '21|SUSPENDED'\n"
+        "echo '22|REQUEUE_HOLD'\necho '23|TIMEOUT'\n"
+    )
+    sacct.chmod(0o755)
+    scheduler = SlurmScheduler(str(sacct))
+    states = scheduler.status(["20_1", "20_3", "21", "22", "23"])
+    assert states == {
+        "20_1": RUNNING,
+        "20_2": PENDING,
+        "20_3": PENDING,
+        "20_5": PENDING,
+        "21": RUNNING,
+        "22": PENDING,
+        "23": FAILED,
+    }
+    # tasks asked for by their array job
+    assert "-j 20,21,22,23" in (tmp_path / "args.txt").read_text()
+    assert expand_array_id("7_[1-2]") == ["7_1", "7_2"]
+    assert expand_array_id("7_1") == ["7_1"]
+
+
+def test_jobs_kept_while_scheduler_cannot_be_asked(tmp_path):
+    monitor = JobMonitor(SlurmScheduler(str(tmp_path / "sacct")), max_unknown=1)
+    monitor.track("12", "proj/S12")
+    assert monitor.poll() == []
+    assert monitor.poll() == []
+    assert "12" in monitor.outstanding
+    assert monitor.states["12"] == PENDING
+
+
+def test_command_handler_gets_event(tmp_path):
+    scheduler = LocalScheduler()
+    monitor = JobMonitor(scheduler, min_interval=0.01)
+    monitor.on(COMPLETED, command_handler('echo "$DRAGENFLOW_STATE" > state.txt'))
+    monitor.track(scheduler.submit("true"), "proj/S1", wd_path=str(tmp_path))
+    time.sleep(0.1)
+    monitor.wait(timeout=5)
+    assert (tmp_path / "state.txt").read_text() == "completed\n"
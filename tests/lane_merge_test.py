@@ -0,0 +1,85 @@
+import csv
+
+import pytest
+
+from src.utility.dragen_utility import (
+    drop_fastq_keys,
+    fastq_list_options,
+    get_flow_cell,
+    merge_lanes,
+    SH_PARAM,
+    SHA_INDEX,
+    SHA_LANES,
+)
+
+
+RUN = "210317_A00464_0300_BHW7FTDMXX"
+
+
+@pytest.fixture
+def lane_row(make_row):
+    def make(lane, index, param="genome"):
+        return make_row(
+            "testsample",
+            "testproject",
+            RUN,
+            Lane=lane,
+            SampleID="testsample",
+            dry_run=False,
+            **{SH_PARAM: param, SHA_INDEX: index},
+        )
+
+    return make
+
+
+@pytest.fixture
+def run_dir(tmp_path):
+    sample_dir = tmp_path / RUN / "testproject"
+    (sample_dir / "testsample").mkdir(parents=True)
+    for lane, index in [(1, 1), (2, 2)]:
+        for read_n in [1, 2]:
+            name = f"testsample_S{index}_L00{lane}_R{read_n}_001.fastq.gz"
+            (sample_dir / name).write_bytes(b"")
+    return tmp_path
+
+
+def test_merge_lanes(run_dir, lane_row):
+    rows = [lane_row("1", 1), lane_row("2", 2)]
+    merged = merge_lanes(rows)
+    assert len(merged) == 1
+    assert merged[0][SHA_LANES] == [("1", 1, "testsample"), ("2", 2, "testsample")]
+
+
+@pytest.mark.parametrize(
+    "lanes,param", [(["1", "1"], "genome"), (["1", "2"], "umi")],
+)
+def test_merge_lanes_skipped(run_dir, lane_row, lanes, param):
+    rows = [lane_row(lane, i, param) for i, lane in enumerate(lanes)]
+    assert len(merge_lanes(rows)) == 2
+
+
+def test_fastq_list_options(run_dir, lane_row):
+    row = merge_lanes([lane_row("1", 1), lane_row("2", 2)])[0]
+    cmd = {
+        "ref-dir": "ref",
+        "fastq-file1": "r1",
+        "fastq-file2": "r2",
+        "RGID": "id",
+        "RGSM": "sm",
+        "enable-sort": "true",
+    }
+    new_cmd = fastq_list_options(row, cmd)
+    assert list(new_cmd) == [
+        "ref-dir",
+        "fastq-list",
+        "fastq-list-sample-id",
+        "enable-sort",
+    ]
+    assert new_cmd["fastq-list-sample-id"] == "testsample"
+    with open(f"{row['fastq_dir']}/{new_cmd['fastq-list']}") as lf:
+        lines = list(csv.DictReader(lf))
+    flow_cell = get_flow_cell(row["_file_path"])
+    assert [i["RGID"] for i in lines] == [f"{flow_cell}-1-1", f"{flow_cell}-2-2"]
+    assert lines[1]["Read2File"].endswith("testsample_S2_L002_R2_001.fastq.gz")
+    drop_fastq_keys(new_cmd, "normal", True)
+    assert "fastq-list" not in new_cmd
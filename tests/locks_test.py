@@ -0,0 +1,90 @@
+import time
+
+import pytest
+
+from src.utility.dragen_utility import check_has_run, has_outputs, SHA_QUEUED
+from src.utility.locks import (
+    FileLock,
+    queued_jobs,
+    run_lock,
+    SampleLocks,
+    SUBMITTED_MAX_AGE,
+)
+
+real_time = time.time
+
+
+def test_file_lock_held_once(tmp_path):
+    path = str(tmp_path / "run.lock")
+    first, second = FileLock(path), FileLock(path)
+    assert first.acquire()
+    assert not second.acquire()
+    assert "pid" in second.holder()
+    first.release()
+    assert second.acquire()
+    second.release()
+
+
+def test_sample_locks_of_two_instances(tmp_path):
+    sheet = str(tmp_path / "sheet.csv")
+    ours, theirs = SampleLocks(sheet), SampleLocks(sheet)
+    assert ours.acquire("proj/S1") == ""
+    # rows of a sample already locked by us
+    assert ours.acquire("proj/S1") == ""
+    assert "pid" in theirs.acquire("proj/S1")
+    assert theirs.acquire("proj/S2") == ""
+    ours.release_all()
+    assert theirs.acquire("proj/S1") == ""
+
+
+def test_run_lock_gives_up_after_wait(tmp_path):
+    sheet = str(tmp_path / "sheet.csv")
+    with run_lock(sheet):
+        with pytest.raises(RuntimeError):
+            with run_lock(sheet, wait=0):
+                pass
+    with run_lock(sheet, wait=0):
+        pass
+
+
+class Scheduler(object):
+    def __init__(self, states):
+        self.states = states
+
+    def status(self, job_ids):
+        if self.states is None:
+            raise OSError("sacct not found")
+        return {i: self.states[i] for i in job_ids if i in self.states}
+
+
+def test_submitted_samples_skipped_until_job_finished(tmp_path, monkeypatch):
+    sheet = str(tmp_path / "sheet.csv")
+    keys = {"proj/S1", "proj/S2", "proj/S3"}
+    locks = SampleLocks(sheet)
+    for key, job_id in [("proj/S1", "11"), ("proj/S2", "12"), ("proj/S3", "")]:
+        assert locks.acquire(key) == ""
+        locks.mark_submitted(key, job_id)
+    # a lane of S1 in a second job of this run
+    locks.mark_submitted("proj/S1", "13")
+    locks.release_all()
+    scheduler = Scheduler({"11": "completed", "12": "failed", "13": "pending"})
+    assert queued_jobs(sheet, keys, scheduler) == {"proj/S1": "13"}
+    # not reported, or no scheduler to ask, kept until the marker is old
+    kept = {"proj/S1": "11", "proj/S2": "12"}
+    assert queued_jobs(sheet, keys, Scheduler({})) == kept
+    assert queued_jobs(sheet, keys, Scheduler(None)) == kept
+    monkeypatch.setattr(time, "time", lambda: real_time() + SUBMITTED_MAX_AGE + 1)
+    assert queued_jobs(sheet, keys, Scheduler({})) == {}
+    # a later run replaces the jobs of the sample
+    assert locks.acquire("proj/S1") == ""
+    locks.mark_submitted("proj/S1", "21")
+    assert queued_jobs(sheet, keys, Scheduler({"21": "running"})) == {"proj/S1": "21"}
+    locks.release_all()
+
+
+def test_queued_row_counts_as_run(make_row):
+    data = make_row()
+    assert not check_has_run(data)
+    data[SHA_QUEUED] = "13"
+    assert check_has_run(data)
+    assert not has_outputs(data)
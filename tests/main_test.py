@@ -1,3 +1,6 @@
+from os.path import dirname, join
+import shutil
+
 import pytest
 
 from main import HandleFlow
@@ -8,6 +11,13 @@ def get_handle():
     return HandleFlow()
 
 
+@pytest.fixture
+def run_copy(tmp_path):
+    # runs that are not dry write into sample dirs, keep them off the repo
+    shutil.copytree(join(dirname(__file__), "..", "path"), tmp_path / "path")
+    return tmp_path / "path" / "210317_A00464_0300_BHW7FTDMXX"
+
+
 def test_parse_file(get_handle):
     list_dict = get_handle.parse_file(
         "./path/210317_A00464_0300_BHW7FTDMXX/test_samplesheet_updated.csv", "dragen"
@@ -20,9 +30,9 @@ def test_parse_file(get_handle):
     assert list_dict[1]["row_index"] == 3
 
 
-def test_execute_bash(get_handle):
+def test_execute_bash(get_handle, run_copy):
     list_str = get_handle.execute_bash(
-        "./path/210317_A00464_0300_BHW7FTDMXX/test_samplesheet_updated.csv",
+        str(run_copy / "test_samplesheet_updated.csv"),
         "dragen",
         dry_run=False,
     )
@@ -50,10 +60,10 @@ def test_construct_str(get_handle):
         assert "{" not in val
 
 
-def test_execute_bash_2(get_handle):
+def test_execute_bash_2(get_handle, run_copy):
     with pytest.raises(FileNotFoundError):
         get_handle.execute_bash(
-            "./path/210317_A00464_0300_BHW7FTDMXX/test_samplesheet_updated.csv",
+            str(run_copy / "test_samplesheet_updated.csv"),
             "dragen",
             dry_run=False,
             bash_cmd="queue",
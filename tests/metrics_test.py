@@ -0,0 +1,62 @@
+import os
+
+import pytest
+
+from src.utility.fs_meta import Action, MKDIR, MOVE
+from src.utility.metrics import Metrics, moved_bytes
+
+
+def samples(text):
+    return [i for i in text.splitlines() if not i.startswith("#")]
+
+
+def test_render_textfile_format():
+    metrics = Metrics(run="210317_RUN", shard=(2, 4))
+    metrics.inc("commands", state="submitted", pipeline="genome")
+    metrics.inc("commands", 2, state="submitted", pipeline="genome")
+    metrics.inc("queue_depth", 3, pipeline="rna")
+    metrics.inc("queue_depth", -1, pipeline="rna")
+    text = metrics.render()
+    assert "# TYPE dragenflow_commands gauge" in text
+    assert (
+        'dragenflow_commands{run="210317_RUN",shard="2/4",pipeline="genome",'
+        'state="submitted"} 3'
+    ) in samples(text)
+    assert 'dragenflow_queue_depth{run="210317_RUN",shard="2/4",pipeline="rna"} 2' in (
+        samples(text)
+    )
+    start = [i for i in samples(text) if "start_time" in i][0]
+    assert float(start.split()[-1]) == metrics.get("run_start_time_seconds")
+    with pytest.raises(KeyError):
+        metrics.inc("unknown")
+
+
+def test_stages_written_as_they_end(tmp_path):
+    metrics = Metrics(str(tmp_path / "prom"), run="RUN", shard=(1, 2))
+    metrics.stage("planning")
+    assert not os.path.exists(metrics.path)
+    metrics.stage("submission")
+    assert os.path.basename(metrics.path) == "dragenflow_RUN_shard1of2.prom"
+    with open(metrics.path) as mf:
+        assert 'stage="planning"' in mf.read()
+    metrics.inc("samples", state="planned")
+    # too soon after the last write
+    metrics.write(force=False)
+    with open(metrics.path) as mf:
+        assert "samples" not in mf.read()
+    metrics.stop()
+    with open(metrics.path) as mf:
+        text = mf.read()
+    assert 'stage="submission"' in text and "samples" in text
+    assert os.listdir(str(tmp_path / "prom")) == [os.path.basename(metrics.path)]
+
+
+def test_moved_bytes_of_fastqs_still_to_move(tmp_path):
+    fastq = tmp_path / "S1_R1_001.fastq.gz"
+    fastq.write_bytes(b"\0" * 100)
+    actions = [
+        Action(MKDIR, str(tmp_path / "S1"), ""),
+        Action(MOVE, str(fastq), str(tmp_path / "S1")),
+        Action(MOVE, str(tmp_path / "gone.fastq.gz"), str(tmp_path / "S1")),
+    ]
+    assert moved_bytes(actions) == 100
@@ -0,0 +1,123 @@
+import pytest
+
+from main import available_pipeline, HandleFlow
+from src.dragen_pipeline import ConstructDragenPipeline
+from src.utility.dragen_utility import (
+    run_type,
+    SH_NORMAL,
+    SH_SAMPLE,
+    SH_TUMOR,
+    SHA_NPATH,
+    SHA_NREG,
+    SHA_RTYPE,
+)
+from src.utility.job_monitor import JobMonitor
+from src.utility.normal_registry import normal_record, NormalRegistry
+from src.utility.ref_batch import SubmitJob
+
+
+NORMAL_CMD = {
+    "output-file-prefix": "N1",
+    "fastq-file1": "N1_S1_L001_R1_001.fastq.gz",
+    "fastq-file2": "N1_S1_L001_R2_001.fastq.gz",
+    "RGID": "HW7FTDMXX-1-1",
+    "RGSM": "N1",
+    "enable-cnv": "true",
+}
+
+
+TUMOR_OF_N1 = {SH_TUMOR: "1", SH_NORMAL: "N1"}
+
+
+@pytest.fixture
+def registry(tmp_path, make_row):
+    registry = NormalRegistry(str(tmp_path / "normals.db"))
+    registry.register(normal_record(make_row("N1"), NORMAL_CMD))
+    yield registry
+    registry.close()
+
+
+def test_record_paths_are_absolute(tmp_path, make_row):
+    record = normal_record(make_row("N1"), NORMAL_CMD)
+    assert record["prefix"] == f"{tmp_path}/proj/N1/N1"
+    assert record["alignment"] == f"{tmp_path}/proj/N1/N1.bam"
+    assert record["cnv_counts"] == (
+        f"{tmp_path}/proj/N1/N1.target.counts.gc-corrected.gz"
+    )
+    assert record["fastq"]["fastq-file1"] == (
+        f"{tmp_path}/proj/N1/N1_S1_L001_R1_001.fastq.gz"
+    )
+    assert record["fastq"]["RGID"] == "HW7FTDMXX-1-1"
+
+
+def test_lookup_by_id_and_by_dir(registry, tmp_path):
+    assert registry.lookup("proj", "N1")["prefix"] == f"{tmp_path}/proj/N1/N1"
+    assert registry.lookup("", "", f"{tmp_path}/proj/N1/")["sample_id"] == "N1"
+    assert registry.lookup("proj", "N2") is None
+    assert registry.lookup("other", "N1") is None
+
+
+def test_register_replaces_older_normal(registry, tmp_path, make_row):
+    row = make_row("N1", run="run2")
+    registry.register(normal_record(row, NORMAL_CMD))
+    assert registry.lookup("proj", "N1")["sample_dir"] == f"{tmp_path}/run2/proj/N1"
+    assert registry.lookup("", "", str(tmp_path / "proj" / "N1")) is None
+
+
+def test_run_type_resolves_registered_normal(registry, tmp_path, make_row):
+    excel = [make_row("T1", **TUMOR_OF_N1)]
+    with pytest.raises(RuntimeError):
+        run_type([make_row("T1", **TUMOR_OF_N1)])
+    run_type(excel, registry)
+    assert excel[0][SHA_RTYPE] == "somatic_paired"
+    assert excel[0][SHA_NPATH] == str(tmp_path / "proj" / "N1")
+    assert excel[0][SHA_NREG]["sample_id"] == "N1"
+
+
+def test_normal_in_sheet_wins_over_registry(registry, make_row):
+    excel = [make_row("N1"), make_row("T1", **TUMOR_OF_N1)]
+    run_type(excel, registry)
+    assert excel[1][SHA_RTYPE] == "somatic_paired"
+    assert excel[1][SHA_NPATH] == ""
+    assert excel[1][SHA_NREG] is None
+
+
+def test_normal_params_from_registry_without_replay(registry, tmp_path):
+    record = registry.lookup("proj", "N1")
+    pipeline = ConstructDragenPipeline()
+    pipeline.normals["proj/N1/EXTERNAL"] = record["prefix"]
+    pipeline.save_command("proj/N1/EXTERNAL", record["fastq"])
+    params = pipeline.get_normal_params("proj/N1/EXTERNAL")
+    assert params["fastq-file2"] == f"{tmp_path}/proj/N1/N1_S1_L001_R2_001.fastq.gz"
+    assert params["RGSM"] == "N1"
+
+
+class Scheduler(object):
+    def __init__(self, states):
+        self.states = states
+
+    def status(self, job_ids):
+        return {i: self.states[i] for i in job_ids}
+
+
+def test_normal_registered_when_job_completed(tmp_path, make_row):
+    registry = NormalRegistry(str(tmp_path / "normals.db"))
+    rows = [make_row("N1"), make_row("N2")]
+    jobs = []
+    for data in rows:
+        data[SHA_RTYPE] = "germline"
+        key = f"proj/{data[SH_SAMPLE]}"
+        available_pipeline["dragen_dna"].commands[key] = NORMAL_CMD
+        member = (data, ["cmd"])
+        jobs.append(SubmitJob(data["fastq_dir"], key, key, ["cmd"], [member]))
+    monitor = JobMonitor(Scheduler({"1": "completed", "2": "failed"}))
+    HandleFlow().register_on_completion(monitor, registry, jobs)
+    monitor.track("1", "proj/N1")
+    monitor.track("2", "proj/N2")
+    assert registry.lookup("proj", "N1") is None
+    monitor.wait()
+    assert registry.lookup("proj", "N1")["sample_id"] == "N1"
+    assert registry.lookup("proj", "N2") is None
+    registry.close()
+    for key in ["proj/N1", "proj/N2"]:
+        available_pipeline["dragen_dna"].commands.pop(key)
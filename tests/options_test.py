@@ -0,0 +1,52 @@
+from src.utility.commands import OptionLayers
+
+
+def template():
+    return {"ref-dir": "/ref", "enable-cnv": "false", "fastq-file1": "a.fq"}
+
+
+def test_layers_merge_like_dict_update():
+    tmpl = template()
+    cmd = OptionLayers("template", tmpl)
+    cmd.push("sample", {"fastq-file1": "b.fq", "RGID": "S1"})
+    cmd.push("overrides", {"enable-cnv": "true"})
+    expected = {**tmpl, **{"fastq-file1": "b.fq", "RGID": "S1"}}
+    expected["enable-cnv"] = "true"
+    assert list(cmd.items()) == list(expected.items())
+    assert cmd.source("fastq-file1") == "sample"
+    assert cmd.source("ref-dir") == "template"
+    assert cmd.sources()["enable-cnv"] == "overrides"
+
+
+def test_writes_leave_template_alone():
+    tmpl = template()
+    cmd = OptionLayers("template", tmpl).push("cnv")
+    cmd["enable-cnv"] = "true"
+    del cmd["fastq-file1"]
+    assert tmpl == template()
+    assert "fastq-file1" not in cmd
+    assert cmd.pop("missing", None) is None
+    assert dict(cmd) == {"ref-dir": "/ref", "enable-cnv": "true"}
+    assert cmd.source("enable-cnv") == "cnv"
+
+
+def test_removed_option_set_again_goes_last():
+    cmd = OptionLayers("template", template()).push("pairing")
+    cmd.pop("ref-dir")
+    cmd["ref-dir"] = "/other"
+    assert list(cmd) == ["enable-cnv", "fastq-file1", "ref-dir"]
+    cmd = OptionLayers("template", template()).push("pairing")
+    cmd.pop("ref-dir")
+    cmd.push("pairing", {"ref-dir": "/other"})
+    assert list(cmd) == ["enable-cnv", "fastq-file1", "ref-dir"]
+    assert cmd["ref-dir"] == "/other"
+
+
+def test_taken_over_layers_and_replace_all():
+    part = OptionLayers("template", template()).push("sample", {"RGID": "S1"})
+    cmd = OptionLayers().push("commands", part)
+    assert cmd.source("RGID") == "sample"
+    cmd.replace_all("fastq list", {"ref-dir": "/ref", "fastq-list": "l.csv"})
+    assert list(cmd) == ["ref-dir", "fastq-list"]
+    assert cmd.source("ref-dir") == "template"
+    assert cmd.source("fastq-list") == "fastq list"
@@ -0,0 +1,82 @@
+import os
+
+from src.utility.fs_meta import Action, FsMeta, MKDIR, MOVE, REMOVE, WRITE
+from src.utility.plan import apply_actions, stages, without_rows
+
+
+def planned(tmp_path):
+    (tmp_path / "a.fastq.gz").write_bytes(b"reads")
+    (tmp_path / "old.rc").write_text("0\n")
+    fs = FsMeta()
+    with fs.recording() as actions:
+        fs.mkdir(tmp_path / "sample")
+        fs.mkdir(tmp_path / "sample" / "logs")
+        fs.move(tmp_path / "a.fastq.gz", tmp_path / "sample")
+        fs.remove(tmp_path / "old.rc")
+        fs.write_text(tmp_path / "sample" / "logs" / "cols.json", "{}")
+    return actions
+
+
+def test_stages_make_parents_first():
+    actions = [
+        Action(WRITE, "/r/p/s/logs/a.json", "{}"),
+        Action(MKDIR, "/r/p/s/logs"),
+        Action(MOVE, "/r/p/a.fastq.gz", "/r/p/s"),
+        Action(MKDIR, "/r/p/s"),
+        Action(WRITE, "/r/p/s/logs/a.json", "{1}"),
+        Action(REMOVE, "/r/p/s/logs/a.rc"),
+    ]
+    groups = stages(actions)
+    assert [[i.kind for i in group] for group in groups] == [
+        [MKDIR],
+        [MKDIR],
+        [MOVE],
+        [REMOVE],
+        [WRITE],
+    ]
+    assert groups[0][0].path == "/r/p/s"
+    assert groups[-1][0].arg == "{1}"
+
+
+def test_apply_makes_planned_changes_once(tmp_path):
+    actions = planned(tmp_path)
+    done = apply_actions(actions, workers=4)
+    assert done == {MKDIR: 2, MOVE: 1, REMOVE: 1, WRITE: 1}
+    assert (tmp_path / "sample" / "a.fastq.gz").read_bytes() == b"reads"
+    assert (tmp_path / "sample" / "logs" / "cols.json").read_text() == "{}"
+    assert not (tmp_path / "old.rc").exists()
+    # applying again after a failure only makes what is missing
+    os.remove(tmp_path / "sample" / "logs" / "cols.json")
+    done = apply_actions(actions)
+    assert done == {MKDIR: 0, MOVE: 0, REMOVE: 0, WRITE: 1}
+
+
+def test_changes_of_rows_left_out_not_made(tmp_path):
+    for name in ["a_S1.fastq.gz", "a_S2.fastq.gz", "b_S3.fastq.gz"]:
+        (tmp_path / name).write_bytes(b"reads")
+    rows = [{"fastq_dir": tmp_path / i} for i in ["a", "a", "b"]]
+    fs = FsMeta()
+    with fs.recording() as actions:
+        fs.mkdir(tmp_path / "a")
+        fs.mkdir(tmp_path / "b")
+        for data, name in zip(rows, ["a_S1", "a_S2", "b_S3"]):
+            with fs.owner(id(data)):
+                fs.mkdir(data["fastq_dir"] / "logs", exist_ok=True)
+                fs.move(tmp_path / f"{name}.fastq.gz", data["fastq_dir"])
+    # logs of a made for the first row, needed by the second too
+    assert fs.owners[Action(MKDIR, str(tmp_path / "a" / "logs"))] == {
+        id(rows[0]),
+        id(rows[1]),
+    }
+    kept = without_rows(actions, fs.owners, rows[:1], rows)
+    assert [i.path for i in kept if i.kind == MOVE] == [
+        str(tmp_path / "a_S2.fastq.gz"),
+        str(tmp_path / "b_S3.fastq.gz"),
+    ]
+    assert len(kept) == len(actions) - 1
+    kept = without_rows(actions, fs.owners, rows[2:], rows)
+    assert {i.path for i in actions} - {i.path for i in kept} == {
+        str(tmp_path / "b"),
+        str(tmp_path / "b" / "logs"),
+        str(tmp_path / "b_S3.fastq.gz"),
+    }
@@ -0,0 +1,66 @@
+import json
+import shutil
+
+import pytest
+
+from src.utility.dragen_utility import script_path, template_params
+from src.utility.profile_cache import (
+    cache_path,
+    load_json_profile,
+    load_profile,
+    PROFILES,
+    read_cache,
+    validate_profile,
+    write_cache,
+)
+
+
+@pytest.fixture
+def profile_file(tmp_path):
+    path = tmp_path / "dragen_rna.json"
+    shutil.copy(script_path("dragen_rna.json"), path)
+    return str(path)
+
+
+@pytest.mark.parametrize("name", PROFILES)
+def test_shipped_profiles_are_valid(name):
+    with open(script_path(name)) as jf:
+        validate_profile(json.load(jf), name)
+
+
+def test_invalid_profile_lists_problems():
+    profile = {"adapters": [], "scripts": {}, "rna": {"ref-dir": ["a", "b"]}}
+    with pytest.raises(ValueError) as err:
+        validate_profile(profile, "test.json")
+    message = str(err.value)
+    assert "'ref_parameters' missing" in message
+    assert "'adapters' missing or not a dict" in message
+    assert "'rna.ref-dir' is not a single value" in message
+
+
+def test_cache_matches_json(profile_file):
+    assert read_cache(profile_file) is None
+    write_cache(profile_file)
+    assert read_cache(profile_file) == load_json_profile(profile_file)
+
+
+def test_stale_cache_is_ignored(profile_file):
+    write_cache(profile_file)
+    with open(profile_file) as jf:
+        profile = json.load(jf)
+    profile["rna"]["new-option"] = "true"
+    with open(profile_file, "w") as jf:
+        json.dump(profile, jf)
+    assert read_cache(profile_file) is None
+    # broken cache falls back as well
+    with open(cache_path(profile_file), "wb") as cf:
+        cf.write(b"not a pickle")
+    assert read_cache(profile_file) is None
+
+
+def test_precompiled_template_params():
+    profile = load_profile("dragen_rna.json")
+    options = profile["rna"]
+    expected = [i for i in options if str(options[i]).startswith("{")]
+    assert template_params(profile, "rna") == expected
+    assert template_params({"rna": options}, "rna") == expected
@@ -0,0 +1,57 @@
+import pstats
+import time
+
+from src.utility.profiling import PhaseProfiler
+
+
+def slow_leaf():
+    time.sleep(0.01)
+
+
+def caller_a():
+    slow_leaf()
+
+
+def caller_b():
+    slow_leaf()
+    slow_leaf()
+
+
+def test_phases_written_separately(tmp_path):
+    profiler = PhaseProfiler(str(tmp_path / "prof"), top=3)
+    profiler.start("planning")
+    caller_a()
+    profiler.start("submission")
+    caller_b()
+    lines = profiler.write()
+    assert lines[0].startswith("planning:")
+    assert any(i.startswith("submission:") for i in lines)
+    planning = pstats.Stats(str(tmp_path / "prof" / "planning.pstats"))
+    names = {func[2] for func in planning.stats}
+    assert "caller_a" in names and "caller_b" not in names
+    stacks = (tmp_path / "prof" / "submission.collapsed").read_text()
+    leaf = [i for i in stacks.splitlines() if "caller_b" in i and "sleep" in i]
+    assert leaf and leaf[0].split(";")[0].startswith("caller_b")
+    assert int(leaf[0].rsplit(" ", 1)[1]) >= 15000
+
+
+def test_own_time_split_by_caller(tmp_path):
+    profiler = PhaseProfiler(str(tmp_path))
+    profiler.start("run")
+    caller_a()
+    caller_b()
+    profiler.write()
+    stacks = {}
+    for line in (tmp_path / "run.collapsed").read_text().splitlines():
+        stack, us = line.rsplit(" ", 1)
+        if "sleep" in stack:
+            stacks[stack.split(";")[0].split()[0]] = int(us)
+    assert stacks["caller_b"] > 1.5 * stacks["caller_a"]
+
+
+def test_disabled_without_dir():
+    profiler = PhaseProfiler()
+    profiler.start("planning")
+    caller_a()
+    assert profiler.write() == []
+    assert not profiler.profiles
@@ -0,0 +1,89 @@
+import csv
+
+from src.utility.fs_meta import configure
+from src.utility.qc_metrics import (
+    aggregate_metrics,
+    find_metrics,
+    metric_type,
+    parse_metrics,
+)
+
+MAPPING = (
+    "MAPPING/ALIGNING SUMMARY,,Total input reads,1000,100.00\n"
+    "MAPPING/ALIGNING SUMMARY,,Mapped reads,990,99.00\n"
+    "MAPPING/ALIGNING PER RG,HW7FTDMXX-1-1,Total reads in RG,1000,100.00\n"
+)
+VC = "VARIANT CALLER SUMMARY,,Number of samples,1\n"
+
+
+def read_table(path):
+    with open(path, newline="") as tf:
+        return list(csv.DictReader(tf, delimiter="\t"))
+
+
+def make_sample(make_row, sample, files):
+    data = make_row(sample)
+    sample_dir = data["fastq_dir"]
+    (sample_dir / "logs").mkdir()
+    (sample_dir / "logs" / "dragen.job").write_text(
+        f"dragen --output-directory . --output-file-prefix {sample} --enable-cnv\n"
+    )
+    for name, content in files.items():
+        (sample_dir / f"{sample}.{name}").write_text(content)
+    return data
+
+
+def test_metric_type():
+    assert metric_type("S1.mapping_metrics.csv", "S1") == "mapping"
+    assert metric_type("S1.tn.vc_metrics.csv", "S1") is None
+    assert metric_type("S1.tn.vc_metrics.csv", "S1.tn") == "vc"
+    assert metric_type("S10.mapping_metrics.csv", "S1") is None
+    assert metric_type("S1-replay.json", "S1") is None
+
+
+def test_parse_metrics(tmp_path):
+    path = tmp_path / "S1.mapping_metrics.csv"
+    path.write_text(MAPPING)
+    assert parse_metrics(str(path)) == {
+        "MAPPING/ALIGNING SUMMARY:Total input reads": "1000",
+        "MAPPING/ALIGNING SUMMARY:Total input reads %": "100.00",
+        "MAPPING/ALIGNING SUMMARY:Mapped reads": "990",
+        "MAPPING/ALIGNING SUMMARY:Mapped reads %": "99.00",
+    }
+
+
+def test_find_metrics_through_prefixes(make_row):
+    row = make_sample(
+        make_row,
+        "S1",
+        {"mapping_metrics.csv": MAPPING, "vc_metrics.csv": VC, "bam": ""},
+    )
+    found = find_metrics([row])
+    assert sorted(i[0] for i in found.values()) == ["mapping", "vc"]
+    assert {i[1] for i in found.values()} == {"proj/S1"}
+
+
+def test_incremental_aggregation(tmp_path, make_row):
+    out_dir = tmp_path / "qc"
+    s1 = make_sample(make_row, "S1", {"mapping_metrics.csv": MAPPING})
+    found = find_metrics([s1])
+    assert aggregate_metrics(found, str(out_dir), workers=2) == {"mapping": 1}
+    # nothing new, nothing parsed
+    assert aggregate_metrics(found, str(out_dir), workers=2) == {}
+    # new sample with same columns is appended
+    s2 = make_sample(make_row, "S2", {"mapping_metrics.csv": MAPPING})
+    # new invocation, directory listings read again
+    configure()
+    found = find_metrics([s1, s2])
+    assert aggregate_metrics(found, str(out_dir), workers=2) == {"mapping": 1}
+    rows = read_table(out_dir / "mapping.tsv")
+    assert [i["sample"] for i in rows] == ["proj/S1", "proj/S2"]
+    assert rows[1]["MAPPING/ALIGNING SUMMARY:Mapped reads"] == "990"
+    # rerun sample with an extra metric replaces its row and adds column
+    metrics = s1["fastq_dir"] / "S1.mapping_metrics.csv"
+    metrics.write_text(MAPPING + "MAPPING/ALIGNING SUMMARY,,Q30 bases,5,50.00\n")
+    assert aggregate_metrics(found, str(out_dir), workers=2) == {"mapping": 1}
+    rows = read_table(out_dir / "mapping.tsv")
+    assert [i["sample"] for i in rows] == ["proj/S2", "proj/S1"]
+    assert rows[0]["MAPPING/ALIGNING SUMMARY:Q30 bases"] == ""
+    assert rows[1]["MAPPING/ALIGNING SUMMARY:Q30 bases"] == "5"
@@ -0,0 +1,102 @@
+import subprocess
+
+from src.utility.dragen_utility import SH_PARAM, SH_SAMPLE, srun_cli
+from src.utility.job_monitor import COMPLETED, FAILED, JobMonitor, LocalScheduler
+from src.utility.ref_batch import (
+    batch_key,
+    job_script,
+    jobfile_path,
+    plan_jobs,
+    prepare_job,
+    status_path,
+)
+
+
+def dragen(sample, ref="/ref/hg38", extra=""):
+    script = f"dragen --ref-dir {ref} --output-file-prefix {sample}{extra}"
+    return srun_cli(f"dragen-{sample}", script)
+
+
+def test_batch_key_needs_one_ref_dir():
+    assert job_script(dragen("S1")).startswith("dragen --ref-dir")
+    assert batch_key([dragen("S1")]) == "/ref/hg38"
+    assert batch_key([dragen("S1"), dragen("S1", "/ref/other")]) is None
+    assert batch_key(["srun.py -n S1 -c 'dragen --version'"]) is None
+    assert batch_key(["echo S1"]) is None
+
+
+def test_rows_grouped_by_ref_dir_and_pipeline(tmp_path, make_row):
+    rows = [
+        (make_row("S1"), [dragen("S1")]),
+        (make_row("R1", **{SH_PARAM: "rna"}), [dragen("R1")]),
+        (make_row("S2"), [dragen("S2", "/ref/mm10")]),
+        (make_row("S3"), [dragen("S3")]),
+        (make_row("S4"), [dragen("S4")]),
+        (make_row("S5"), [dragen("S5")]),
+    ]
+    jobs = plan_jobs(rows, 2)
+    members = [[i[SH_SAMPLE] for i, _ in job.members] for job in jobs]
+    assert members == [["S1", "S3"], ["R1"], ["S2"], ["S4", "S5"]]
+    assert [job.batched for job in jobs] == [True, False, False, True]
+    # rows left alone keep their own command and dir
+    assert jobs[1].commands == rows[1][1]
+    assert jobs[1].wd_path == str(tmp_path / "proj" / "R1")
+    assert jobs[0].wd_path == str(tmp_path / "dragen_batches")
+    assert [len(job.members) for job in plan_jobs(rows)] == [1] * 6
+
+
+def test_batch_runs_rows_in_their_dirs(tmp_path, make_row):
+    ok = make_row("S1")
+    bad = make_row("S2")
+    later = make_row("S3")
+    rows = [
+        (ok, [dragen("S1")]),
+        (bad, [dragen("S2", extra="\nfalse"), dragen("S2", extra="\ntouch step2")]),
+        (later, [dragen("S3")]),
+    ]
+    (job,) = plan_jobs(rows, 3)
+    bad_logs = bad["fastq_dir"] / "logs"
+    bad_logs.mkdir()
+    (bad_logs / "S2_S1_L1_batch.rc").write_text("0\n")
+    prepare_job(job)
+    assert "--output-file-prefix S2" in open(jobfile_path(bad)).read()
+    script = job_script(job.commands[0])
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    (bin_dir / "dragen").write_text("#!/bin/sh\ntouch ran\n")
+    (bin_dir / "dragen").chmod(0o755)
+    env = {"PATH": f"{bin_dir}:/usr/bin:/bin"}
+    output = subprocess.run(["sh", "-c", script], cwd=job.wd_path, env=env)
+    assert output.returncode == 1
+    assert (ok["fastq_dir"] / "ran").exists()
+    assert (later["fastq_dir"] / "ran").exists()
+    # second command of failed row is not run
+    assert not (bad["fastq_dir"] / "step2").exists()
+    assert open(status_path(ok)).read() == "0\n"
+    assert open(status_path(bad)).read() == "1\n"
+
+
+def test_monitor_reports_each_row_of_batch(make_row):
+    ok = make_row("S1")
+    bad = make_row("S2")
+    missing = make_row("S3")
+    for row, status in [(ok, "0"), (bad, "1")]:
+        (row["fastq_dir"] / "logs").mkdir()
+        with open(status_path(row), "w") as sf:
+            sf.write(f"{status}\n")
+    scheduler = LocalScheduler()
+    monitor = JobMonitor(scheduler, min_interval=0.01)
+    seen = []
+    for state in [COMPLETED, FAILED]:
+        monitor.on(state, lambda event: seen.append((event.sample, event.state)))
+    members = [
+        {"sample": f"proj/{row[SH_SAMPLE]}", "status_file": status_path(row)}
+        for row in [ok, bad, missing]
+    ]
+    monitor.track(scheduler.submit("exit 1"), "batch1", members=members)
+    monitor.wait(timeout=5)
+    assert seen == [
+        ("proj/S1", COMPLETED),
+        ("proj/S2", FAILED),
+        ("proj/S3", FAILED),
+    ]
@@ -0,0 +1,59 @@
+from src.utility.dragen_utility import srun_cli
+from src.utility.ref_paths import check_reference, check_references, reference_paths
+
+
+def submission(make_row, sample, options):
+    data = make_row(sample)
+    script = f"dragen --output-file-prefix {sample} {options}"
+    return data, [srun_cli(f"dragen-{sample}", script)]
+
+
+def test_reference_paths_distinct(make_row):
+    rows = [
+        submission(make_row, "S1", "--ref-dir /ref --qc-coverage-region-1 /t.bed"),
+        submission(make_row, "S2", "--ref-dir /ref --cnv-normals-list /pon.txt"),
+    ]
+    assert reference_paths(rows) == {
+        ("/ref", "dir"): ["proj/S1", "proj/S2"],
+        ("/t.bed", "file"): ["proj/S1"],
+        ("/pon.txt", "file"): ["proj/S2"],
+    }
+
+
+def test_check_reference(tmp_path):
+    bed = tmp_path / "t.bed"
+    bed.write_text("chr1\t1\t100\n")
+    empty = tmp_path / "empty.bed"
+    empty.write_text("")
+    assert check_reference(str(tmp_path), "dir") == ""
+    assert check_reference(str(bed), "file") == ""
+    assert check_reference(str(bed), "dir").endswith("not a directory")
+    assert check_reference(str(tmp_path), "file").endswith("not a file")
+    assert check_reference(str(empty), "file") == f"{empty}: empty file"
+    assert "No such file" in check_reference(str(tmp_path / "x.bed"), "file")
+    assert check_reference("bed file path", "file").endswith("not an absolute path")
+
+
+def test_problems_by_sample(tmp_path, make_row):
+    missing = tmp_path / "missing.txt"
+    pon = f"--cnv-normals-list {missing}"
+    rows = [
+        submission(make_row, "S1", f"--ref-dir {tmp_path}"),
+        submission(make_row, "S2", f"--ref-dir {tmp_path} {pon}"),
+        submission(make_row, "S3", pon),
+    ]
+    problems = check_references(rows, workers=2)
+    assert sorted(problems) == ["proj/S2", "proj/S3"]
+    assert problems["proj/S2"][0].startswith(str(missing))
+    assert check_references(rows[:1]) == {}
+
+
+def test_panel_made_by_plan_checked_at_its_source(tmp_path, make_row):
+    panel = tmp_path / "pon.txt"
+    sample_panel = str(tmp_path / "proj" / "T1" / "logs" / "cnv_pon.txt")
+    rows = [submission(make_row, "T1", f"--cnv-normals-list {sample_panel}")]
+    assert check_references(rows, {sample_panel: str(panel)}) == {
+        "proj/T1": [f"{panel}: No such file or directory"]
+    }
+    panel.write_text("/normals/N1.target.counts.gc-corrected.gz\n")
+    assert check_references(rows, {sample_panel: str(panel)}) == {}
@@ -0,0 +1,30 @@
+from src.utility.dragen_utility import render_groups, SH_NORMAL, SHA_NPATH
+
+EXTERNAL_N1 = {SH_NORMAL: "N1", SHA_NPATH: "old/N1"}
+
+
+def test_independent_rows_get_own_groups(make_row):
+    excel = [make_row("S1"), make_row("S2"), make_row("S3", "other")]
+    assert render_groups(excel, [0, 1, 2]) == [[0], [1], [2]]
+
+
+def test_rows_of_same_sample_stay_in_order(make_row):
+    excel = [make_row("S1"), make_row("S2"), make_row("S1")]
+    assert render_groups(excel, [0, 1, 2]) == [[0, 2], [1]]
+
+
+def test_tumors_with_external_normal_share_group(make_row):
+    excel = [
+        make_row("T1", **EXTERNAL_N1),
+        make_row("T2"),
+        make_row("T3", **EXTERNAL_N1),
+    ]
+    assert render_groups(excel, [0, 1, 2]) == [[0, 2], [1]]
+    # normal found in sheet is constructed in earlier phase
+    excel = [make_row("T1", **{SH_NORMAL: "N1"}), make_row("T3", **{SH_NORMAL: "N1"})]
+    assert render_groups(excel, [0, 1]) == [[0], [1]]
+
+
+def test_only_given_indices_are_grouped(make_row):
+    excel = [make_row("S1"), make_row("S1"), make_row("S2")]
+    assert render_groups(excel, [1, 2]) == [[1], [2]]
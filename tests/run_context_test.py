@@ -0,0 +1,98 @@
+import pytest
+
+from src.dragen_commands import BaseDragenCommand
+from src.utility.dragen_utility import get_flow_cell, merge_lanes, SH_PARAM, SH_TARGET
+from src.utility.fs_meta import fs
+from src.utility.run_context import run_context
+
+RUN = "210317_A00464_0300_BHW7FTDMXX"
+RUN_INFO = """<?xml version="1.0"?>
+<RunInfo Version="5">
+  <Run Id="{run}" Number="300">
+    <Flowcell>HW7FTDMXX</Flowcell>
+    <Instrument>A00464</Instrument>
+    <Reads>
+      <Read Number="1" NumCycles="151" IsIndexedRead="N" />
+      <Read Number="2" NumCycles="8" IsIndexedRead="Y" />
+      <Read Number="3" NumCycles="9" IsIndexedRead="N" />
+      <Read Number="4" NumCycles="151" IsIndexedRead="N" />
+    </Reads>
+    <FlowcellLayout LaneCount="2" SurfaceCount="2" />
+  </Run>
+</RunInfo>
+"""
+RUN_PARAMETERS = """<?xml version="1.0"?>
+<RunParameters>
+  <RfidsInfo><FlowCellMode>S4</FlowCellMode></RfidsInfo>
+</RunParameters>
+"""
+SHEET = "[Header],\nDate,1.1.2021\n[Reads],\n151\n151\n[Data],\nLane,Sample_ID\n"
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    run_context.cache_clear()
+
+
+def write_sheet(path):
+    path.parent.mkdir(parents=True)
+    path.write_text(SHEET)
+    return str(path)
+
+
+def test_run_info_and_parameters(tmp_path):
+    run_dir = tmp_path / RUN
+    sheet = write_sheet(run_dir / "Data" / "Intensities" / "sheet.csv")
+    (run_dir / "RunInfo.xml").write_text(RUN_INFO.format(run=RUN))
+    (run_dir / "RunParameters.xml").write_text(RUN_PARAMETERS)
+    context = run_context(sheet)
+    assert context.run_dir == str(run_dir)
+    assert context.flowcell == "HW7FTDMXX" == get_flow_cell(sheet)
+    assert context.instrument == "A00464"
+    assert context.lane_count == 2
+    assert context.read_lengths == [151, 9, 151]
+    assert context.umi_read == 2
+    assert context.parameters["FlowCellMode"] == "S4"
+    assert context.header == {"Date": "1.1.2021"}
+    assert run_context(sheet) is context
+
+
+def test_run_folder_name_without_run_info(tmp_path):
+    sheet = write_sheet(tmp_path / RUN / "sheet.csv")
+    context = run_context(sheet)
+    assert (context.flowcell, context.instrument) == ("BHW7FTDMXX", "A00464")
+    assert context.read_lengths == [151, 151]
+    assert context.umi_read is None
+    # sheets of other layouts keep the flowcell of the dir above their dir
+    sheet = write_sheet(tmp_path / "x_FC1" / "sheets" / "sheet.csv")
+    assert run_context(sheet).flowcell == "FC1"
+
+
+def test_lane_not_on_flowcell(tmp_path, make_row):
+    run_dir = tmp_path / RUN
+    write_sheet(run_dir / "sheet.csv")
+    (run_dir / "RunInfo.xml").write_text(RUN_INFO.format(run=RUN))
+    row = make_row(run=RUN, Lane="3")
+    with pytest.raises(ValueError):
+        merge_lanes([row])
+
+
+def test_umi_read_moved_with_its_mates(tmp_path, make_row):
+    run_dir = tmp_path / RUN
+    write_sheet(run_dir / "sheet.csv")
+    # umi is the third fastq read here
+    run_info = RUN_INFO.format(run=RUN)
+    run_info = run_info.replace('"3" NumCycles="9"', '"3" NumCycles="151"')
+    run_info = run_info.replace('"4" NumCycles="151"', '"4" NumCycles="9"')
+    (run_dir / "RunInfo.xml").write_text(run_info)
+    row = make_row(run=RUN, dry_run=False, **{SH_PARAM: "umi", SH_TARGET: "/t.bed"})
+    sample_dir = row["fastq_dir"]
+    for read_n in [1, 2, 3]:
+        (run_dir / "proj" / f"S1_S1_L001_R{read_n}_001.fastq.gz").write_bytes(b"")
+    fs.invalidate()
+    command = BaseDragenCommand(row, {}, "umi_normal_pipeline")
+    command.set_umi_fastq(row)
+    assert command.arg_registry["umi-fastq"] == "S1_S1_L001_R3_001.fastq.gz"
+    assert command.arg_registry["fastq-file2"] == "S1_S1_L001_R2_001.fastq.gz"
+    for read_n in [1, 2, 3]:
+        assert (sample_dir / f"S1_S1_L001_R{read_n}_001.fastq.gz").is_file()
@@ -0,0 +1,45 @@
+import copy
+import pickle
+
+import pytest
+
+from src.utility.dragen_utility import set_fileprefix, SHA_RTYPE
+from src.utility.sample import Sample, to_samples
+
+
+@pytest.fixture
+def excel_dict(make_row):
+    data = make_row(
+        "testsample",
+        "testproject",
+        SampleID="testsample",
+        Customer="testclient",
+        FIMM_batchID="test",
+        pipeline="dragen",
+    )
+    # row as read from the sheet, before its run type is known
+    del data[SHA_RTYPE]
+    return data
+
+
+def test_sample_mapping(excel_dict):
+    sample = Sample(excel_dict)
+    assert dict(sample) == excel_dict
+    assert sample.get(SHA_RTYPE) is None
+    sample[SHA_RTYPE] = "germline"
+    assert sample[SHA_RTYPE] == "germline"
+    assert SHA_RTYPE in sample
+    del sample[SHA_RTYPE]
+    with pytest.raises(KeyError):
+        sample[SHA_RTYPE]
+    assert set_fileprefix(sample) == "testsample"
+    assert copy.copy(sample) == sample
+    assert pickle.loads(pickle.dumps(sample)) == sample
+
+
+def test_to_samples(excel_dict):
+    sample = to_samples([excel_dict], keep=["Customer"])[0]
+    assert sample["Customer"] == "testclient"
+    assert "FIMM_batchID" not in sample
+    assert len(sample) == len(excel_dict) - 1
+    assert not hasattr(sample, "__dict__")
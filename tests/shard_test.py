@@ -0,0 +1,30 @@
+import pytest
+
+from src.utility.dragen_utility import SH_NORMAL, SH_SAMPLE, SHA_RTYPE
+from src.utility.shard import parse_shard, shard_rows
+
+
+def test_parse_shard():
+    assert parse_shard("2/4") == (2, 4)
+    for value in ["0/4", "5/4", "1", "a/b"]:
+        with pytest.raises(ValueError):
+            parse_shard(value)
+
+
+def test_shards_split_sheet_and_keep_pairs(make_row):
+    sheet = [make_row(f"N{i}") for i in range(20)]
+    for i in range(20):
+        sheet.append(
+            make_row(f"T{i}", **{SH_NORMAL: f"N{i}", SHA_RTYPE: "somatic_paired"})
+        )
+    sheet.append(make_row("N0"))
+    shards = [shard_rows(sheet, i, 3) for i in [1, 2, 3]]
+    assert sorted(id(r) for s in shards for r in s) == sorted(id(r) for r in sheet)
+    assert all(shards)
+    for rows in shards:
+        samples = {r[SH_SAMPLE] for r in rows}
+        for r in rows:
+            assert not r[SH_NORMAL] or r[SH_NORMAL] in samples
+        # sheet order is kept
+        assert rows == [r for r in sheet if r in rows]
+    assert shard_rows(sheet, 1, 1) == sheet
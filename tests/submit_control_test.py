@@ -0,0 +1,85 @@
+from src.utility.flow import JobResult
+from src.utility.submit_control import SubmitController, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def result(returncode, timed_out=False):
+    return JobResult(returncode, "a.out", "a.err", timed_out, "proj/S1", "srun.py")
+
+
+def results(*codes):
+    codes = list(codes)
+    calls = []
+
+    def execute():
+        calls.append(1)
+        return result(codes.pop(0))
+
+    return execute, calls
+
+
+def test_token_bucket_limits_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, burst=2, clock=clock, sleep=clock.sleep)
+    waits = [bucket.acquire() for _ in range(4)]
+    assert waits == [0.0, 0.0, 0.5, 0.5]
+    assert clock.now == 1.0
+
+
+def test_token_bucket_without_limit():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=0, clock=clock, sleep=clock.sleep)
+    assert [bucket.acquire() for _ in range(10)] == [0.0] * 10
+
+
+def test_retryable_code_retried_with_backoff():
+    clock = FakeClock()
+    control = SubmitController(
+        retries=3, base_delay=1, sleep=clock.sleep, jitter=lambda a, b: b
+    )
+    execute, calls = results(75, 75, 0)
+    assert control.submit(execute).returncode == 0
+    assert len(calls) == 3
+    assert clock.slept == [1, 2]
+    assert control.report() == []
+
+
+def test_backoff_capped_and_reported():
+    clock = FakeClock()
+    control = SubmitController(
+        retries=4,
+        base_delay=10,
+        max_delay=25,
+        sleep=clock.sleep,
+        jitter=lambda a, b: b,
+    )
+    execute, calls = results(75, 75, 75, 75, 75)
+    assert control.submit(execute, "proj/S1").returncode == 75
+    assert clock.slept == [10, 20, 25, 25]
+    assert control.report() == [
+        "Not submitted proj/S1: return code 75 (retryable, gave up after 5 "
+        "attempts), see a.err"
+    ]
+
+
+def test_fatal_and_timeout_not_retried():
+    clock = FakeClock()
+    control = SubmitController(sleep=clock.sleep)
+    execute, calls = results(2)
+    control.submit(execute, "proj/S1")
+    assert len(calls) == 1
+    control.submit(lambda: result(-9, timed_out=True), "proj/S2")
+    assert clock.slept == []
+    assert [i[2] for i in control.failed] == ["fatal", "timed out"]